@@ -0,0 +1,201 @@
+"""
+Push-доставка уведомлений: один LISTEN на процесс и SSE-поток для тысяч клиентов.
+
+Запуск: DATABASE_URL=... python fanout.py [host] [port]
+Клиент подключается к GET /?user_id=N и получает события notification
+с last_id, после чего забирает новые записи через GET ?user_id=N&since=last_id.
+Событие resync приходит после переподключения к базе: клиент перечитывает
+уведомления от своего последнего last_id.
+"""
+import asyncio
+import json
+import os
+import sys
+import psycopg2
+import psycopg2.extensions
+from urllib.parse import urlsplit, parse_qs
+
+NOTIFY_CHANNEL = 'notifications_new'
+HEARTBEAT_INTERVAL = 15
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
+SSE_HEADERS = (
+    'HTTP/1.1 200 OK\r\n'
+    'Content-Type: text/event-stream\r\n'
+    'Cache-Control: no-cache\r\n'
+    'Connection: keep-alive\r\n'
+    'Access-Control-Allow-Origin: *\r\n'
+    '\r\n'
+)
+
+
+def log_event(payload: dict) -> None:
+    print(json.dumps(payload, ensure_ascii=False), flush=True)
+
+
+class NotificationHub:
+    '''Держит единственное LISTEN-соединение и раздаёт NOTIFY подписчикам по user_id.
+
+    Оборванное соединение переоткрывается с экспоненциальной паузой и заново подписывается
+    на канал. NOTIFY за время обрыва потеряны, поэтому после переподключения каждый
+    подписчик получает None: клиенту нужно перечитать уведомления по since.
+    '''
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._conn = None
+        self._fd = None
+        self._subscribers = {}
+        self._reconnecting = None
+        self._watchdog = None
+
+    async def start(self) -> None:
+        try:
+            self._connect()
+        except psycopg2.Error as e:
+            self._drop(e)
+        self._watchdog = asyncio.create_task(self._watch())
+
+    def close(self) -> None:
+        for task in (self._watchdog, self._reconnecting):
+            if task is not None:
+                task.cancel()
+        if self._conn is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._conn.close()
+            self._conn = None
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def _connect(self) -> None:
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN {NOTIFY_CHANNEL}')
+        # Дескриптор запоминаем: у закрытого после обрыва соединения fileno() уже недоступен
+        self._conn, self._fd = conn, conn.fileno()
+        asyncio.get_running_loop().add_reader(self._fd, self._on_readable)
+
+    def _drop(self, error: Exception) -> None:
+        '''Закрывает сломанное соединение и запускает переподключение, если оно ещё не идёт'''
+        log_event({'event': 'listener_disconnected', 'error': str(error).strip()})
+        if self._conn is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._conn.close()
+            self._conn = None
+        if self._reconnecting is None or self._reconnecting.done():
+            self._reconnecting = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        backoff = RECONNECT_MIN_DELAY
+        while self._conn is None:
+            await asyncio.sleep(backoff)
+            try:
+                self._connect()
+            except psycopg2.Error as e:
+                backoff = min(backoff * 2, RECONNECT_MAX_DELAY)
+                log_event({'event': 'listener_reconnect_failed', 'error': str(e).strip(), 'retry_in': backoff})
+        log_event({'event': 'listener_reconnected'})
+        for queues in self._subscribers.values():
+            for queue in queues:
+                queue.put_nowait(None)
+
+    async def _watch(self) -> None:
+        '''Раз в HEARTBEAT_INTERVAL проверяет соединение: обрыв без FIN сам по себе не разбудит add_reader'''
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if self._conn is None:
+                continue
+            try:
+                with self._conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+            except psycopg2.Error as e:
+                self._drop(e)
+            else:
+                self._dispatch()
+
+    def _on_readable(self) -> None:
+        try:
+            self._conn.poll()
+        except psycopg2.Error as e:
+            self._drop(e)
+            return
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            user_id, _, last_id = notify.payload.partition(':')
+            for queue in self._subscribers.get(user_id, ()):
+                queue.put_nowait(int(last_id))
+
+
+async def handle_client(hub: NotificationHub, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    '''Обслуживает одно SSE-подключение: события при NOTIFY и комментарии-heartbeat в паузах'''
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+
+        parts = request_line.decode('latin-1').split()
+        params = parse_qs(urlsplit(parts[1]).query) if len(parts) >= 2 else {}
+        user_id = (params.get('user_id') or [''])[0]
+
+        # isdigit() пропустил бы «²», на котором int() падает; isdecimal() — только то, что int() разберёт
+        if not parts or parts[0] != 'GET' or not user_id.isdecimal():
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            await writer.drain()
+            return
+        # NOTIFY приходит как «7:…», поэтому «007» подписывается под каноническим «7»
+        user_id = str(int(user_id))
+
+        queue = hub.subscribe(user_id)
+        try:
+            writer.write(SSE_HEADERS.encode())
+            await writer.drain()
+            while True:
+                try:
+                    last_id = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                else:
+                    if last_id is None:
+                        data = json.dumps({'user_id': int(user_id)})
+                        writer.write(f'event: resync\ndata: {data}\n\n'.encode())
+                    else:
+                        data = json.dumps({'user_id': int(user_id), 'last_id': last_id})
+                        writer.write(f'event: notification\ndata: {data}\n\n'.encode())
+                await writer.drain()
+        finally:
+            hub.unsubscribe(user_id, queue)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int) -> None:
+    hub = NotificationHub(os.environ.get('DATABASE_URL'))
+    await hub.start()
+    server = await asyncio.start_server(lambda r, w: handle_client(hub, r, w), host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        hub.close()
+
+
+if __name__ == '__main__':
+    host = sys.argv[1] if len(sys.argv) > 1 else '0.0.0.0'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8081
+    asyncio.run(serve(host, port))
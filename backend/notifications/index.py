@@ -1,46 +1,614 @@
+import hashlib
 import json
 import os
-import psycopg2.extras
+import random
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 
-def handler(event: dict, context) -> dict:
-    '''API для управления уведомлениями пользователей'''
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '5'))
+CONNECTION_MAX_AGE = 300
+IDLE_CHECK_INTERVAL = 30
+# Сколько запрос ждёт свободное соединение, прежде чем ответить 503
+POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '10'))
+# Подготовленные запросы живут в сессии, поэтому их отключают за пулером в режиме транзакций
+PREPARED_STATEMENTS = os.environ.get('PREPARED_STATEMENTS', '1') == '1'
+
+FUNCTION_NAME = 'notifications'
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '500'))
+EXPLAIN_SAMPLE_RATE = float(os.environ.get('EXPLAIN_SAMPLE_RATE', '0'))
+NULL_PHASE = nullcontext()
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+# id в таблицах — SERIAL (INTEGER): большее число уронило бы приведение %s::int[]
+MAX_ID = 2147483647
+
+FANOUT_CHUNK_SIZE = 5000
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Условия выборки получателей для рассылки по сегменту; %s — необязательный параметр сегмента
+RECIPIENT_SEGMENTS = {
+    'all': ('TRUE', False),
+    'verified_sellers': ('u.verified = TRUE', False),
+    'category_sellers': ('EXISTS (SELECT 1 FROM products p WHERE p.seller_id = u.id AND p.category = %s)', True)
+}
+
+NOTIFY_CHANNEL = 'notifications_new'
+LONG_POLL_MAX_WAIT = 25
+LISTEN_HEALTH_INTERVAL = 30
+LISTEN_RECONNECT_MIN = 0.5
+LISTEN_RECONNECT_MAX = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+_metrics = ContextVar('metrics', default=None)
+_listener = None
+_listener_lock = threading.Lock()
+
+
+# ---- Общие блоки функций: начало ----
+# Функции деплоятся по отдельности, поэтому всё до конца области скопировано в их index.py;
+# tests/test_shared_blocks.py сверяет копии, правьте их вместе.
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    '''Соединение пула, которое само хранит время создания, последнего использования
+    и имена подготовленных на нём запросов: они живут и закрываются вместе с соединением
+    '''
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.born = self.last_used = time.monotonic()
+        self.prepared = set()
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    '''Пул, который ждёт освободившееся соединение вместо PoolError и не закрывает возвращённые.
+    
+    Соединения открываются лениво, но остаются открытыми, пока их не больше maxconn,
+    поэтому после всплеска нагрузки тёплый экземпляр держит весь пул.
+    '''
+    
+    def __init__(self, maxconn: int, timeout: float, *args, **kwargs):
+        super().__init__(1, maxconn, *args, **kwargs)
+        self.minconn = maxconn
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+    
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError('connection pool exhausted')
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+def get_pool():
+    '''Лениво создаёт пул соединений, переживающий тёплые вызовы функции'''
+    global _pool
+    pool = _pool
+    if pool is None or pool.closed:
+        # Параллельные первые запросы иначе создали бы по своему пулу и вернули соединение не в тот
+        with _pool_lock:
+            if _pool is None or _pool.closed:
+                cursor_factory = TimedCursor if INSTRUMENTATION_ENABLED else None
+                _pool = BlockingConnectionPool(POOL_MAX_SIZE, POOL_WAIT_TIMEOUT, os.environ.get('DATABASE_URL'),
+                                               connection_factory=PooledConnection, cursor_factory=cursor_factory)
+            pool = _pool
+    return pool
+
+
+def get_connection():
+    '''Берёт соединение из пула, заменяя закрытые, устаревшие и оборванные'''
+    pool = get_pool()
+    for _ in range(POOL_MAX_SIZE + 1):
+        conn = pool.getconn()
+        now = time.monotonic()
+        if not conn.closed and now - conn.born < CONNECTION_MAX_AGE:
+            if now - conn.last_used < IDLE_CHECK_INTERVAL:
+                return conn
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+                return conn
+            except psycopg2.Error:
+                pass
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+
+def release_connection(conn) -> None:
+    '''Возвращает соединение в пул, откатывая незавершённую транзакцию'''
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if not broken:
+        conn.last_used = time.monotonic()
+    get_pool().putconn(conn, close=broken)
+
+
+def execute_prepared(cur, name: str, query: str, args: tuple) -> None:
+    '''Выполняет горячий запрос через PREPARE/EXECUTE: план строится один раз на соединение пула
+    и переиспользуется тёплыми вызовами. Запрос пишется с %s, как для cur.execute.
+    '''
+    if not PREPARED_STATEMENTS:
+        cur.execute(query, args)
+        return
+    prepared = cur.connection.prepared
+    if name not in prepared:
+        cur.execute(f'PREPARE {name} AS ' + query % tuple(f'${i}' for i in range(1, len(args) + 1)))
+        prepared.add(name)
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+
+
+def is_id(value) -> bool:
+    '''Целый id из JSON-тела; bool — подкласс int, поэтому true/false отсекаются явно'''
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= MAX_ID
+
+
+def get_idempotency_key(event: dict):
+    '''Значение заголовка Idempotency-Key без учёта регистра имени; None, если клиент его не прислал'''
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            return value.strip()
+    return None
+
+
+class RequestMetrics:
+    '''Тайминги фаз (connect, query, serialize), число строк и размер ответа одного запроса'''
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.rows = 0
+    
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+    
+    def finish(self, event: dict, context, response: dict) -> dict:
+        total = time.perf_counter() - self.started
+        body = response.get('body') or ''
+        timing = ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items())
+        response['headers'] = dict(response.get('headers') or {})
+        response['headers']['Server-Timing'] = f'{timing}, total;dur={total * 1000:.1f}'.lstrip(', ')
+        response['headers']['Timing-Allow-Origin'] = '*'
+        log_event({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'duration_ms': round(total * 1000, 2),
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+            'rows': self.rows,
+            'bytes': len(body.encode('utf-8'))
+        })
+        return response
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    '''Курсор, записывающий время запросов в метрики и логирующий медленные запросы'''
+    
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics = _metrics.get()
+            if metrics is not None:
+                metrics.add('query', elapsed)
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                log_slow_query(self, query, vars, elapsed)
+
+
+def log_event(payload: dict) -> None:
+    print(json.dumps(payload, ensure_ascii=False, default=str), flush=True)
+
+
+def log_slow_query(cur, query, vars, elapsed: float) -> None:
+    '''Логирует медленный запрос и с вероятностью EXPLAIN_SAMPLE_RATE прикладывает его план'''
+    payload = {
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'duration_ms': round(elapsed * 1000, 2),
+        'query': ' '.join(str(query).split())[:1000]
+    }
+    conn = cur.connection
+    status = conn.info.transaction_status
+    # PREPARE, CREATE TEMP TABLE и другие служебные команды EXPLAIN не принимает
+    statement = (str(query).split(None, 1) or [''])[0].upper()
+    if (random.random() < EXPLAIN_SAMPLE_RATE and cur.name is None
+            and statement in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'EXECUTE')
+            and status != psycopg2.extensions.TRANSACTION_STATUS_INERROR):
+        # EXPLAIN идёт в транзакции запроса: точка сохранения не даёт его ошибке оборвать транзакцию
+        savepoint = status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as explain_cur:
+            if savepoint:
+                explain_cur.execute('SAVEPOINT explain_sample')
+            try:
+                explain_cur.execute('EXPLAIN (FORMAT JSON) ' + str(query), vars)
+                payload['plan'] = explain_cur.fetchone()[0]
+            except psycopg2.Error as e:
+                payload['explain_error'] = str(e)
+                if savepoint:
+                    explain_cur.execute('ROLLBACK TO SAVEPOINT explain_sample')
+            if savepoint:
+                explain_cur.execute('RELEASE SAVEPOINT explain_sample')
+    log_event(payload)
+
+
+def measure(phase: str):
+    '''Контекст замера фазы; при выключенной инструментации — пустой контекст'''
+    metrics = _metrics.get()
+    return metrics.phase(phase) if metrics is not None else NULL_PHASE
+
+
+def record_rows(count: int) -> None:
+    '''Добавляет к метрикам число строк, попавших в ответ'''
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.rows += count
+
+
+def internal_error(context) -> dict:
+    '''Логирует необработанное исключение и отвечает 500 без внутренних деталей'''
+    import traceback
+    
+    request_id = getattr(context, 'request_id', None)
+    log_event({
+        'event': 'error',
+        'function': FUNCTION_NAME,
+        'request_id': request_id,
+        'traceback': traceback.format_exc()
+    })
+    return {
+        'statusCode': 500,
+        'headers': JSON_HEADERS,
+        'body': json.dumps({'error': 'Internal server error', 'request_id': request_id})
+    }
+
+
+# ---- Общие блоки функций: конец ----
+
+
+class NotificationListener:
+    '''Одно LISTEN-соединение на экземпляр функции, вне пула.
+    
+    Долгие опросы ждут NOTIFY на threading.Event, вернув соединение пула, поэтому
+    25-секундное ожидание не занимает соединение, нужное обычным запросам. Соединение
+    слушает фоновый поток; при обрыве он переподключается с экспоненциальной паузой
+    и будит всех ждущих: NOTIFY, пришедшие без LISTEN, потеряны, и им нужно перечитать базу.
+    '''
+    
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._conn = None
+        self._thread = None
+        self._waiters = {}
+        self._lock = threading.Lock()
+    
+    def subscribe(self, user_id: int) -> threading.Event:
+        waiter = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(str(user_id), set()).add(waiter)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-listener', daemon=True)
+                self._thread.start()
+        return waiter
+    
+    def unsubscribe(self, user_id: int, waiter: threading.Event) -> None:
+        with self._lock:
+            waiters = self._waiters.get(str(user_id))
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[str(user_id)]
+    
+    def _wake(self, user_id=None) -> None:
+        with self._lock:
+            if user_id is None:
+                waiters = [w for user_waiters in self._waiters.values() for w in user_waiters]
+            else:
+                waiters = list(self._waiters.get(user_id, ()))
+        for waiter in waiters:
+            waiter.set()
+    
+    def _run(self) -> None:
+        backoff = LISTEN_RECONNECT_MIN
+        while True:
+            try:
+                self._conn = psycopg2.connect(self.dsn)
+                self._conn.autocommit = True
+                with self._conn.cursor() as cur:
+                    cur.execute(f'LISTEN {NOTIFY_CHANNEL}')
+                backoff = LISTEN_RECONNECT_MIN
+                self._wake()
+                self._listen()
+            except psycopg2.Error as e:
+                log_event({'event': 'listener_reconnect', 'function': FUNCTION_NAME,
+                           'error': str(e).strip(), 'retry_in': backoff})
+            finally:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            time.sleep(backoff)
+            backoff = min(backoff * 2, LISTEN_RECONNECT_MAX)
+    
+    def _listen(self) -> None:
+        conn = self._conn
+        while True:
+            if select.select([conn], [], [], LISTEN_HEALTH_INTERVAL) == ([], [], []):
+                # Тишина в канале: проверяем, что соединение живо, а не оборвано без FIN
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self._wake(notify.payload.split(':', 1)[0])
+
+
+def get_listener() -> NotificationListener:
+    '''Лениво создаёт единственного слушателя NOTIFY на экземпляр функции'''
+    global _listener
+    listener = _listener
+    if listener is None:
+        # Параллельные первые long-poll иначе создали бы по слушателю, и лишний держал бы поток и LISTEN
+        with _listener_lock:
+            if _listener is None:
+                _listener = NotificationListener(os.environ.get('DATABASE_URL'))
+            listener = _listener
+    return listener
+
+
+def is_segment(segment, segment_arg) -> bool:
+    '''Сегмент рассылки из JSON-тела; параметр сегмента — непустая строка, а не список или объект'''
+    if not isinstance(segment, str) or segment not in RECIPIENT_SEGMENTS:
+        return False
+    return not RECIPIENT_SEGMENTS[segment][1] or (isinstance(segment_arg, str) and bool(segment_arg.strip()))
+
+
+def fanout_batch_id(idempotency_key, notification: tuple):
+    '''Метка рассылки: ключ вместе с текстом уведомления, чтобы тот же ключ с другим текстом не считался повтором'''
+    if idempotency_key is None:
+        return None
+    return hashlib.sha256(json.dumps([idempotency_key, *notification]).encode()).hexdigest()
+
+
+def fanout_to_users(conn, user_ids: list, notification: tuple, batch=None) -> tuple:
+    '''Вставляет уведомление явному списку получателей пачками по FANOUT_CHUNK_SIZE с COMMIT после каждой.
+    
+    Повторы id схлопываются, несуществующие пользователи отсекаются JOIN users, поэтому чужой id
+    не превращается в нарушение FK. Пачки идут по возрастанию id: триггер счётчиков блокирует строки
+    notification_counters до COMMIT, и одна большая транзакция держала бы их все до конца рассылки,
+    а одинаковый порядок не даёт параллельным рассылкам взять блокировки навстречу друг другу.
+    Уведомления помечаются batch (Idempotency-Key рассылки): повтор после сбоя пропускает тех,
+    кому уже доставлено. Возвращает (вставлено, пропущено как уже доставленные).
+    '''
+    recipients = sorted(set(user_ids))
+    inserted = skipped = 0
+    with conn.cursor() as cur:
+        for start in range(0, len(recipients), FANOUT_CHUNK_SIZE):
+            cur.execute("""
+                WITH batch AS (
+                    SELECT u.id FROM users u
+                    WHERE u.id = ANY(%s)
+                    ORDER BY u.id
+                ), created AS (
+                    INSERT INTO notifications (user_id, type, title, message, fanout_batch)
+                    SELECT batch.id, %s, %s, %s, %s FROM batch
+                    ON CONFLICT (fanout_batch, user_id) WHERE fanout_batch IS NOT NULL DO NOTHING
+                    RETURNING 1
+                )
+                SELECT (SELECT COUNT(*) FROM batch), (SELECT COUNT(*) FROM created)
+            """, [recipients[start:start + FANOUT_CHUNK_SIZE]] + list(notification) + [batch])
+            count, created = cur.fetchone()
+            conn.commit()
+            inserted += created
+            skipped += count - created
+    return inserted, skipped
+
+
+def fanout_to_segment(conn, segment: str, segment_arg, notification: tuple, batch=None) -> tuple:
+    '''Рассылает уведомление сегменту пользователей через INSERT ... SELECT, идя по users.id пачками.
+    
+    Пачки отсчитываются по выбранным получателям, а не по вставленным строкам: при повторе с тем же
+    batch уже доставленные пропускаются, и короткая вставка не должна обрывать обход.
+    '''
+    condition, needs_arg = RECIPIENT_SEGMENTS[segment]
+    condition_args = [segment_arg] if needs_arg else []
+    inserted = skipped = 0
+    last_id = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(f"""
+                WITH batch AS (
+                    SELECT u.id FROM users u
+                    WHERE {condition} AND u.id > %s
+                    ORDER BY u.id
+                    LIMIT %s
+                ), created AS (
+                    INSERT INTO notifications (user_id, type, title, message, fanout_batch)
+                    SELECT batch.id, %s, %s, %s, %s FROM batch
+                    ON CONFLICT (fanout_batch, user_id) WHERE fanout_batch IS NOT NULL DO NOTHING
+                    RETURNING 1
+                )
+                SELECT (SELECT COUNT(*) FROM batch), (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM created)
+            """, condition_args + [last_id, FANOUT_CHUNK_SIZE] + list(notification) + [batch])
+            count, max_user_id, created = cur.fetchone()
+            # Короткие транзакции на пачку не держат блокировки счётчиков во время всей рассылки
+            conn.commit()
+            inserted += created
+            skipped += count - created
+            if count < FANOUT_CHUNK_SIZE:
+                return inserted, skipped
+            last_id = max_user_id
+
+
+def handle_request(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': ''
-        }
+        return {'statusCode': 200, 'headers': PREFLIGHT_HEADERS, 'body': ''}
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
-    cur = conn.cursor()
+    conn = None
+    cur = None
     
     try:
+        with measure('connect'):
+            conn = get_connection()
+        cur = conn.cursor()
+        
         if method == 'GET':
-            user_id = event.get('queryStringParameters', {}).get('user_id')
+            query_params = event.get('queryStringParameters', {}) or {}
+            user_id = query_params.get('user_id')
             
             if not user_id:
                 return {
                     'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': JSON_HEADERS,
                     'body': json.dumps({'error': 'user_id is required'})
                 }
             
-            cur.execute("""
-                SELECT id, type, title, message, is_read, created_at
-                FROM notifications
-                WHERE user_id = %s
-                ORDER BY created_at DESC
-                LIMIT 50
-            """, (user_id,))
+            try:
+                user_id = int(user_id)
+                before = int(query_params['before']) if query_params.get('before') else None
+                since = int(query_params['since']) if query_params.get('since') is not None else None
+                limit = max(1, min(int(query_params.get('limit') or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+                wait = max(0.0, min(float(query_params.get('wait') or 0), LONG_POLL_MAX_WAIT))
+                if not all(0 <= value <= MAX_ID for value in (user_id, before or 0, since or 0)):
+                    raise ValueError('id out of range')
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'error': 'user_id, before, since, limit and wait must be valid numbers'})
+                }
+            
+            # По умолчанию читаем только горячую таблицу; вся история вместе с архивом — по archived=1
+            archived = query_params.get('archived') == '1'
+            
+            if since is not None and not archived:
+                # Long-poll: отдаём уведомления новее since, при их отсутствии ждём NOTIFY до wait секунд
+                since_query = """
+                    SELECT id, type, title, message, is_read, created_at
+                    FROM notifications
+                    WHERE user_id = %s AND id > %s
+                    ORDER BY id ASC
+                    LIMIT %s
+                """
+                # Подписываемся до первого запроса, чтобы не пропустить NOTIFY между ним и ожиданием
+                waiter = get_listener().subscribe(user_id) if wait > 0 else None
+                deadline = time.monotonic() + wait
+                try:
+                    execute_prepared(cur, 'notifications_since', since_query, (user_id, since, limit))
+                    while waiter is not None and cur.rowcount == 0 and deadline > time.monotonic():
+                        # На время ожидания соединение возвращается в пул
+                        cur.close()
+                        release_connection(conn)
+                        cur = conn = None
+                        waiter.wait(deadline - time.monotonic())
+                        waiter.clear()
+                        with measure('connect'):
+                            conn = get_connection()
+                        cur = conn.cursor()
+                        execute_prepared(cur, 'notifications_since', since_query, (user_id, since, limit))
+                finally:
+                    if waiter is not None:
+                        get_listener().unsubscribe(user_id, waiter)
+            elif archived:
+                # Непрочитанные старые уведомления остаются в горячей таблице вперемешку с архивными,
+                # поэтому история читает обе таблицы в одном порядке (created_at, id): перенос строки
+                # в архив между страницами не меняет её места, и страницы идут без пропусков и повторов
+                if before:
+                    cursor_condition = 'AND (created_at, id) < (SELECT created_at, id FROM cursor_row)'
+                    args = (before, before, user_id, limit, user_id, limit, limit)
+                else:
+                    cursor_condition = ''
+                    args = (None, None, user_id, limit, user_id, limit, limit)
+                cur.execute(f"""
+                    WITH cursor_row AS (
+                        SELECT created_at, id FROM notifications WHERE id = %s
+                        UNION ALL
+                        SELECT created_at, id FROM notifications_archive WHERE id = %s
+                        LIMIT 1
+                    )
+                    SELECT id, type, title, message, is_read, created_at FROM (
+                        (SELECT id, type, title, message, is_read, created_at
+                         FROM notifications
+                         WHERE user_id = %s {cursor_condition}
+                         ORDER BY created_at DESC, id DESC
+                         LIMIT %s)
+                        UNION ALL
+                        (SELECT id, type, title, message, is_read, created_at
+                         FROM notifications_archive
+                         WHERE user_id = %s {cursor_condition}
+                         ORDER BY created_at DESC, id DESC
+                         LIMIT %s)
+                    ) n
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """, args)
+            elif before:
+                # Курсор мог уже уехать в архив, поэтому ищем его в обеих таблицах
+                cur.execute("""
+                    SELECT n.id, n.type, n.title, n.message, n.is_read, n.created_at
+                    FROM notifications n, (
+                        SELECT created_at, id FROM notifications WHERE id = %s
+                        UNION ALL
+                        SELECT created_at, id FROM notifications_archive WHERE id = %s
+                        LIMIT 1
+                    ) b
+                    WHERE n.user_id = %s
+                      AND (n.created_at, n.id) < (b.created_at, b.id)
+                    ORDER BY n.created_at DESC, n.id DESC
+                    LIMIT %s
+                """, (before, before, user_id, limit))
+            else:
+                execute_prepared(cur, 'notifications_page', """
+                    SELECT id, type, title, message, is_read, created_at
+                    FROM notifications
+                    WHERE user_id = %s
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """, (user_id, limit))
             
             rows = cur.fetchall()
+            record_rows(len(rows))
             notifications = []
             for row in rows:
                 notifications.append({
@@ -52,28 +620,74 @@ def handler(event: dict, context) -> dict:
                     'created_at': row[5].isoformat() if row[5] else None
                 })
             
-            unread_count = sum(1 for n in notifications if not n['is_read'])
+            next_before = None
+            if (since is None or archived) and len(notifications) == limit:
+                next_before = notifications[-1]['id']
+            last_id = max([n['id'] for n in notifications], default=since or 0)
+            
+            execute_prepared(cur, 'unread_count', """
+                SELECT unread_count FROM notification_counters WHERE user_id = %s
+            """, (user_id,))
+            counter = cur.fetchone()
+            unread_count = counter[0] if counter else 0
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': JSON_HEADERS,
                 'body': json.dumps({
                     'notifications': notifications,
-                    'unread_count': unread_count
+                    'unread_count': unread_count,
+                    'next_before': next_before,
+                    'last_id': last_id
                 })
             }
         
         elif method == 'POST':
             data = json.loads(event.get('body', '{}'))
             user_id = data.get('user_id')
+            user_ids = data.get('user_ids')
+            segment = data.get('segment')
             notification_type = data.get('type')
             title = data.get('title')
             message = data.get('message')
             
+            if (user_ids is not None or segment is not None) and all([notification_type, title, message]):
+                notification = (notification_type, title, message)
+                # Рассылка фиксируется пачками, поэтому сбой на середине оставляет часть доставленной;
+                # повтор с тем же Idempotency-Key досылает только остальным
+                idempotency_key = get_idempotency_key(event)
+                if idempotency_key is not None and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                    return {
+                        'statusCode': 400,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'Invalid Idempotency-Key'})
+                    }
+                batch = fanout_batch_id(idempotency_key, notification)
+                if isinstance(user_ids, list) and user_ids and all(map(is_id, user_ids)):
+                    inserted, skipped = fanout_to_users(conn, user_ids, notification, batch)
+                elif is_segment(segment, data.get('category')):
+                    inserted, skipped = fanout_to_segment(conn, segment, data.get('category'), notification, batch)
+                else:
+                    return {
+                        'statusCode': 400,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'Invalid recipients'})
+                    }
+                
+                return {
+                    'statusCode': 201,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({
+                        'success': True,
+                        'inserted': inserted,
+                        'already_delivered': skipped
+                    })
+                }
+            
             if not all([user_id, notification_type, title, message]):
                 return {
                     'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': JSON_HEADERS,
                     'body': json.dumps({'error': 'Missing required fields'})
                 }
             
@@ -88,7 +702,7 @@ def handler(event: dict, context) -> dict:
             
             return {
                 'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': JSON_HEADERS,
                 'body': json.dumps({
                     'success': True,
                     'notification_id': notification_id
@@ -98,34 +712,83 @@ def handler(event: dict, context) -> dict:
         elif method == 'PUT':
             data = json.loads(event.get('body', '{}'))
             notification_id = data.get('notification_id')
+            notification_ids = data.get('notification_ids')
+            user_id = data.get('user_id')
+            mark_all = data.get('all') is True
+            
+            if notification_id is not None:
+                notification_ids = [notification_id]
             
-            if not notification_id:
+            if ((user_id is not None and not is_id(user_id))
+                    or (notification_ids is not None
+                        and not (isinstance(notification_ids, list) and all(map(is_id, notification_ids))))):
                 return {
                     'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'notification_id is required'})
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'error': 'user_id and notification ids must be integers'})
                 }
             
-            cur.execute("""
-                UPDATE notifications
-                SET is_read = TRUE
-                WHERE id = %s
-            """, (notification_id,))
+            if mark_all and user_id:
+                cur.execute("""
+                    UPDATE notifications
+                    SET is_read = TRUE
+                    WHERE user_id = %s AND is_read IS NOT TRUE
+                """, (user_id,))
+            elif isinstance(notification_ids, list) and notification_ids:
+                # Фильтр по user_id необязателен и ограничивает отметку уведомлениями владельца
+                cur.execute("""
+                    UPDATE notifications
+                    SET is_read = TRUE
+                    WHERE id = ANY(%s::int[]) AND is_read IS NOT TRUE
+                      AND (%s::int IS NULL OR user_id = %s::int)
+                """, (notification_ids, user_id, user_id))
+            else:
+                return {
+                    'statusCode': 400,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'error': 'notification_id, notification_ids or user_id with all is required'})
+                }
             
+            updated = cur.rowcount
             conn.commit()
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True})
+                'headers': JSON_HEADERS,
+                'body': json.dumps({'success': True, 'updated': updated})
             }
         
         return {
             'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': JSON_HEADERS,
             'body': json.dumps({'error': 'Method not allowed'})
         }
     
+    except psycopg2.pool.PoolError:
+        return {
+            'statusCode': 503,
+            'headers': {**JSON_HEADERS, 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Service busy, retry later'})
+        }
+    
+    except Exception:
+        return internal_error(context)
+    
+    finally:
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            release_connection(conn)
+
+
+def handler(event: dict, context) -> dict:
+    '''API для управления уведомлениями пользователей'''
+    if not INSTRUMENTATION_ENABLED:
+        return handle_request(event, context)
+    metrics = RequestMetrics()
+    token = _metrics.set(metrics)
+    try:
+        response = handle_request(event, context)
     finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        _metrics.reset(token)
+    return metrics.finish(event, context, response)
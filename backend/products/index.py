@@ -1,85 +1,1433 @@
 """
 API для работы с товарами: получение списка, создание, обновление
 """
+import base64
+import hashlib
 import json
+import math
 import os
+import random
+import threading
+import time
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlencode
 
-def handler(event: dict, context) -> dict:
-    method = event.get('httpMethod', 'GET')
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '5'))
+CONNECTION_MAX_AGE = 300
+IDLE_CHECK_INTERVAL = 30
+# Сколько запрос ждёт свободное соединение, прежде чем ответить 503
+POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '10'))
+# Подготовленные запросы живут в сессии, поэтому их отключают за пулером в режиме транзакций
+PREPARED_STATEMENTS = os.environ.get('PREPARED_STATEMENTS', '1') == '1'
+
+FUNCTION_NAME = 'products'
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '500'))
+EXPLAIN_SAMPLE_RATE = float(os.environ.get('EXPLAIN_SAMPLE_RATE', '0'))
+NULL_PHASE = nullcontext()
+
+# Заголовки ответов собираются один раз при импорте модуля; инструментирование копирует их перед дополнением
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, Idempotency-Key'
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+# Сколько кандидатов поиск берёт перед ранжированием
+SEARCH_CANDIDATES = int(os.environ.get('SEARCH_CANDIDATES', '200'))
+# Сколько самых свежих объявлений поиск просматривает, чтобы среди кандидатов были новые
+SEARCH_WINDOW = int(os.environ.get('SEARCH_WINDOW', '2000'))
+
+FEED_CACHE_TTL = int(os.environ.get('FEED_CACHE_TTL', '30'))
+FEED_CACHE_SIZE = 256
+FEED_CACHE_VERSION_KEY = 'products_feed'
+# Читать имя и рейтинг продавца из денормализованных колонок products вместо JOIN users
+FEED_DENORMALIZED_SELLER = os.environ.get('FEED_DENORMALIZED_SELLER') == '1'
+
+VIEW_FLUSH_SIZE = int(os.environ.get('VIEW_FLUSH_SIZE', '100'))
+VIEW_FLUSH_INTERVAL = float(os.environ.get('VIEW_FLUSH_INTERVAL', '10'))
+
+CATEGORY_EMOJIS = {
+    'Электроника': '📱',
+    'Одежда': '🧥',
+    'Мебель': '🛋️',
+    'Спорт': '🚴',
+    'Детские товары': '🍼',
+    'Авто': '🚗'
+}
+DEFAULT_EMOJI = '📦'
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+# products.price — INTEGER: большее значение уронило бы COPY всего файла
+MAX_PRICE = 2147483647
+# id в таблицах — SERIAL (INTEGER)
+MAX_ID = 2147483647
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cities.json')
+DEFAULT_RADIUS_KM = 50
+MAX_RADIUS_KM = 500
+EARTH_RADIUS_KM = 6371.0
+
+# Границы гистограммы цен; должны совпадать с product_price_bucket() в миграции V0012
+PRICE_BUCKET_BOUNDS = (500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000)
+
+DAY_FORMS = ('день', 'дня', 'дней')
+WEEK_FORMS = ('неделю', 'недели', 'недель')
+
+_pool = None
+_pool_lock = threading.Lock()
+_metrics = ContextVar('metrics', default=None)
+_orjson = None
+_feed_cache = None
+_gazetteer = None
+_pending_views = {}
+_pending_views_total = 0
+_views_buffered_at = None
+_views_timer_armed = False
+_views_lock = threading.Lock()
+
+
+# ---- Общие блоки функций: начало ----
+# Функции деплоятся по отдельности, поэтому всё до конца области скопировано в их index.py;
+# tests/test_shared_blocks.py сверяет копии, правьте их вместе.
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    '''Соединение пула, которое само хранит время создания, последнего использования
+    и имена подготовленных на нём запросов: они живут и закрываются вместе с соединением
+    '''
     
-    if method == 'OPTIONS':
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.born = self.last_used = time.monotonic()
+        self.prepared = set()
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    '''Пул, который ждёт освободившееся соединение вместо PoolError и не закрывает возвращённые.
+    
+    Соединения открываются лениво, но остаются открытыми, пока их не больше maxconn,
+    поэтому после всплеска нагрузки тёплый экземпляр держит весь пул.
+    '''
+    
+    def __init__(self, maxconn: int, timeout: float, *args, **kwargs):
+        super().__init__(1, maxconn, *args, **kwargs)
+        self.minconn = maxconn
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+    
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError('connection pool exhausted')
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+def get_pool():
+    '''Лениво создаёт пул соединений, переживающий тёплые вызовы функции'''
+    global _pool
+    pool = _pool
+    if pool is None or pool.closed:
+        # Параллельные первые запросы иначе создали бы по своему пулу и вернули соединение не в тот
+        with _pool_lock:
+            if _pool is None or _pool.closed:
+                cursor_factory = TimedCursor if INSTRUMENTATION_ENABLED else None
+                _pool = BlockingConnectionPool(POOL_MAX_SIZE, POOL_WAIT_TIMEOUT, os.environ.get('DATABASE_URL'),
+                                               connection_factory=PooledConnection, cursor_factory=cursor_factory)
+            pool = _pool
+    return pool
+
+
+def get_connection():
+    '''Берёт соединение из пула, заменяя закрытые, устаревшие и оборванные'''
+    pool = get_pool()
+    for _ in range(POOL_MAX_SIZE + 1):
+        conn = pool.getconn()
+        now = time.monotonic()
+        if not conn.closed and now - conn.born < CONNECTION_MAX_AGE:
+            if now - conn.last_used < IDLE_CHECK_INTERVAL:
+                return conn
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+                return conn
+            except psycopg2.Error:
+                pass
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+
+def release_connection(conn) -> None:
+    '''Возвращает соединение в пул, откатывая незавершённую транзакцию'''
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if not broken:
+        conn.last_used = time.monotonic()
+    get_pool().putconn(conn, close=broken)
+
+
+def execute_prepared(cur, name: str, query: str, args: tuple) -> None:
+    '''Выполняет горячий запрос через PREPARE/EXECUTE: план строится один раз на соединение пула
+    и переиспользуется тёплыми вызовами. Запрос пишется с %s, как для cur.execute.
+    '''
+    if not PREPARED_STATEMENTS:
+        cur.execute(query, args)
+        return
+    prepared = cur.connection.prepared
+    if name not in prepared:
+        cur.execute(f'PREPARE {name} AS ' + query % tuple(f'${i}' for i in range(1, len(args) + 1)))
+        prepared.add(name)
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+
+
+def dumps(value) -> str:
+    '''JSON-кодирование через orjson, если он установлен, иначе стандартным json.
+    
+    orjson импортируется при первом вызове: OPTIONS и POST на холодном старте его не ждут.
+    '''
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson as _orjson
+        except ImportError:
+            _orjson = False
+    if _orjson:
+        return _orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+def fetch_rows(conn, query: str, args) -> list:
+    '''Читает страницу обычным курсором за один запрос; время запроса TimedCursor относит к фазе query.
+    
+    Все выборки ограничены страницей (limit + 1 строк, не больше MAX_PAGE_SIZE + 1), поэтому серверный
+    курсор с лишними DECLARE/FETCH/CLOSE не нужен.
+    '''
+    with conn.cursor() as cur:
+        cur.execute(query, args)
+        return cur.fetchall()
+
+
+def encode_json_array(rows, map_row, limit: int) -> tuple:
+    '''Кодирует строки в JSON-массив по одной, не собирая список словарей; возвращает (массив, последняя строка, если есть продолжение)'''
+    pieces = []
+    overflow = None
+    last_row = None
+    for row in rows:
+        if len(pieces) == limit:
+            overflow = last_row
+            break
+        pieces.append(dumps(map_row(row)))
+        last_row = row
+    record_rows(len(pieces))
+    return '[' + ', '.join(pieces) + ']', overflow
+
+
+def is_id(value) -> bool:
+    '''Целый id из JSON-тела; bool — подкласс int, поэтому true/false отсекаются явно'''
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= MAX_ID
+
+
+def get_idempotency_key(event: dict):
+    '''Значение заголовка Idempotency-Key без учёта регистра имени; None, если клиент его не прислал'''
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            return value.strip()
+    return None
+
+
+def claim_idempotency_key(cur, scope: str, key: str, payload: str):
+    '''Резервирует ключ в текущей транзакции; возвращает готовый ответ, если запрос с этим ключом уже выполнен.
+    
+    Параллельный дубль ждёт на первичном ключе idempotency_keys, пока первая транзакция
+    не завершится, и затем получает её сохранённый ответ. None означает, что запрос нужно выполнить.
+    '''
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
         return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': ''
+            'statusCode': 400,
+            'headers': JSON_HEADERS,
+            'body': json.dumps({'error': 'Invalid Idempotency-Key'})
         }
     
-    dsn = os.environ.get('DATABASE_URL')
+    request_hash = hashlib.sha256(payload.encode()).hexdigest()
+    cur.execute("""
+        INSERT INTO idempotency_keys (scope, key, request_hash)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (scope, key) DO NOTHING
+        RETURNING 1
+    """, (scope, key, request_hash))
+    if cur.fetchone():
+        return None
     
+    cur.execute("""
+        SELECT request_hash, status_code, response_body FROM idempotency_keys
+        WHERE scope = %s AND key = %s
+    """, (scope, key))
+    stored_hash, status_code, response_body = cur.fetchone()
+    if stored_hash != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': JSON_HEADERS,
+            'body': json.dumps({'error': 'Idempotency-Key was used with a different request'})
+        }
+    return {
+        'statusCode': status_code,
+        'headers': {**JSON_HEADERS, 'Idempotent-Replayed': 'true'},
+        'body': response_body
+    }
+
+
+def save_idempotent_response(cur, scope: str, key, response: dict) -> dict:
+    '''Запоминает ответ под ключом в той же транзакции, что и сама запись'''
+    if key:
+        cur.execute("""
+            UPDATE idempotency_keys SET status_code = %s, response_body = %s
+            WHERE scope = %s AND key = %s
+        """, (response['statusCode'], response['body'], scope, key))
+    return response
+
+
+class RequestMetrics:
+    '''Тайминги фаз (connect, query, serialize), число строк и размер ответа одного запроса'''
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.rows = 0
+    
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+    
+    def finish(self, event: dict, context, response: dict) -> dict:
+        total = time.perf_counter() - self.started
+        body = response.get('body') or ''
+        timing = ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items())
+        response['headers'] = dict(response.get('headers') or {})
+        response['headers']['Server-Timing'] = f'{timing}, total;dur={total * 1000:.1f}'.lstrip(', ')
+        response['headers']['Timing-Allow-Origin'] = '*'
+        log_event({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'duration_ms': round(total * 1000, 2),
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+            'rows': self.rows,
+            'bytes': len(body.encode('utf-8'))
+        })
+        return response
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    '''Курсор, записывающий время запросов в метрики и логирующий медленные запросы'''
+    
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics = _metrics.get()
+            if metrics is not None:
+                metrics.add('query', elapsed)
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                log_slow_query(self, query, vars, elapsed)
+
+
+def log_event(payload: dict) -> None:
+    print(json.dumps(payload, ensure_ascii=False, default=str), flush=True)
+
+
+def log_slow_query(cur, query, vars, elapsed: float) -> None:
+    '''Логирует медленный запрос и с вероятностью EXPLAIN_SAMPLE_RATE прикладывает его план'''
+    payload = {
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'duration_ms': round(elapsed * 1000, 2),
+        'query': ' '.join(str(query).split())[:1000]
+    }
+    conn = cur.connection
+    status = conn.info.transaction_status
+    # PREPARE, CREATE TEMP TABLE и другие служебные команды EXPLAIN не принимает
+    statement = (str(query).split(None, 1) or [''])[0].upper()
+    if (random.random() < EXPLAIN_SAMPLE_RATE and cur.name is None
+            and statement in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'EXECUTE')
+            and status != psycopg2.extensions.TRANSACTION_STATUS_INERROR):
+        # EXPLAIN идёт в транзакции запроса: точка сохранения не даёт его ошибке оборвать транзакцию
+        savepoint = status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as explain_cur:
+            if savepoint:
+                explain_cur.execute('SAVEPOINT explain_sample')
+            try:
+                explain_cur.execute('EXPLAIN (FORMAT JSON) ' + str(query), vars)
+                payload['plan'] = explain_cur.fetchone()[0]
+            except psycopg2.Error as e:
+                payload['explain_error'] = str(e)
+                if savepoint:
+                    explain_cur.execute('ROLLBACK TO SAVEPOINT explain_sample')
+            if savepoint:
+                explain_cur.execute('RELEASE SAVEPOINT explain_sample')
+    log_event(payload)
+
+
+def measure(phase: str):
+    '''Контекст замера фазы; при выключенной инструментации — пустой контекст'''
+    metrics = _metrics.get()
+    return metrics.phase(phase) if metrics is not None else NULL_PHASE
+
+
+def record_rows(count: int) -> None:
+    '''Добавляет к метрикам число строк, попавших в ответ'''
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.rows += count
+
+
+def internal_error(context) -> dict:
+    '''Логирует необработанное исключение и отвечает 500 без внутренних деталей'''
+    import traceback
+    
+    request_id = getattr(context, 'request_id', None)
+    log_event({
+        'event': 'error',
+        'function': FUNCTION_NAME,
+        'request_id': request_id,
+        'traceback': traceback.format_exc()
+    })
+    return {
+        'statusCode': 500,
+        'headers': JSON_HEADERS,
+        'body': json.dumps({'error': 'Internal server error', 'request_id': request_id})
+    }
+
+
+# ---- Общие блоки функций: конец ----
+
+
+class LRUCache:
+    '''Кэш в памяти процесса: вытеснение по LRU и истечение по TTL'''
+    
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+    
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: str) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+class RedisCache:
+    '''Общий кэш для всех экземпляров функции поверх Redis-совместимого сервера'''
+    
+    def __init__(self, url: str, ttl: int):
+        import redis
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+    
+    def get(self, key: str):
+        value = self._client.get(key)
+        return value.decode() if value is not None else None
+    
+    def set(self, key: str, value: str) -> None:
+        self._client.setex(key, self.ttl, value.encode())
+
+
+def get_feed_cache():
+    '''Выбирает бэкенд кэша ленты: Redis при заданном REDIS_URL, иначе LRU в памяти'''
+    global _feed_cache
+    if _feed_cache is None:
+        redis_url = os.environ.get('REDIS_URL')
+        if redis_url:
+            _feed_cache = RedisCache(redis_url, FEED_CACHE_TTL)
+        else:
+            _feed_cache = LRUCache(FEED_CACHE_SIZE, FEED_CACHE_TTL)
+    return _feed_cache
+
+
+def feed_cache_key(params: dict, version: int) -> str:
+    '''Ключ кэша из отсортированных непустых параметров и текущей версии ленты.
+    
+    Значения не нормализуются: build_filters передаёт их в запрос как есть, и «Авто » с пробелом
+    даёт другую выдачу, чем «Авто», поэтому не должен делить с ним ключ.
+    '''
+    normalized = sorted((k, str(v)) for k, v in params.items() if v not in (None, ''))
+    return f'products:feed:{version}:{urlencode(normalized)}'
+
+
+# Любая запись товаров (POST, импорт, архивация) обновляет одну и ту же строку cache_versions.
+# Блокировка строки держится до COMMIT, поэтому пишущие транзакции товаров выполняются по очереди:
+# версию увеличивают в конце транзакции, после основной работы, чтобы не держать блокировку дольше нужного.
+def invalidate_feed_cache(cur) -> None:
+    '''Увеличивает версию ленты: все закэшированные страницы становятся недоступны'''
+    cur.execute("""
+        UPDATE cache_versions SET version = version + 1 WHERE name = %s
+    """, (FEED_CACHE_VERSION_KEY,))
+
+
+def add_seller_listings(cur, seller_id: int, count: int) -> None:
+    '''Прибавляет новые объявления к seller_stats продавца без пересчёта по products.
+    
+    Остальные агрегаты (просмотры, отзывы, рейтинг) догоняет плановый refresh_seller_stats() из scripts/retention.py.
+    '''
+    cur.execute("""
+        INSERT INTO seller_stats (seller_id, listings_count, total_sales, rating)
+        SELECT u.id, %s, COALESCE(u.total_sales, 0), COALESCE(u.rating, 0.0)
+        FROM users u WHERE u.id = %s
+        ON CONFLICT (seller_id) DO UPDATE SET listings_count = seller_stats.listings_count + EXCLUDED.listings_count
+    """, (count, seller_id))
+
+
+def cached_json_response(body: str, event: dict) -> dict:
+    '''Отдаёт готовый JSON с ETag или 304, если клиент прислал совпадающий If-None-Match'''
+    etag = '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+    request_headers = event.get('headers') or {}
+    if_none_match = request_headers.get('If-None-Match') or request_headers.get('if-none-match')
+    headers = {**JSON_HEADERS, 'Access-Control-Expose-Headers': 'ETag', 'ETag': etag}
+    if if_none_match == etag:
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
+    return {'statusCode': 200, 'headers': headers, 'body': body}
+
+
+def plural_ru(n: int, forms: tuple) -> str:
+    '''Выбирает форму слова по правилам русского склонения числительных'''
+    if n % 10 == 1 and n % 100 != 11:
+        return forms[0]
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return forms[1]
+    return forms[2]
+
+
+@lru_cache(maxsize=1024)
+def posted_label(days: int) -> str:
+    '''Относительная дата публикации по числу прошедших суток'''
+    if days <= 0:
+        return 'Сегодня'
+    if days < 7:
+        return f'{days} {plural_ru(days, DAY_FORMS)} назад'
+    weeks = days // 7
+    return f'{weeks} {plural_ru(weeks, WEEK_FORMS)} назад'
+
+
+def normalize_place(name: str) -> str:
+    name = name.strip().lower().replace('ё', 'е')
+    for prefix in ('г. ', 'г.', 'город '):
+        if name.startswith(prefix):
+            name = name[len(prefix):].strip()
+    return name
+
+
+def get_gazetteer() -> tuple:
+    '''Лениво загружает справочник городов: (список городов, индекс по нормализованным названиям)'''
+    global _gazetteer
+    if _gazetteer is None:
+        with open(GAZETTEER_PATH, encoding='utf-8') as f:
+            cities = json.load(f)
+        index = {}
+        for city in cities:
+            for name in [city['name']] + city.get('aliases', []):
+                index[normalize_place(name)] = city
+        _gazetteer = (cities, index)
+    return _gazetteer
+
+
+def geocode_location(location: str) -> tuple:
+    '''Определяет (город, lat, lon) по свободному тексту вида «Москва, м. Кропоткинская»'''
+    city = get_gazetteer()[1].get(normalize_place((location or '').split(',', 1)[0]))
+    if city is None:
+        return None, None, None
+    return city['name'], city['lat'], city['lon']
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    '''Расстояние по большому кругу (гаверсинус)'''
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def nearby_cities(lat: float, lon: float, radius_km: float) -> list:
+    '''Пары (расстояние, город) для городов справочника в радиусе от точки, от ближнего к дальнему'''
+    cities = get_gazetteer()[0]
+    nearby = [(distance_km(lat, lon, c['lat'], c['lon']), c['name']) for c in cities]
+    return [(dist, name) for dist, name in sorted(nearby) if dist <= radius_km]
+
+
+def cities_within(lat: float, lon: float, radius_km: float) -> list:
+    '''Города справочника в радиусе от точки, от ближнего к дальнему'''
+    return [name for _, name in nearby_cities(lat, lon, radius_km)]
+
+
+def parse_origin(params: dict):
+    '''(lat, lon, radius_km) из параметров поиска «рядом» или None; ValueError при неверных координатах'''
+    lat, lon = params.get('lat'), params.get('lon')
+    if not (lat and lon):
+        return None
+    lat, lon = float(lat), float(lon)
+    radius_km = min(float(params.get('radius_km') or DEFAULT_RADIUS_KM), MAX_RADIUS_KM)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or radius_km <= 0:
+        raise ValueError('Invalid coordinates')
+    return lat, lon, radius_km
+
+
+def record_view(product_id: int) -> bool:
+    '''Копит просмотр в буфере; True, если пора сбросить буфер в базу'''
+    global _pending_views_total, _views_buffered_at
+    with _views_lock:
+        if _views_buffered_at is None:
+            _views_buffered_at = time.monotonic()
+            schedule_views_flush()
+        _pending_views[product_id] = _pending_views.get(product_id, 0) + 1
+        _pending_views_total += 1
+        return (_pending_views_total >= VIEW_FLUSH_SIZE
+                or time.monotonic() - _views_buffered_at >= VIEW_FLUSH_INTERVAL)
+
+
+def schedule_views_flush() -> None:
+    '''Взводит таймер записи буфера: без него просмотры простаивающего экземпляра не попали бы в базу.
+    
+    Вызывается под _views_lock. Флаг снимает сработавший таймер до того, как заберёт буфер, поэтому
+    просмотр, пришедший во время записи в базу, взводит новый таймер, а не теряется в буфере.
+    '''
+    global _views_timer_armed
+    if not _views_timer_armed:
+        _views_timer_armed = True
+        timer = threading.Timer(VIEW_FLUSH_INTERVAL, flush_views_in_background)
+        timer.daemon = True
+        timer.start()
+
+
+def flush_views_in_background() -> None:
+    '''Срабатывание таймера: берёт своё соединение из пула и записывает буфер'''
+    global _views_timer_armed
+    with _views_lock:
+        _views_timer_armed = False
     try:
-        conn = psycopg2.connect(dsn)
+        conn = get_connection()
+    except Exception:
+        log_view_flush_error()
+        # Просмотры остались в буфере: пробуем снова через интервал
+        with _views_lock:
+            if _pending_views:
+                schedule_views_flush()
+        return
+    try:
+        flush_views_safely(conn)
+    finally:
+        release_connection(conn)
+
+
+def flush_views_safely(conn) -> int:
+    '''Сбрасывает буфер, не пробрасывая ошибку: просмотр уже принят, зритель не должен получить 500'''
+    try:
+        return flush_views(conn)
+    except Exception:
+        log_view_flush_error()
+        return 0
+
+
+def log_view_flush_error() -> None:
+    import traceback
+    
+    log_event({
+        'event': 'view_flush_failed',
+        'function': FUNCTION_NAME,
+        'pending_views': _pending_views_total,
+        'traceback': traceback.format_exc()
+    })
+
+
+def write_views(cur, values: list) -> None:
+    '''Прибавляет просмотры одним UPDATE ... FROM (VALUES ...)'''
+    from psycopg2.extras import execute_values
+    
+    execute_values(cur, """
+        UPDATE products p
+        SET views = p.views + v.delta
+        FROM (VALUES %s) AS v(id, delta)
+        WHERE p.id = v.id
+    """, values)
+
+
+def flush_views(conn) -> int:
+    '''Записывает накопленные просмотры через write_views; при сбое возвращает их в буфер'''
+    global _pending_views, _pending_views_total, _views_buffered_at
+    with _views_lock:
+        pending = _pending_views
+        _pending_views = {}
+        _pending_views_total = 0
+        _views_buffered_at = None
+    
+    if not pending:
+        return 0
+    
+    # Сортировка по id задаёт единый порядок блокировок и исключает взаимоблокировки
+    values = sorted(pending.items())
+    try:
+        with conn.cursor() as cur:
+            write_views(cur, values)
+        conn.commit()
+    except Exception:
+        # Возвращаем просмотры в буфер, чтобы не потерять их при сбое записи
+        with _views_lock:
+            if _views_buffered_at is None:
+                _views_buffered_at = time.monotonic()
+            schedule_views_flush()
+            for product_id, delta in values:
+                _pending_views[product_id] = _pending_views.get(product_id, 0) + delta
+                _pending_views_total += delta
+        if not conn.closed:
+            conn.rollback()
+        raise
+    return len(values)
+
+
+def iter_import_rows(fmt: str, payload: str):
+    '''Построчно разбирает CSV (с заголовком) или NDJSON, отдавая (номер строки, dict или ошибка)'''
+    import io
+    
+    if fmt == 'csv':
+        import csv
+        reader = csv.DictReader(io.StringIO(payload))
+        # Заголовок читается заранее, чтобы line_num указывал на конец предыдущей записи
+        try:
+            reader.fieldnames
+        except csv.Error as e:
+            yield 1, ValueError(f'Invalid CSV: {e}')
+            return
+        while True:
+            # Ошибка разбора (например, поле длиннее csv.field_size_limit) отбрасывает одну запись,
+            # а не весь файл; line_num при ошибке не сдвигается, поэтому номер берётся заранее
+            start = reader.line_num + 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield start, ValueError(f'Invalid CSV: {e}')
+                continue
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(io.StringIO(payload), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_num, ValueError('Invalid JSON')
+                continue
+            yield line_num, row if isinstance(row, dict) else ValueError('Row must be an object')
+
+
+def import_text(row: dict, name: str) -> str:
+    '''Текстовое поле строки импорта: объекты, списки и числа из NDJSON не приводятся к строке'''
+    value = row.get(name)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid {name}')
+    return value.strip()
+
+
+def import_price(value) -> int:
+    '''Цена строки импорта: целое число или строка с ним; true и 5.9 не превращаются в 1 и 5'''
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('Invalid price')
+    try:
+        price = int(value)
+    except ValueError:
+        raise ValueError('Invalid price')
+    if price <= 0 or price > MAX_PRICE:
+        raise ValueError('Invalid price')
+    return price
+
+
+def validate_import_row(row: dict) -> tuple:
+    '''Проверяет строку импорта и приводит её к кортежу колонок products'''
+    title = import_text(row, 'title')
+    category = import_text(row, 'category')
+    location = import_text(row, 'location')
+    description = row.get('description')
+    if description is not None and not isinstance(description, str):
+        raise ValueError('Invalid description')
+    description = description or None
+    
+    if not all([title, category, location]):
+        raise ValueError('Missing required fields')
+    if len(title) > 255 or len(category) > 100 or len(location) > 255:
+        raise ValueError('Field too long')
+    # COPY и текстовые колонки Postgres не принимают NUL
+    if any('\x00' in value for value in (title, category, location, description) if value):
+        raise ValueError('NUL character in field')
+    price = import_price(row.get('price'))
+    
+    city, lat, lon = geocode_location(location)
+    return (title, price, category, description, location, CATEGORY_EMOJIS.get(category, DEFAULT_EMOJI),
+            city, lat, lon)
+
+
+def copy_value(value) -> str:
+    '''Экранирует значение для текстового формата COPY'''
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def import_products(conn, fmt: str, payload: str, seller_id: int) -> dict:
+    '''Массовый импорт: валидные строки идут через COPY во временную таблицу и одним INSERT в products.
+    
+    Транзакцию фиксирует вызывающий код, чтобы вместе с импортом сохранить ответ под Idempotency-Key.
+    '''
+    import io
+    
+    buffer = io.StringIO()
+    errors = []
+    valid = 0
+    
+    for line_num, row in iter_import_rows(fmt, payload):
+        try:
+            if isinstance(row, Exception):
+                raise row
+            values = validate_import_row(row)
+        except ValueError as e:
+            errors.append({'row': line_num, 'error': str(e)})
+            continue
+        buffer.write('\t'.join(copy_value(v) for v in values) + '\n')
+        valid += 1
+    
+    imported = 0
+    if valid:
+        buffer.seek(0)
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE products_import (
+                    title VARCHAR(255),
+                    price INTEGER,
+                    category VARCHAR(100),
+                    description TEXT,
+                    location VARCHAR(255),
+                    image_emoji VARCHAR(10),
+                    city VARCHAR(100),
+                    lat DOUBLE PRECISION,
+                    lon DOUBLE PRECISION
+                ) ON COMMIT DROP
+            """)
+            cur.copy_expert("""
+                COPY products_import (title, price, category, description, location, image_emoji, city, lat, lon)
+                FROM STDIN
+            """, buffer)
+            cur.execute("""
+                INSERT INTO products (title, price, category, description, location, image_emoji,
+                                      seller_id, verified_seller, seller_name, seller_rating, city, lat, lon)
+                SELECT i.title, i.price, i.category, i.description, i.location, i.image_emoji,
+                       u.id, COALESCE(u.verified, FALSE), u.name, u.rating, i.city, i.lat, i.lon
+                FROM products_import i
+                JOIN users u ON u.id = %s
+            """, (seller_id,))
+            imported = cur.rowcount
+            if imported:
+                add_seller_listings(cur, seller_id, imported)
+            invalidate_feed_cache(cur)
+    
+    return {'imported': imported, 'failed': len(errors), 'errors': errors}
+
+
+def map_product_row(row, now: datetime, raw_only: bool, origin=None) -> dict:
+    product = {
+        'id': row[0],
+        'title': row[1],
+        'price': row[2],
+        'category': row[3],
+        'description': row[4],
+        'location': row[5],
+        'image': row[6],
+        'views': row[7],
+        'verified': row[8],
+        'posted_at': row[9].isoformat(),
+        'seller': row[10],
+        'rating': float(row[11] or 0),
+        'city': row[13]
+    }
+    if origin is not None and row[14] is not None:
+        product['distance_km'] = round(distance_km(origin[0], origin[1], row[14], row[15]), 1)
+    if not raw_only:
+        product['posted'] = posted_label((now - row[9]).days)
+    return product
+
+
+def encode_cursor(sort_key, product_id: int) -> str:
+    '''Упаковывает позицию (ключ сортировки, id) последней строки страницы в непрозрачный курсор'''
+    key = sort_key.isoformat() if isinstance(sort_key, datetime) else repr(sort_key)
+    raw = f'{key}|{product_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def encode_nearby_cursor(distance: float, posted_at: datetime, product_id: int) -> str:
+    '''Курсор ленты «рядом»: (расстояние до города, posted_at, id) последней строки страницы'''
+    raw = f'{distance!r}|{posted_at.isoformat()}|{product_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_nearby_cursor(cursor: str) -> tuple:
+    '''Распаковывает курсор ленты «рядом»; ValueError при повреждённом значении'''
+    try:
+        distance, posted_at, product_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return float(distance), datetime.fromisoformat(posted_at), int(product_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def decode_cursor(cursor: str, key_type) -> tuple:
+    '''Распаковывает курсор обратно в (ключ сортировки, id); ValueError при повреждённом значении'''
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        key, product_id = raw.rsplit('|', 1)
+        key = datetime.fromisoformat(key) if key_type is datetime else key_type(key)
+        return key, int(product_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_limit(params: dict) -> int:
+    limit = int(params.get('limit') or DEFAULT_PAGE_SIZE)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def build_filters(params: dict) -> tuple:
+    '''Переводит фильтры из query-параметров в условия WHERE'''
+    conditions = []
+    args = []
+    
+    category = params.get('category')
+    if category:
+        conditions.append('p.category = %s')
+        args.append(category)
+    
+    if params.get('verified') in ('1', 'true'):
+        conditions.append('p.verified_seller = TRUE')
+    
+    min_price = params.get('min_price')
+    if min_price:
+        conditions.append('p.price >= %s')
+        args.append(int(min_price))
+    
+    max_price = params.get('max_price')
+    if max_price:
+        conditions.append('p.price <= %s')
+        args.append(int(max_price))
+    
+    city = params.get('city')
+    if city:
+        conditions.append('p.city = %s')
+        args.append(city)
+    
+    origin = parse_origin(params)
+    if origin is not None:
+        # Координаты объявлений берутся из справочника городов, поэтому радиус сводится к списку городов
+        conditions.append('p.city = ANY(%s)')
+        args.append(cities_within(*origin))
+    
+    location = params.get('location')
+    if location:
+        escaped = location.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions.append('p.location LIKE %s')
+        args.append(escaped + '%')
+    
+    return conditions, args
+
+
+def seller_source() -> tuple:
+    '''Колонки продавца и JOIN для ленты в зависимости от FEED_DENORMALIZED_SELLER'''
+    if FEED_DENORMALIZED_SELLER:
+        return 'p.seller_name, p.seller_rating', ''
+    return 'u.name as seller_name, u.rating as seller_rating', 'JOIN users u ON p.seller_id = u.id'
+
+
+def build_feed_query(params: dict) -> tuple:
+    '''Собирает SQL ленты товаров с фильтрами и keyset-пагинацией по (posted_at, id)'''
+    origin = parse_origin(params)
+    if origin is not None:
+        return build_nearby_query(params, origin)
+    conditions, args = build_filters(params)
+    
+    cursor = params.get('cursor')
+    if cursor:
+        posted_at, product_id = decode_cursor(cursor, datetime)
+        conditions.append('(p.posted_at, p.id) < (%s, %s)')
+        args.extend([posted_at, product_id])
+    
+    limit = parse_limit(params)
+    seller_columns, seller_join = seller_source()
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    query = f"""
+        SELECT 
+            p.id, p.title, p.price, p.category, p.description, 
+            p.location, p.image_emoji, p.views, p.verified_seller,
+            p.posted_at, {seller_columns},
+            p.posted_at as sort_key, p.city, p.lat, p.lon
+        FROM products p
+        {seller_join}
+        {where}
+        ORDER BY p.posted_at DESC, p.id DESC
+        LIMIT %s
+    """
+    # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+    args.append(limit + 1)
+    return query, args, limit
+
+
+def build_nearby_query(params: dict, origin: tuple) -> tuple:
+    '''Собирает SQL ленты «рядом»: от ближнего города к дальнему, внутри города — от новых к старым.
+    
+    Координаты объявлений — координаты города, поэтому расстояние одно на весь город. Для каждого
+    города из радиуса LATERAL берёт по индексу (city, posted_at, id) не больше limit + 1 строк, а общий
+    порядок и keyset-пагинация идут по (расстояние, posted_at, id). Расстояние — последняя колонка строки.
+    '''
+    cities = nearby_cities(*origin)
+    conditions, args = build_filters({k: v for k, v in params.items() if k not in ('lat', 'lon', 'radius_km')})
+    conditions.append('p.city = c.city')
+    
+    cursor = params.get('cursor')
+    if cursor:
+        distance, posted_at, product_id = decode_nearby_cursor(cursor)
+        # Города ближе курсора уже пройдены целиком
+        cities = [(dist, name) for dist, name in cities if dist >= distance]
+        # Дальние города читаются с начала; граница (posted_at, id) остаётся условием индекса
+        conditions.append("(p.posted_at, p.id) < (CASE WHEN c.distance = %s THEN %s ELSE 'infinity' END, %s)")
+        args.extend([distance, posted_at, product_id])
+    
+    limit = parse_limit(params)
+    seller_columns, seller_join = seller_source()
+    
+    query = f"""
+        SELECT nearby.*
+        FROM unnest(%s::text[], %s::float8[]) AS c(city, distance)
+        CROSS JOIN LATERAL (
+            SELECT 
+                p.id, p.title, p.price, p.category, p.description, 
+                p.location, p.image_emoji, p.views, p.verified_seller,
+                p.posted_at, {seller_columns},
+                p.posted_at as sort_key, p.city, p.lat, p.lon, c.distance
+            FROM products p
+            {seller_join}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY p.posted_at DESC, p.id DESC
+            LIMIT %s
+        ) nearby
+        ORDER BY nearby.distance, nearby.posted_at DESC, nearby.id DESC
+        LIMIT %s
+    """
+    args = [[name for _, name in cities], [dist for dist, _ in cities]] + args + [limit + 1, limit + 1]
+    return query, args, limit
+
+
+def feed_cursor(row, nearby: bool) -> str:
+    '''Курсор следующей страницы по последней строке ленты или поиска'''
+    if nearby:
+        return encode_nearby_cursor(row[16], row[9], row[0])
+    return encode_cursor(row[12], row[0])
+
+
+def price_bucket(price: int) -> int:
+    '''Номер корзины гистограммы, как width_bucket в product_price_bucket()'''
+    return bisect_right(PRICE_BUCKET_BOUNDS, price)
+
+
+def split_price_range(min_price, max_price) -> tuple:
+    '''Делит диапазон цен на целые корзины гистограммы и неполные края.
+    
+    Возвращает (first, last, edges): номера первой и последней целой корзины (first равен None, если целых
+    корзин нет; last равен None, если диапазон не ограничен сверху) и края (low, high) включительно,
+    которые приходится считать по самим объявлениям.
+    '''
+    low = min_price or 0
+    if low == 0 or low in PRICE_BUCKET_BOUNDS:
+        full_low = low
+    else:
+        index = bisect_right(PRICE_BUCKET_BOUNDS, low)
+        full_low = PRICE_BUCKET_BOUNDS[index] if index < len(PRICE_BUCKET_BOUNDS) else None
+    
+    if max_price is None:
+        full_high = None
+    elif max_price + 1 in PRICE_BUCKET_BOUNDS:
+        full_high = max_price + 1
+    else:
+        index = bisect_right(PRICE_BUCKET_BOUNDS, max_price) - 1
+        full_high = PRICE_BUCKET_BOUNDS[index] if index >= 0 else 0
+    
+    if full_low is None or (full_high is not None and full_low >= full_high):
+        return None, None, [(low, max_price)]
+    
+    edges = []
+    if low < full_low:
+        edges.append((low, full_low - 1))
+    if full_high is not None and full_high <= max_price:
+        edges.append((full_high, max_price))
+    last = price_bucket(full_high) - 1 if full_high is not None else None
+    return price_bucket(full_low), last, edges
+
+
+def live_facets_source(conditions: list) -> str:
+    '''Строки фасетов, посчитанные по самим объявлениям: по одной на объявление'''
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"""
+            SELECT p.category, COALESCE(p.verified_seller, FALSE) as verified_seller,
+                   product_price_bucket(p.price) as price_bucket, 1 as listings
+            FROM products p
+            {where}
+        """
+
+
+def build_facets_query(params: dict, live: bool = False) -> tuple:
+    '''Собирает SQL фасетов: категории, проверенные продавцы и гистограмма цен для текущих фильтров.
+    
+    Фильтры по категории, городу и радиусу считаются по product_facets. Цены, не совпадающие с границами
+    корзин, делятся на целые корзины из product_facets и края, которые дочитываются из products по индексу
+    цены. Поиск и префикс адреса требуют агрегации по самим объявлениям.
+    '''
+    q = (params.get('q') or '').strip()
+    use_aggregate = not live and not q and not params.get('location')
+    
+    if use_aggregate:
+        min_price = int(params['min_price']) if params.get('min_price') else None
+        max_price = int(params['max_price']) if params.get('max_price') else None
+        first, last, edges = split_price_range(min_price, max_price)
+        filters, filter_args = build_filters({k: v for k, v in params.items() if k not in ('min_price', 'max_price')})
+        parts = []
+        args = []
+        if first is not None:
+            conditions = list(filters)
+            args.extend(filter_args)
+            if first:
+                conditions.append('p.price_bucket >= %s')
+                args.append(first)
+            if last is not None:
+                conditions.append('p.price_bucket <= %s')
+                args.append(last)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            parts.append(f"""
+            SELECT p.category, p.verified_seller, p.price_bucket, p.listings
+            FROM product_facets p
+            {where}
+        """)
+        for low, high in edges:
+            conditions = list(filters)
+            args.extend(filter_args)
+            if low:
+                conditions.append('p.price >= %s')
+                args.append(low)
+            if high is not None:
+                conditions.append('p.price <= %s')
+                args.append(high)
+            parts.append(live_facets_source(conditions))
+        source = ' UNION ALL '.join(parts)
+    else:
+        conditions, args = build_filters(params)
+        if q:
+            conditions.insert(0, "(p.search_vector @@ websearch_to_tsquery('russian', %s) OR %s <%% p.title)")
+            args = [q, q] + args
+        source = live_facets_source(conditions)
+    
+    query = f"""
+        SELECT GROUPING(f.category, f.verified_seller, f.price_bucket),
+               f.category, f.verified_seller, f.price_bucket, SUM(f.listings)::bigint
+        FROM ({source}) f
+        GROUP BY GROUPING SETS ((f.category), (f.verified_seller), (f.price_bucket), ())
+    """
+    return query, args
+
+
+def map_facet_rows(rows) -> dict:
+    '''Раскладывает строки GROUPING SETS по разделам ответа; пустые корзины гистограммы сохраняются'''
+    total = 0
+    verified = 0
+    categories = []
+    histogram = [0] * (len(PRICE_BUCKET_BOUNDS) + 1)
+    
+    for grouping, category, verified_seller, bucket, count in rows:
+        if grouping == 0b011:
+            if count:
+                categories.append({'category': category, 'count': count})
+        elif grouping == 0b101:
+            if verified_seller:
+                verified = count
+        elif grouping == 0b110:
+            histogram[bucket] = count
+        elif grouping == 0b111:
+            total = count or 0
+    
+    categories.sort(key=lambda c: (-c['count'], c['category']))
+    bounds = (0,) + PRICE_BUCKET_BOUNDS + (None,)
+    return {
+        'total': total,
+        'categories': categories,
+        'verified_sellers': verified,
+        'price_histogram': [
+            {'min': bounds[i], 'max': bounds[i + 1], 'count': count}
+            for i, count in enumerate(histogram)
+        ]
+    }
+
+
+def build_search_query(params: dict) -> tuple:
+    '''Собирает SQL полнотекстового поиска с ранжированием и допуском опечаток через pg_trgm.
+    
+    Слова запроса, которых нет в словаре search_words, дополняются ближайшими к ним по триграммам
+    словами словаря. Ранжируются не все совпадения, а кандидаты: до SEARCH_CANDIDATES совпадений
+    среди SEARCH_WINDOW самых свежих объявлений, а если они не заполняют страницу (редкое слово) —
+    ещё до SEARCH_CANDIDATES любых совпадений по GIN, в том числе старых.
+    Частое слово совпадает с сотнями тысяч объявлений, и ранжирование их всех заняло бы секунды
+    на каждой странице; обход ленты по posted_at до N-го совпадения тоже не годится — для слова
+    без совпадений он читает весь индекс.
+    '''
+    q = params['q'].strip()
+    conditions, filter_args = build_filters(params)
+    filters = ''.join(f' AND {condition}' for condition in conditions)
+    
+    limit = parse_limit(params)
+    seller_columns, seller_join = seller_source()
+    
+    cursor_condition = ''
+    cursor_args = []
+    cursor = params.get('cursor')
+    if cursor:
+        rank, product_id = decode_cursor(cursor, float)
+        cursor_condition = 'WHERE (s.sort_key, s.id) < (%s, %s)'
+        cursor_args = [rank, product_id]
+    
+    query = f"""
+        WITH terms AS MATERIALIZED (
+            SELECT websearch_to_tsquery('russian', %s) || COALESCE((
+                SELECT websearch_to_tsquery('russian', string_agg(w.word, ' or '))
+                FROM unnest(tsvector_to_array(to_tsvector('simple', %s))) token
+                CROSS JOIN LATERAL (
+                    SELECT sw.word FROM search_words sw
+                    WHERE NOT EXISTS (SELECT 1 FROM search_words known WHERE known.word = token)
+                      AND sw.word %% token
+                    ORDER BY similarity(sw.word, token) DESC
+                    LIMIT 3
+                ) w
+            ), ''::tsquery) AS query
+        ), recent AS MATERIALIZED (
+            SELECT r.id FROM (
+                SELECT p.id, p.search_vector FROM products p
+                WHERE TRUE{filters}
+                ORDER BY p.posted_at DESC, p.id DESC
+                LIMIT %s
+            ) r
+            WHERE r.search_vector @@ (SELECT query FROM terms)
+            LIMIT %s
+        ), candidates AS (
+            SELECT id FROM recent
+            UNION
+            (SELECT p.id FROM products p
+             WHERE (SELECT COUNT(*) FROM recent) < %s
+               AND p.search_vector @@ (SELECT query FROM terms){filters}
+             LIMIT %s)
+        )
+        SELECT s.* FROM (
+            SELECT 
+                p.id, p.title, p.price, p.category, p.description, 
+                p.location, p.image_emoji, p.views, p.verified_seller,
+                p.posted_at, {seller_columns},
+                (ts_rank_cd(p.search_vector, websearch_to_tsquery('russian', %s))
+                    + word_similarity(%s, p.title))::float8 as sort_key,
+                p.city, p.lat, p.lon
+            FROM candidates c
+            JOIN products p ON p.id = c.id
+            {seller_join}
+        ) s
+        {cursor_condition}
+        ORDER BY s.sort_key DESC, s.id DESC
+        LIMIT %s
+    """
+    args = ([q, q] + filter_args + [SEARCH_WINDOW, SEARCH_CANDIDATES, limit + 1]
+            + filter_args + [SEARCH_CANDIDATES, q, q] + cursor_args + [limit + 1])
+    return query, args, limit
+
+
+def handle_request(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {'statusCode': 200, 'headers': PREFLIGHT_HEADERS, 'body': ''}
+    
+    conn = None
+    cur = None
+    
+    try:
+        with measure('connect'):
+            conn = get_connection()
         cur = conn.cursor()
         
         if method == 'GET':
-            cur.execute("""
-                SELECT 
-                    p.id, p.title, p.price, p.category, p.description, 
-                    p.location, p.image_emoji, p.views, p.verified_seller,
-                    p.posted_at, u.name as seller_name, u.rating as seller_rating
-                FROM products p
-                JOIN users u ON p.seller_id = u.id
-                ORDER BY p.posted_at DESC
-            """)
+            query_params = event.get('queryStringParameters', {}) or {}
             
-            products = []
-            for row in cur.fetchall():
-                posted = row[9]
-                now = datetime.now()
-                diff = now - posted
+            if query_params.get('facets'):
+                try:
+                    query, args = build_facets_query(query_params)
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': str(e)})
+                    }
                 
-                if diff.days == 0:
-                    posted_str = 'Сегодня'
-                elif diff.days == 1:
-                    posted_str = '1 день назад'
-                elif diff.days < 7:
-                    posted_str = f'{diff.days} дня назад' if diff.days < 5 else f'{diff.days} дней назад'
-                else:
-                    posted_str = f'{diff.days // 7} недели назад' if diff.days < 14 else f'{diff.days // 7} недель назад'
+                execute_prepared(cur, 'feed_version', "SELECT version FROM cache_versions WHERE name = %s",
+                                 (FEED_CACHE_VERSION_KEY,))
+                version = cur.fetchone()[0]
+                feed_cache = get_feed_cache()
+                cache_key = feed_cache_key(query_params, version)
+                body = feed_cache.get(cache_key)
                 
-                products.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'price': row[2],
-                    'category': row[3],
-                    'description': row[4],
-                    'location': row[5],
-                    'image': row[6],
-                    'views': row[7],
-                    'verified': row[8],
-                    'posted': posted_str,
-                    'seller': row[10],
-                    'rating': float(row[11])
-                })
+                if body is None:
+                    cur.execute(query, args)
+                    rows = cur.fetchall()
+                    record_rows(len(rows))
+                    facets = map_facet_rows(rows)
+                    with measure('serialize'):
+                        body = dumps(facets)
+                    feed_cache.set(cache_key, body)
+                
+                return cached_json_response(body, event)
             
-            cur.close()
-            conn.close()
+            searching = bool((query_params.get('q') or '').strip())
+            try:
+                if searching:
+                    query, args, limit = build_search_query(query_params)
+                else:
+                    query, args, limit = build_feed_query(query_params)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'error': str(e)})
+                }
             
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'products': products})
-            }
+            execute_prepared(cur, 'feed_version', "SELECT version FROM cache_versions WHERE name = %s",
+                             (FEED_CACHE_VERSION_KEY,))
+            version = cur.fetchone()[0]
+            feed_cache = get_feed_cache()
+            cache_key = feed_cache_key(query_params, version)
+            body = feed_cache.get(cache_key)
+            
+            if body is None:
+                raw_only = query_params.get('posted_format') == 'raw'
+                now = datetime.now()
+                origin = None
+                if query_params.get('lat') and query_params.get('lon'):
+                    origin = (float(query_params['lat']), float(query_params['lon']))
+                
+                rows = fetch_rows(conn, query, args)
+                with measure('serialize'):
+                    products, last_row = encode_json_array(
+                        rows,
+                        lambda row: map_product_row(row, now, raw_only, origin),
+                        limit
+                    )
+                    # Без поиска лента с координатами отсортирована по расстоянию
+                    next_cursor = feed_cursor(last_row, origin is not None and not searching) if last_row else None
+                    
+                    body = '{"products": ' + products + ', "next_cursor": ' + dumps(next_cursor) + '}'
+                feed_cache.set(cache_key, body)
+            
+            return cached_json_response(body, event)
         
         elif method == 'POST':
+            query_params = event.get('queryStringParameters', {}) or {}
+            import_format = query_params.get('import')
+            
+            if import_format:
+                seller_id = query_params.get('seller_id') or ''
+                # isdigit() пропускает «²», на котором int() падает; isdecimal() — только то, что int() разберёт
+                if import_format not in IMPORT_FORMATS or not (seller_id.isdecimal() and is_id(int(seller_id))):
+                    return {
+                        'statusCode': 400,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'Invalid import request'})
+                    }
+                
+                cur.execute("SELECT 1 FROM users WHERE id = %s", (int(seller_id),))
+                if not cur.fetchone():
+                    return {
+                        'statusCode': 404,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'Seller not found'})
+                    }
+                
+                payload = event.get('body') or ''
+                if event.get('isBase64Encoded'):
+                    payload = base64.b64decode(payload).decode('utf-8')
+                
+                idempotency_key = get_idempotency_key(event)
+                if idempotency_key:
+                    replay = claim_idempotency_key(cur, 'products:import', idempotency_key,
+                                                   f'{import_format}:{seller_id}:{payload}')
+                    if replay:
+                        return replay
+                
+                result = import_products(conn, import_format, payload, int(seller_id))
+                
+                response = save_idempotent_response(cur, 'products:import', idempotency_key, {
+                    'statusCode': 200,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps(result)
+                })
+                conn.commit()
+                return response
+            
             body = json.loads(event.get('body', '{}'))
             
             title = body.get('title')
@@ -91,50 +1439,92 @@ def handler(event: dict, context) -> dict:
             if not all([title, price, category, location]):
                 return {
                     'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': JSON_HEADERS,
                     'body': json.dumps({'error': 'Missing required fields'})
                 }
             
-            category_emojis = {
-                'Электроника': '📱',
-                'Одежда': '🧥',
-                'Мебель': '🛋️',
-                'Спорт': '🚴',
-                'Детские товары': '🍼',
-                'Авто': '🚗'
-            }
-            emoji = category_emojis.get(category, '📦')
+            idempotency_key = get_idempotency_key(event)
+            if idempotency_key:
+                replay = claim_idempotency_key(cur, 'products', idempotency_key, event.get('body') or '')
+                if replay:
+                    return replay
+            
+            emoji = CATEGORY_EMOJIS.get(category, DEFAULT_EMOJI)
+            city, lat, lon = geocode_location(location)
             
             cur.execute("""
-                INSERT INTO products (title, price, category, description, location, image_emoji, seller_id, verified_seller)
-                VALUES (%s, %s, %s, %s, %s, %s, 1, TRUE)
+                INSERT INTO products (title, price, category, description, location, image_emoji,
+                                      seller_id, verified_seller, seller_name, seller_rating, city, lat, lon)
+                SELECT %s, %s, %s, %s, %s, %s, u.id, TRUE, u.name, u.rating, %s, %s, %s
+                FROM users u WHERE u.id = 1
                 RETURNING id
-            """, (title, price, category, description, location, emoji))
+            """, (title, price, category, description, location, emoji, city, lat, lon))
             
             product_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
+            add_seller_listings(cur, 1, 1)
+            invalidate_feed_cache(cur)
             
-            return {
+            response = save_idempotent_response(cur, 'products', idempotency_key, {
                 'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
+                'headers': JSON_HEADERS,
                 'body': json.dumps({'id': product_id, 'message': 'Product created successfully'})
+            })
+            conn.commit()
+            return response
+        
+        elif method == 'PUT':
+            body = json.loads(event.get('body', '{}'))
+            
+            product_id = body.get('product_id')
+            
+            # true попал бы в буфер под ключом 1, и каждый следующий flush падал бы на integer = boolean
+            if body.get('action') != 'view' or not is_id(product_id):
+                return {
+                    'statusCode': 400,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'error': 'Invalid request'})
+                }
+            
+            if record_view(product_id):
+                flush_views_safely(conn)
+            
+            return {
+                'statusCode': 202,
+                'headers': JSON_HEADERS,
+                'body': json.dumps({'success': True})
             }
         
         else:
             return {
                 'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': JSON_HEADERS,
                 'body': json.dumps({'error': 'Method not allowed'})
             }
             
-    except Exception as e:
+    except psycopg2.pool.PoolError:
         return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)})
+            'statusCode': 503,
+            'headers': {**JSON_HEADERS, 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Service busy, retry later'})
         }
+    
+    except Exception:
+        return internal_error(context)
+    
+    finally:
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            release_connection(conn)
+
+
+def handler(event: dict, context) -> dict:
+    if not INSTRUMENTATION_ENABLED:
+        return handle_request(event, context)
+    metrics = RequestMetrics()
+    token = _metrics.set(metrics)
+    try:
+        response = handle_request(event, context)
+    finally:
+        _metrics.reset(token)
+    return metrics.finish(event, context, response)
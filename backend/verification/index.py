@@ -1,29 +1,563 @@
 """
 API для системы верификации пользователей: подача заявок, проверка статуса
 """
+import base64
+import hashlib
 import json
 import os
+import random
+import threading
+import time
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from datetime import datetime
+from decimal import Decimal
 
-def handler(event: dict, context) -> dict:
-    method = event.get('httpMethod', 'GET')
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '5'))
+CONNECTION_MAX_AGE = 300
+IDLE_CHECK_INTERVAL = 30
+# Сколько запрос ждёт свободное соединение, прежде чем ответить 503
+POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '10'))
+# Подготовленные запросы живут в сессии, поэтому их отключают за пулером в режиме транзакций
+PREPARED_STATEMENTS = os.environ.get('PREPARED_STATEMENTS', '1') == '1'
+
+FUNCTION_NAME = 'verification'
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '500'))
+EXPLAIN_SAMPLE_RATE = float(os.environ.get('EXPLAIN_SAMPLE_RATE', '0'))
+NULL_PHASE = nullcontext()
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+MAX_CLAIM_SIZE = 20
+CLAIM_TIMEOUT_MINUTES = 15
+MAX_REVIEW_BATCH = 10000
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# id в таблицах — SERIAL (INTEGER)
+MAX_ID = 2147483647
+
+APPROVED_TITLE = 'Верификация одобрена'
+APPROVED_MESSAGE = ('Поздравляем! Ваша заявка на верификацию одобрена. Теперь у вас есть бейдж '
+                    '"Проверенный продавец" и ваши объявления получат приоритет в поиске!')
+REJECTED_TITLE = 'Заявка отклонена'
+REJECTED_MESSAGE = ('К сожалению, ваша заявка на верификацию отклонена. Причина: {reason}. '
+                    'Вы можете подать заявку повторно после исправления указанных недостатков.')
+
+_pool = None
+_pool_lock = threading.Lock()
+_metrics = ContextVar('metrics', default=None)
+_orjson = None
+
+
+# ---- Общие блоки функций: начало ----
+# Функции деплоятся по отдельности, поэтому всё до конца области скопировано в их index.py;
+# tests/test_shared_blocks.py сверяет копии, правьте их вместе.
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    '''Соединение пула, которое само хранит время создания, последнего использования
+    и имена подготовленных на нём запросов: они живут и закрываются вместе с соединением
+    '''
     
-    if method == 'OPTIONS':
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.born = self.last_used = time.monotonic()
+        self.prepared = set()
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    '''Пул, который ждёт освободившееся соединение вместо PoolError и не закрывает возвращённые.
+    
+    Соединения открываются лениво, но остаются открытыми, пока их не больше maxconn,
+    поэтому после всплеска нагрузки тёплый экземпляр держит весь пул.
+    '''
+    
+    def __init__(self, maxconn: int, timeout: float, *args, **kwargs):
+        super().__init__(1, maxconn, *args, **kwargs)
+        self.minconn = maxconn
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+    
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError('connection pool exhausted')
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+def get_pool():
+    '''Лениво создаёт пул соединений, переживающий тёплые вызовы функции'''
+    global _pool
+    pool = _pool
+    if pool is None or pool.closed:
+        # Параллельные первые запросы иначе создали бы по своему пулу и вернули соединение не в тот
+        with _pool_lock:
+            if _pool is None or _pool.closed:
+                cursor_factory = TimedCursor if INSTRUMENTATION_ENABLED else None
+                _pool = BlockingConnectionPool(POOL_MAX_SIZE, POOL_WAIT_TIMEOUT, os.environ.get('DATABASE_URL'),
+                                               connection_factory=PooledConnection, cursor_factory=cursor_factory)
+            pool = _pool
+    return pool
+
+
+def get_connection():
+    '''Берёт соединение из пула, заменяя закрытые, устаревшие и оборванные'''
+    pool = get_pool()
+    for _ in range(POOL_MAX_SIZE + 1):
+        conn = pool.getconn()
+        now = time.monotonic()
+        if not conn.closed and now - conn.born < CONNECTION_MAX_AGE:
+            if now - conn.last_used < IDLE_CHECK_INTERVAL:
+                return conn
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+                return conn
+            except psycopg2.Error:
+                pass
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+
+def release_connection(conn) -> None:
+    '''Возвращает соединение в пул, откатывая незавершённую транзакцию'''
+    broken = bool(conn.closed)
+    if not broken:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+    if not broken:
+        conn.last_used = time.monotonic()
+    get_pool().putconn(conn, close=broken)
+
+
+def execute_prepared(cur, name: str, query: str, args: tuple) -> None:
+    '''Выполняет горячий запрос через PREPARE/EXECUTE: план строится один раз на соединение пула
+    и переиспользуется тёплыми вызовами. Запрос пишется с %s, как для cur.execute.
+    '''
+    if not PREPARED_STATEMENTS:
+        cur.execute(query, args)
+        return
+    prepared = cur.connection.prepared
+    if name not in prepared:
+        cur.execute(f'PREPARE {name} AS ' + query % tuple(f'${i}' for i in range(1, len(args) + 1)))
+        prepared.add(name)
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+
+
+def dumps(value) -> str:
+    '''JSON-кодирование через orjson, если он установлен, иначе стандартным json.
+    
+    orjson импортируется при первом вызове: OPTIONS и POST на холодном старте его не ждут.
+    '''
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson as _orjson
+        except ImportError:
+            _orjson = False
+    if _orjson:
+        return _orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+def fetch_rows(conn, query: str, args) -> list:
+    '''Читает страницу обычным курсором за один запрос; время запроса TimedCursor относит к фазе query.
+    
+    Все выборки ограничены страницей (limit + 1 строк, не больше MAX_PAGE_SIZE + 1), поэтому серверный
+    курсор с лишними DECLARE/FETCH/CLOSE не нужен.
+    '''
+    with conn.cursor() as cur:
+        cur.execute(query, args)
+        return cur.fetchall()
+
+
+def encode_json_array(rows, map_row, limit: int) -> tuple:
+    '''Кодирует строки в JSON-массив по одной, не собирая список словарей; возвращает (массив, последняя строка, если есть продолжение)'''
+    pieces = []
+    overflow = None
+    last_row = None
+    for row in rows:
+        if len(pieces) == limit:
+            overflow = last_row
+            break
+        pieces.append(dumps(map_row(row)))
+        last_row = row
+    record_rows(len(pieces))
+    return '[' + ', '.join(pieces) + ']', overflow
+
+
+def is_id(value) -> bool:
+    '''Целый id из JSON-тела; bool — подкласс int, поэтому true/false отсекаются явно'''
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= MAX_ID
+
+
+def get_idempotency_key(event: dict):
+    '''Значение заголовка Idempotency-Key без учёта регистра имени; None, если клиент его не прислал'''
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            return value.strip()
+    return None
+
+
+def claim_idempotency_key(cur, scope: str, key: str, payload: str):
+    '''Резервирует ключ в текущей транзакции; возвращает готовый ответ, если запрос с этим ключом уже выполнен.
+    
+    Параллельный дубль ждёт на первичном ключе idempotency_keys, пока первая транзакция
+    не завершится, и затем получает её сохранённый ответ. None означает, что запрос нужно выполнить.
+    '''
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
         return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': ''
+            'statusCode': 400,
+            'headers': JSON_HEADERS,
+            'body': json.dumps({'error': 'Invalid Idempotency-Key'})
         }
     
-    dsn = os.environ.get('DATABASE_URL')
+    request_hash = hashlib.sha256(payload.encode()).hexdigest()
+    cur.execute("""
+        INSERT INTO idempotency_keys (scope, key, request_hash)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (scope, key) DO NOTHING
+        RETURNING 1
+    """, (scope, key, request_hash))
+    if cur.fetchone():
+        return None
+    
+    cur.execute("""
+        SELECT request_hash, status_code, response_body FROM idempotency_keys
+        WHERE scope = %s AND key = %s
+    """, (scope, key))
+    stored_hash, status_code, response_body = cur.fetchone()
+    if stored_hash != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': JSON_HEADERS,
+            'body': json.dumps({'error': 'Idempotency-Key was used with a different request'})
+        }
+    return {
+        'statusCode': status_code,
+        'headers': {**JSON_HEADERS, 'Idempotent-Replayed': 'true'},
+        'body': response_body
+    }
+
+
+def save_idempotent_response(cur, scope: str, key, response: dict) -> dict:
+    '''Запоминает ответ под ключом в той же транзакции, что и сама запись'''
+    if key:
+        cur.execute("""
+            UPDATE idempotency_keys SET status_code = %s, response_body = %s
+            WHERE scope = %s AND key = %s
+        """, (response['statusCode'], response['body'], scope, key))
+    return response
+
+
+class RequestMetrics:
+    '''Тайминги фаз (connect, query, serialize), число строк и размер ответа одного запроса'''
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.rows = 0
+    
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+    
+    def finish(self, event: dict, context, response: dict) -> dict:
+        total = time.perf_counter() - self.started
+        body = response.get('body') or ''
+        timing = ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items())
+        response['headers'] = dict(response.get('headers') or {})
+        response['headers']['Server-Timing'] = f'{timing}, total;dur={total * 1000:.1f}'.lstrip(', ')
+        response['headers']['Timing-Allow-Origin'] = '*'
+        log_event({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'duration_ms': round(total * 1000, 2),
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+            'rows': self.rows,
+            'bytes': len(body.encode('utf-8'))
+        })
+        return response
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    '''Курсор, записывающий время запросов в метрики и логирующий медленные запросы'''
+    
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics = _metrics.get()
+            if metrics is not None:
+                metrics.add('query', elapsed)
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                log_slow_query(self, query, vars, elapsed)
+
+
+def log_event(payload: dict) -> None:
+    print(json.dumps(payload, ensure_ascii=False, default=str), flush=True)
+
+
+def log_slow_query(cur, query, vars, elapsed: float) -> None:
+    '''Логирует медленный запрос и с вероятностью EXPLAIN_SAMPLE_RATE прикладывает его план'''
+    payload = {
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'duration_ms': round(elapsed * 1000, 2),
+        'query': ' '.join(str(query).split())[:1000]
+    }
+    conn = cur.connection
+    status = conn.info.transaction_status
+    # PREPARE, CREATE TEMP TABLE и другие служебные команды EXPLAIN не принимает
+    statement = (str(query).split(None, 1) or [''])[0].upper()
+    if (random.random() < EXPLAIN_SAMPLE_RATE and cur.name is None
+            and statement in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'EXECUTE')
+            and status != psycopg2.extensions.TRANSACTION_STATUS_INERROR):
+        # EXPLAIN идёт в транзакции запроса: точка сохранения не даёт его ошибке оборвать транзакцию
+        savepoint = status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as explain_cur:
+            if savepoint:
+                explain_cur.execute('SAVEPOINT explain_sample')
+            try:
+                explain_cur.execute('EXPLAIN (FORMAT JSON) ' + str(query), vars)
+                payload['plan'] = explain_cur.fetchone()[0]
+            except psycopg2.Error as e:
+                payload['explain_error'] = str(e)
+                if savepoint:
+                    explain_cur.execute('ROLLBACK TO SAVEPOINT explain_sample')
+            if savepoint:
+                explain_cur.execute('RELEASE SAVEPOINT explain_sample')
+    log_event(payload)
+
+
+def measure(phase: str):
+    '''Контекст замера фазы; при выключенной инструментации — пустой контекст'''
+    metrics = _metrics.get()
+    return metrics.phase(phase) if metrics is not None else NULL_PHASE
+
+
+def record_rows(count: int) -> None:
+    '''Добавляет к метрикам число строк, попавших в ответ'''
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.rows += count
+
+
+def internal_error(context) -> dict:
+    '''Логирует необработанное исключение и отвечает 500 без внутренних деталей'''
+    import traceback
+    
+    request_id = getattr(context, 'request_id', None)
+    log_event({
+        'event': 'error',
+        'function': FUNCTION_NAME,
+        'request_id': request_id,
+        'traceback': traceback.format_exc()
+    })
+    return {
+        'statusCode': 500,
+        'headers': JSON_HEADERS,
+        'body': json.dumps({'error': 'Internal server error', 'request_id': request_id})
+    }
+
+
+# ---- Общие блоки функций: конец ----
+
+
+def encode_cursor(value) -> str:
+    return base64.urlsafe_b64encode(str(value).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode()
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_moderator_id(value):
+    '''id модератора из запроса: None, если не передан; ValueError, если это не id в пределах INT4'''
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and value.isdecimal():
+        value = int(value)
+    if not is_id(value):
+        raise ValueError('Invalid moderator_id')
+    return value
+
+
+def build_queue_query(params: dict) -> tuple:
+    '''Собирает SQL очереди модерации: по возрасту или по приоритету, оба с keyset-пагинацией.
+    
+    Заявки, захваченные другим модератором и ещё не истёкшие, в очередь не попадают.
+    '''
+    limit = max(1, min(int(params.get('limit') or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    moderator_id = parse_moderator_id(params.get('moderator_id'))
+    cursor = params.get('cursor')
+    priority = params.get('order') == 'priority'
+    condition = ''
+    args = [CLAIM_TIMEOUT_MINUTES, moderator_id]
+    
+    if priority:
+        # Сначала продавцы с высоким рейтингом и большим числом объявлений, затем самые старые заявки.
+        # Рейтинг и число объявлений берутся с обратным знаком, чтобы весь ключ шёл по возрастанию
+        order_key = '(-COALESCE(u.rating, -1), -COALESCE(s.listings_count, 0), vr.submitted_at, vr.id)'
+        if cursor:
+            rating, listings_count, submitted_at, request_id = decode_cursor(cursor).split('|')
+            args.extend([Decimal(rating), int(listings_count), datetime.fromisoformat(submitted_at),
+                         int(request_id)])
+            condition = f'AND {order_key} > (%s, %s, %s, %s)'
+        order_by = order_key[1:-1]
+    else:
+        if cursor:
+            submitted_at, request_id = decode_cursor(cursor).rsplit('|', 1)
+            args.extend([datetime.fromisoformat(submitted_at), int(request_id)])
+            condition = 'AND (vr.submitted_at, vr.id) > (%s, %s)'
+        order_by = 'vr.submitted_at ASC, vr.id ASC'
+    
+    query = f"""
+        SELECT 
+            vr.id, vr.user_id, vr.status, vr.phone, vr.email,
+            vr.submitted_at, u.name, u.rating, vr.claimed_by,
+            COALESCE(s.listings_count, 0) AS listings_count
+        FROM verification_requests vr
+        JOIN users u ON vr.user_id = u.id
+        LEFT JOIN seller_stats s ON s.seller_id = vr.user_id
+        WHERE vr.status = 'pending'
+          AND (vr.claimed_by IS NULL
+               OR vr.claimed_at < NOW() - %s * INTERVAL '1 minute'
+               OR vr.claimed_by = %s)
+          {condition}
+        ORDER BY {order_by}
+        LIMIT %s
+    """
+    return query, args + [limit + 1], limit, priority
+
+
+def queue_cursor(row, priority: bool) -> str:
+    '''Курсор следующей страницы из последней строки: значения ключа сортировки очереди'''
+    if priority:
+        rating = -(row[7] if row[7] is not None else -1)
+        return encode_cursor(f'{rating}|{-row[9]}|{row[5].isoformat()}|{row[0]}')
+    return encode_cursor(f'{row[5].isoformat()}|{row[0]}')
+
+
+def map_queue_row(row) -> dict:
+    return {
+        'id': row[0],
+        'user_id': row[1],
+        'status': row[2],
+        'phone': row[3],
+        'email': row[4],
+        'submitted_at': row[5].isoformat() if row[5] else None,
+        'user_name': row[6],
+        'user_rating': float(row[7]) if row[7] else 0.0,
+        'claimed_by': row[8],
+        'listings_count': row[9]
+    }
+
+
+def review_requests(cur, request_ids: list, action: str, rejection_reason, moderator_id) -> int:
+    '''Одобряет или отклоняет заявки одним набором UPDATE и сразу создаёт уведомления заявителям.
+    
+    Заявки, захваченные другим модератором, пропускаются, пока захват не истёк.
+    '''
+    if action == 'approve':
+        cur.execute("""
+            WITH reviewed AS (
+                UPDATE verification_requests
+                SET status = 'approved', reviewed_at = NOW(), reviewed_by = %s
+                WHERE id = ANY(%s::int[]) AND status = 'pending'
+                  AND (claimed_by IS NULL OR claimed_by = %s OR claimed_at < NOW() - %s * INTERVAL '1 minute')
+                RETURNING user_id
+            ), sellers AS (
+                SELECT DISTINCT user_id FROM reviewed
+            ), verified_users AS (
+                UPDATE users
+                SET verified = TRUE, verification_level = 'verified'
+                WHERE id IN (SELECT user_id FROM sellers)
+            ), verified_products AS (
+                UPDATE products
+                SET verified_seller = TRUE
+                WHERE seller_id IN (SELECT user_id FROM sellers) AND verified_seller IS NOT TRUE
+            ), notified AS (
+                INSERT INTO notifications (user_id, type, title, message)
+                SELECT user_id, 'verification_approved', %s, %s FROM sellers
+            )
+            SELECT COUNT(*) FROM reviewed
+        """, (moderator_id, request_ids, moderator_id, CLAIM_TIMEOUT_MINUTES, APPROVED_TITLE, APPROVED_MESSAGE))
+        reviewed = cur.fetchone()[0]
+        
+        if reviewed:
+            # Сбрасываем кэш ленты товаров, чтобы бейдж продавца обновился сразу
+            cur.execute("""
+                UPDATE cache_versions SET version = version + 1 WHERE name = 'products_feed'
+            """)
+        return reviewed
+    
+    cur.execute("""
+        WITH reviewed AS (
+            UPDATE verification_requests
+            SET status = 'rejected', reviewed_at = NOW(), reviewed_by = %s, rejection_reason = %s
+            WHERE id = ANY(%s::int[]) AND status = 'pending'
+              AND (claimed_by IS NULL OR claimed_by = %s OR claimed_at < NOW() - %s * INTERVAL '1 minute')
+            RETURNING user_id
+        ), notified AS (
+            INSERT INTO notifications (user_id, type, title, message)
+            SELECT DISTINCT user_id, 'verification_rejected', %s, %s FROM reviewed
+        )
+        SELECT COUNT(*) FROM reviewed
+    """, (moderator_id, rejection_reason, request_ids, moderator_id, CLAIM_TIMEOUT_MINUTES,
+          REJECTED_TITLE, REJECTED_MESSAGE.format(reason=rejection_reason or 'не указана')))
+    return cur.fetchone()[0]
+
+
+def handle_request(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {'statusCode': 200, 'headers': PREFLIGHT_HEADERS, 'body': ''}
+    
+    conn = None
+    cur = None
     
     try:
-        conn = psycopg2.connect(dsn)
+        with measure('connect'):
+            conn = get_connection()
         cur = conn.cursor()
         
         if method == 'GET':
@@ -31,7 +565,7 @@ def handler(event: dict, context) -> dict:
             user_id = query_params.get('user_id')
             
             if user_id:
-                cur.execute("""
+                execute_prepared(cur, 'verification_status', """
                     SELECT 
                         vr.id, vr.status, vr.phone, vr.email, 
                         vr.document_type, vr.submitted_at, vr.reviewed_at,
@@ -75,59 +609,37 @@ def handler(event: dict, context) -> dict:
                             'verification_level': user_row[2]
                         }
                     else:
-                        cur.close()
-                        conn.close()
                         return {
                             'statusCode': 404,
-                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'headers': JSON_HEADERS,
                             'body': json.dumps({'error': 'User not found'})
                         }
                 
-                cur.close()
-                conn.close()
-                
                 return {
                     'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
+                    'headers': JSON_HEADERS,
                     'body': json.dumps(result)
                 }
             else:
-                cur.execute("""
-                    SELECT 
-                        vr.id, vr.user_id, vr.status, vr.phone, vr.email,
-                        vr.submitted_at, u.name, u.rating
-                    FROM verification_requests vr
-                    JOIN users u ON vr.user_id = u.id
-                    WHERE vr.status = 'pending'
-                    ORDER BY vr.submitted_at ASC
-                """)
+                try:
+                    query, args, limit, priority = build_queue_query(query_params)
+                except (ValueError, ArithmeticError):
+                    return {
+                        'statusCode': 400,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'Invalid pagination parameters'})
+                    }
                 
-                requests = []
-                for row in cur.fetchall():
-                    requests.append({
-                        'id': row[0],
-                        'user_id': row[1],
-                        'status': row[2],
-                        'phone': row[3],
-                        'email': row[4],
-                        'submitted_at': row[5].isoformat() if row[5] else None,
-                        'user_name': row[6],
-                        'user_rating': float(row[7]) if row[7] else 0.0
-                    })
+                rows = fetch_rows(conn, query, args)
+                with measure('serialize'):
+                    requests, last_row = encode_json_array(rows, map_queue_row, limit)
                 
-                cur.close()
-                conn.close()
+                next_cursor = queue_cursor(last_row, priority) if last_row is not None else None
                 
                 return {
                     'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'requests': requests})
+                    'headers': JSON_HEADERS,
+                    'body': '{"requests": ' + requests + ', "next_cursor": ' + dumps(next_cursor) + '}'
                 }
         
         elif method == 'POST':
@@ -142,51 +654,47 @@ def handler(event: dict, context) -> dict:
             if not all([user_id, phone, email, document_type, document_number]):
                 return {
                     'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': JSON_HEADERS,
                     'body': json.dumps({'error': 'Missing required fields'})
                 }
             
+            idempotency_key = get_idempotency_key(event)
+            if idempotency_key:
+                replay = claim_idempotency_key(cur, 'verification', idempotency_key, event.get('body') or '')
+                if replay:
+                    return replay
+            
+            # Уникальный частичный индекс гарантирует одну заявку на рассмотрении даже при параллельной подаче
             cur.execute("""
-                SELECT id FROM verification_requests 
-                WHERE user_id = %s AND status = 'pending'
-            """, (user_id,))
+                WITH inserted AS (
+                    INSERT INTO verification_requests 
+                    (user_id, phone, email, document_type, document_number, status)
+                    VALUES (%s, %s, %s, %s, %s, 'pending')
+                    ON CONFLICT (user_id) WHERE status = 'pending' DO NOTHING
+                    RETURNING id, user_id
+                ), contacts AS (
+                    UPDATE users 
+                    SET phone = %s, email = %s
+                    WHERE id IN (SELECT user_id FROM inserted)
+                )
+                SELECT id FROM inserted
+            """, (user_id, phone, email, document_type, document_number, phone, email))
             
-            if cur.fetchone():
-                cur.close()
-                conn.close()
+            row = cur.fetchone()
+            if row is None:
                 return {
                     'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': JSON_HEADERS,
                     'body': json.dumps({'error': 'Pending request already exists'})
                 }
             
-            cur.execute("""
-                INSERT INTO verification_requests 
-                (user_id, phone, email, document_type, document_number, status)
-                VALUES (%s, %s, %s, %s, %s, 'pending')
-                RETURNING id
-            """, (user_id, phone, email, document_type, document_number))
-            
-            request_id = cur.fetchone()[0]
-            
-            cur.execute("""
-                UPDATE users 
-                SET phone = %s, email = %s
-                WHERE id = %s
-            """, (phone, email, user_id))
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            return {
+            response = save_idempotent_response(cur, 'verification', idempotency_key, {
                 'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'id': request_id, 'message': 'Verification request submitted'})
-            }
+                'headers': JSON_HEADERS,
+                'body': json.dumps({'id': row[0], 'message': 'Verification request submitted'})
+            })
+            conn.commit()
+            return response
         
         elif method == 'PUT':
             body = json.loads(event.get('body', '{}'))
@@ -195,75 +703,154 @@ def handler(event: dict, context) -> dict:
             action = body.get('action')
             rejection_reason = body.get('rejection_reason')
             
-            if not request_id or action not in ['approve', 'reject']:
+            try:
+                moderator_id = parse_moderator_id(body.get('moderator_id'))
+            except ValueError:
                 return {
                     'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid request'})
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'error': 'Invalid moderator_id'})
                 }
             
-            cur.execute("SELECT user_id FROM verification_requests WHERE id = %s", (request_id,))
-            result = cur.fetchone()
-            
-            if not result:
-                cur.close()
-                conn.close()
+            if action == 'claim':
+                try:
+                    count = max(1, min(int(body.get('count') or 1), MAX_CLAIM_SIZE))
+                except (TypeError, ValueError):
+                    return {
+                        'statusCode': 400,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'Invalid count'})
+                    }
+                
+                if moderator_id is None:
+                    return {
+                        'statusCode': 400,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'moderator_id is required'})
+                    }
+                
+                # SKIP LOCKED позволяет нескольким модераторам разбирать очередь без пересечений
+                cur.execute("""
+                    WITH claimable AS (
+                        SELECT id FROM verification_requests
+                        WHERE status = 'pending'
+                          AND (claimed_at IS NULL
+                               OR claimed_at < NOW() - %s * INTERVAL '1 minute'
+                               OR claimed_by = %s)
+                        ORDER BY submitted_at ASC, id ASC
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE verification_requests vr
+                    SET claimed_by = %s, claimed_at = NOW()
+                    FROM claimable
+                    WHERE vr.id = claimable.id
+                    RETURNING vr.id
+                """, (CLAIM_TIMEOUT_MINUTES, moderator_id, count, moderator_id))
+                claimed_ids = [row[0] for row in cur.fetchall()]
+                
+                cur.execute("""
+                    SELECT 
+                        vr.id, vr.user_id, vr.status, vr.phone, vr.email,
+                        vr.submitted_at, u.name, u.rating, vr.claimed_by,
+                        COALESCE(s.listings_count, 0) AS listings_count
+                    FROM verification_requests vr
+                    JOIN users u ON vr.user_id = u.id
+                    LEFT JOIN seller_stats s ON s.seller_id = vr.user_id
+                    WHERE vr.id = ANY(%s)
+                    ORDER BY vr.submitted_at ASC, vr.id ASC
+                """, (claimed_ids,))
+                requests = [map_queue_row(row) for row in cur.fetchall()]
+                record_rows(len(requests))
+                conn.commit()
+                
                 return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Request not found'})
+                    'statusCode': 200,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'requests': requests})
                 }
             
-            user_id = result[0]
+            request_ids = body.get('request_ids')
             
-            if action == 'approve':
-                cur.execute("""
-                    UPDATE verification_requests 
-                    SET status = 'approved', reviewed_at = NOW()
-                    WHERE id = %s
-                """, (request_id,))
+            if isinstance(request_ids, list) and action in ['approve', 'reject']:
+                if not request_ids or len(request_ids) > MAX_REVIEW_BATCH or not all(is_id(i) for i in request_ids):
+                    return {
+                        'statusCode': 400,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'Invalid request_ids'})
+                    }
                 
-                cur.execute("""
-                    UPDATE users 
-                    SET verified = TRUE, verification_level = 'verified'
-                    WHERE id = %s
-                """, (user_id,))
+                reviewed = review_requests(cur, request_ids, action, rejection_reason, moderator_id)
+                conn.commit()
                 
-                cur.execute("""
-                    UPDATE products 
-                    SET verified_seller = TRUE
-                    WHERE seller_id = %s
-                """, (user_id,))
-            else:
-                cur.execute("""
-                    UPDATE verification_requests 
-                    SET status = 'rejected', reviewed_at = NOW(), rejection_reason = %s
-                    WHERE id = %s
-                """, (rejection_reason, request_id))
+                return {
+                    'statusCode': 200,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'reviewed': reviewed, 'skipped': len(set(request_ids)) - reviewed})
+                }
+            
+            if not is_id(request_id) or action not in ['approve', 'reject']:
+                return {
+                    'statusCode': 400,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'error': 'Invalid request'})
+                }
+            
+            if not review_requests(cur, [request_id], action, rejection_reason, moderator_id):
+                cur.execute("SELECT status FROM verification_requests WHERE id = %s", (request_id,))
+                row = cur.fetchone()
+                if not row:
+                    return {
+                        'statusCode': 404,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({'error': 'Request not found'})
+                    }
+                return {
+                    'statusCode': 409,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({'error': 'Request claimed by another moderator' if row[0] == 'pending'
+                                        else 'Request already reviewed'})
+                }
             
             conn.commit()
-            cur.close()
-            conn.close()
             
             return {
                 'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
+                'headers': JSON_HEADERS,
                 'body': json.dumps({'message': f'Request {action}d successfully'})
             }
         
         else:
             return {
                 'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': JSON_HEADERS,
                 'body': json.dumps({'error': 'Method not allowed'})
             }
             
-    except Exception as e:
+    except psycopg2.pool.PoolError:
         return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)})
+            'statusCode': 503,
+            'headers': {**JSON_HEADERS, 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Service busy, retry later'})
         }
+    
+    except Exception:
+        return internal_error(context)
+    
+    finally:
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            release_connection(conn)
+
+
+def handler(event: dict, context) -> dict:
+    if not INSTRUMENTATION_ENABLED:
+        return handle_request(event, context)
+    metrics = RequestMetrics()
+    token = _metrics.set(metrics)
+    try:
+        response = handle_request(event, context)
+    finally:
+        _metrics.reset(token)
+    return metrics.finish(event, context, response)
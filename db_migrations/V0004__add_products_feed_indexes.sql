@@ -0,0 +1,13 @@
+-- Индексы для keyset-пагинации ленты товаров по (posted_at, id)
+CREATE INDEX idx_products_feed ON products(posted_at DESC, id DESC);
+CREATE INDEX idx_products_category_feed ON products(category, posted_at DESC, id DESC);
+
+-- Фильтр по цене внутри категории
+CREATE INDEX idx_products_category_price ON products(category, price);
+CREATE INDEX idx_products_price ON products(price);
+
+-- Поиск по началу строки местоположения (LIKE 'Москва%')
+CREATE INDEX idx_products_location_prefix ON products(location varchar_pattern_ops);
+
+-- Индекс idx_products_posted покрывается idx_products_feed
+DROP INDEX IF EXISTS idx_products_posted;
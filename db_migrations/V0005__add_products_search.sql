@@ -0,0 +1,11 @@
+-- Полнотекстовый поиск по товарам (русская морфология) и нечёткий поиск по заголовку
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE products ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+    ) STORED;
+
+CREATE INDEX idx_products_search_vector ON products USING GIN (search_vector);
+CREATE INDEX idx_products_title_trgm ON products USING GIN (title gin_trgm_ops);
@@ -0,0 +1,7 @@
+-- Версии закэшированных ответов API: увеличение версии инвалидирует кэш
+CREATE TABLE cache_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('products_feed', 0);
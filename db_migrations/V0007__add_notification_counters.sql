@@ -0,0 +1,76 @@
+-- История уведомлений пользователя с пагинацией по (created_at, id)
+CREATE INDEX idx_notifications_user_created ON notifications(user_id, created_at DESC, id DESC);
+
+-- Денормализованный счётчик непрочитанных уведомлений
+CREATE TABLE notification_counters (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    unread_count INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO notification_counters (user_id, unread_count)
+SELECT user_id, COUNT(*)
+FROM notifications
+WHERE user_id IS NOT NULL AND is_read IS NOT TRUE
+GROUP BY user_id;
+
+-- Триггеры уровня оператора: массовые вставки и обновления дают один UPSERT на пользователя
+CREATE FUNCTION notification_counters_on_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO notification_counters (user_id, unread_count)
+    SELECT user_id, COUNT(*)
+    FROM new_rows
+    WHERE user_id IS NOT NULL AND is_read IS NOT TRUE
+    GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET unread_count = notification_counters.unread_count + EXCLUDED.unread_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION notification_counters_on_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO notification_counters (user_id, unread_count)
+    SELECT user_id, SUM(delta)
+    FROM (
+        SELECT n.user_id, (n.is_read IS NOT TRUE)::int - (o.is_read IS NOT TRUE)::int AS delta
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE n.user_id IS NOT NULL
+    ) changes
+    GROUP BY user_id
+    HAVING SUM(delta) <> 0
+    ON CONFLICT (user_id) DO UPDATE
+    SET unread_count = notification_counters.unread_count + EXCLUDED.unread_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION notification_counters_on_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE notification_counters c
+    SET unread_count = c.unread_count - d.removed
+    FROM (
+        SELECT user_id, COUNT(*) AS removed
+        FROM old_rows
+        WHERE user_id IS NOT NULL AND is_read IS NOT TRUE
+        GROUP BY user_id
+    ) d
+    WHERE c.user_id = d.user_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_notification_counters_insert
+    AFTER INSERT ON notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notification_counters_on_insert();
+
+CREATE TRIGGER trg_notification_counters_update
+    AFTER UPDATE ON notifications
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notification_counters_on_update();
+
+CREATE TRIGGER trg_notification_counters_delete
+    AFTER DELETE ON notifications
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notification_counters_on_delete();
@@ -0,0 +1,15 @@
+-- Сообщаем слушателям канала notifications_new о новых уведомлениях: payload "user_id:max_id"
+CREATE FUNCTION notifications_notify_new() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('notifications_new', user_id::text || ':' || MAX(id)::text)
+    FROM new_rows
+    WHERE user_id IS NOT NULL
+    GROUP BY user_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_notifications_notify_new
+    AFTER INSERT ON notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notifications_notify_new();
@@ -0,0 +1,7 @@
+-- Захват заявок модераторами для параллельной работы с очередью
+ALTER TABLE verification_requests ADD COLUMN IF NOT EXISTS claimed_by INTEGER;
+ALTER TABLE verification_requests ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
+
+-- Частичный индекс очереди: только заявки на рассмотрении, в порядке подачи
+CREATE INDEX idx_verification_requests_pending ON verification_requests(submitted_at, id)
+    WHERE status = 'pending';
@@ -0,0 +1,76 @@
+-- Отзывы о продавцах: рейтинг продавца вычисляется по отзывам с заполненным seller_id
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS seller_id INTEGER REFERENCES users(id);
+CREATE INDEX idx_reviews_seller ON reviews(seller_id) WHERE seller_id IS NOT NULL;
+
+-- Денормализованная копия полей продавца для ленты без JOIN users
+ALTER TABLE products ADD COLUMN IF NOT EXISTS seller_name VARCHAR(100);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS seller_rating DECIMAL(2,1);
+
+-- Агрегаты по продавцам
+CREATE TABLE seller_stats (
+    seller_id INTEGER PRIMARY KEY REFERENCES users(id),
+    listings_count INTEGER NOT NULL DEFAULT 0,
+    total_views BIGINT NOT NULL DEFAULT 0,
+    total_sales INTEGER NOT NULL DEFAULT 0,
+    reviews_count INTEGER NOT NULL DEFAULT 0,
+    rating DECIMAL(2,1) NOT NULL DEFAULT 0.0,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Пересчёт статистики: для списка продавцов (инкрементально) или для всех при seller_ids = NULL (по расписанию)
+CREATE FUNCTION refresh_seller_stats(seller_ids INTEGER[] DEFAULT NULL) RETURNS INTEGER AS $$
+DECLARE
+    refreshed INTEGER;
+BEGIN
+    INSERT INTO seller_stats (seller_id, listings_count, total_views, total_sales, reviews_count, rating, refreshed_at)
+    SELECT
+        u.id,
+        COALESCE(p.listings_count, 0),
+        COALESCE(p.total_views, 0),
+        COALESCE(u.total_sales, 0),
+        COALESCE(r.reviews_count, 0),
+        COALESCE(r.avg_rating, u.rating, 0.0),
+        NOW()
+    FROM users u
+    LEFT JOIN (
+        SELECT seller_id, COUNT(*) AS listings_count, SUM(views) AS total_views
+        FROM products
+        WHERE seller_ids IS NULL OR seller_id = ANY(seller_ids)
+        GROUP BY seller_id
+    ) p ON p.seller_id = u.id
+    LEFT JOIN (
+        SELECT seller_id, COUNT(*) AS reviews_count, ROUND(AVG(rating), 1) AS avg_rating
+        FROM reviews
+        WHERE seller_id IS NOT NULL AND (seller_ids IS NULL OR seller_id = ANY(seller_ids))
+        GROUP BY seller_id
+    ) r ON r.seller_id = u.id
+    WHERE seller_ids IS NULL OR u.id = ANY(seller_ids)
+    ON CONFLICT (seller_id) DO UPDATE SET
+        listings_count = EXCLUDED.listings_count,
+        total_views = EXCLUDED.total_views,
+        total_sales = EXCLUDED.total_sales,
+        reviews_count = EXCLUDED.reviews_count,
+        rating = EXCLUDED.rating,
+        refreshed_at = EXCLUDED.refreshed_at;
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+    UPDATE users u
+    SET rating = s.rating
+    FROM seller_stats s
+    WHERE s.seller_id = u.id
+      AND s.reviews_count > 0
+      AND u.rating IS DISTINCT FROM s.rating
+      AND (seller_ids IS NULL OR u.id = ANY(seller_ids));
+
+    UPDATE products p
+    SET seller_name = u.name, seller_rating = u.rating
+    FROM users u
+    WHERE u.id = p.seller_id
+      AND (seller_ids IS NULL OR p.seller_id = ANY(seller_ids))
+      AND (p.seller_name IS DISTINCT FROM u.name OR p.seller_rating IS DISTINCT FROM u.rating);
+
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_seller_stats();
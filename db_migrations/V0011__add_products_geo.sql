@@ -0,0 +1,7 @@
+-- Структурированное местоположение объявления: город из справочника и его координаты
+ALTER TABLE products ADD COLUMN IF NOT EXISTS city VARCHAR(100);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS lon DOUBLE PRECISION;
+
+-- Поиск «рядом» сводится к списку городов в радиусе: city = ANY(...) с сортировкой по свежести
+CREATE INDEX idx_products_city_posted ON products(city, posted_at DESC, id DESC) WHERE city IS NOT NULL;
@@ -0,0 +1,94 @@
+-- Корзина гистограммы цен: 0 — до 500 ₽, далее по границам массива; границы совпадают с PRICE_BUCKET_BOUNDS в products/index.py
+CREATE FUNCTION product_price_bucket(price INTEGER) RETURNS SMALLINT AS $$
+    SELECT width_bucket(price, ARRAY[500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000])::smallint
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Предагрегированные фасеты ленты: число объявлений по категории, городу, бейджу продавца и ценовой корзине
+CREATE TABLE product_facets (
+    category VARCHAR(100) NOT NULL,
+    city VARCHAR(100) NOT NULL DEFAULT '',
+    verified_seller BOOLEAN NOT NULL,
+    price_bucket SMALLINT NOT NULL,
+    listings INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (category, city, verified_seller, price_bucket)
+);
+
+INSERT INTO product_facets (category, city, verified_seller, price_bucket, listings)
+SELECT category, COALESCE(city, ''), COALESCE(verified_seller, FALSE), product_price_bucket(price), COUNT(*)
+FROM products
+GROUP BY 1, 2, 3, 4;
+
+-- Триггеры уровня оператора, как у notification_counters: импорт и массовое одобрение дают один UPSERT на ключ.
+-- Ключи упорядочены, чтобы параллельные вставки блокировали строки в одном порядке
+CREATE FUNCTION product_facets_on_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_facets (category, city, verified_seller, price_bucket, listings)
+    SELECT category, COALESCE(city, ''), COALESCE(verified_seller, FALSE), product_price_bucket(price), COUNT(*)
+    FROM new_rows
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 2, 3, 4
+    ON CONFLICT (category, city, verified_seller, price_bucket) DO UPDATE
+    SET listings = product_facets.listings + EXCLUDED.listings;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Обновления просмотров и полей продавца не меняют ключ фасета и отсекаются сравнением старой и новой строки
+CREATE FUNCTION product_facets_on_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO product_facets (category, city, verified_seller, price_bucket, listings)
+    SELECT k.category, k.city, k.verified_seller, k.price_bucket, SUM(k.delta)
+    FROM (
+        SELECT n.category, COALESCE(n.city, '') AS city, COALESCE(n.verified_seller, FALSE) AS verified_seller,
+               product_price_bucket(n.price) AS price_bucket,
+               o.category AS old_category, COALESCE(o.city, '') AS old_city,
+               COALESCE(o.verified_seller, FALSE) AS old_verified_seller,
+               product_price_bucket(o.price) AS old_price_bucket
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+    ) c,
+    LATERAL (VALUES
+        (c.category, c.city, c.verified_seller, c.price_bucket, 1),
+        (c.old_category, c.old_city, c.old_verified_seller, c.old_price_bucket, -1)
+    ) k(category, city, verified_seller, price_bucket, delta)
+    WHERE (c.category, c.city, c.verified_seller, c.price_bucket)
+          IS DISTINCT FROM (c.old_category, c.old_city, c.old_verified_seller, c.old_price_bucket)
+    GROUP BY 1, 2, 3, 4
+    HAVING SUM(k.delta) <> 0
+    ORDER BY 1, 2, 3, 4
+    ON CONFLICT (category, city, verified_seller, price_bucket) DO UPDATE
+    SET listings = product_facets.listings + EXCLUDED.listings;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION product_facets_on_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE product_facets f
+    SET listings = f.listings - d.removed
+    FROM (
+        SELECT category, COALESCE(city, '') AS city, COALESCE(verified_seller, FALSE) AS verified_seller,
+               product_price_bucket(price) AS price_bucket, COUNT(*) AS removed
+        FROM old_rows
+        GROUP BY 1, 2, 3, 4
+    ) d
+    WHERE f.category = d.category AND f.city = d.city
+      AND f.verified_seller = d.verified_seller AND f.price_bucket = d.price_bucket;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_product_facets_insert
+    AFTER INSERT ON products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_facets_on_insert();
+
+CREATE TRIGGER trg_product_facets_update
+    AFTER UPDATE ON products
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_facets_on_update();
+
+CREATE TRIGGER trg_product_facets_delete
+    AFTER DELETE ON products
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_facets_on_delete();
@@ -0,0 +1,26 @@
+-- Сохранённые ответы POST-запросов с заголовком Idempotency-Key: повтор запроса возвращает тот же ответ
+CREATE TABLE idempotency_keys (
+    scope VARCHAR(50) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code INTEGER,
+    response_body TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scope, key)
+);
+
+-- Для удаления устаревших ключей по времени создания
+CREATE INDEX idx_idempotency_keys_created ON idempotency_keys(created_at);
+
+-- Перед уникальным индексом оставляем у пользователя только самую раннюю заявку на рассмотрении
+UPDATE verification_requests v
+SET status = 'rejected', reviewed_at = NOW(), rejection_reason = 'Повторная заявка'
+WHERE v.status = 'pending'
+  AND EXISTS (
+      SELECT 1 FROM verification_requests e
+      WHERE e.user_id = v.user_id AND e.status = 'pending'
+        AND e.id < v.id
+  );
+
+-- Не больше одной заявки на рассмотрении на пользователя; используется в INSERT ... ON CONFLICT
+CREATE UNIQUE INDEX uq_verification_requests_pending ON verification_requests(user_id) WHERE status = 'pending';
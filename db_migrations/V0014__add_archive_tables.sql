@@ -0,0 +1,124 @@
+-- Архив прочитанных старых уведомлений: горячая таблица notifications хранит только свежую историю
+CREATE TABLE notifications_archive (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    type VARCHAR(50) NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    message TEXT NOT NULL,
+    is_read BOOLEAN,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_notifications_archive_user_created ON notifications_archive(user_id, created_at DESC, id DESC);
+
+-- Кандидаты на перенос: непрочитанные остаются в горячей таблице, чтобы не трогать notification_counters
+CREATE INDEX idx_notifications_archivable ON notifications(created_at) WHERE is_read = TRUE;
+
+-- Архив истёкших объявлений; поисковый вектор и индексы ленты для него не нужны
+CREATE TABLE products_archive (
+    id INTEGER PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    price INTEGER NOT NULL,
+    category VARCHAR(100) NOT NULL,
+    description TEXT,
+    location VARCHAR(255),
+    image_emoji VARCHAR(10),
+    seller_id INTEGER,
+    views INTEGER,
+    verified_seller BOOLEAN,
+    seller_name VARCHAR(100),
+    seller_rating DECIMAL(2,1),
+    city VARCHAR(100),
+    lat DOUBLE PRECISION,
+    lon DOUBLE PRECISION,
+    posted_at TIMESTAMP,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_products_archive_seller ON products_archive(seller_id);
+
+-- Перенос одной порции: SKIP LOCKED не ждёт строк, которые сейчас обновляют обработчики.
+-- Транзакцию после каждой порции фиксирует вызывающий код (scripts/retention.py), поэтому блокировки короткие
+CREATE FUNCTION archive_notifications(batch_size INTEGER, older_than INTERVAL) RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT id FROM notifications
+        WHERE is_read = TRUE AND created_at < NOW() - older_than
+        ORDER BY created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM notifications n
+        USING batch b
+        WHERE n.id = b.id
+        RETURNING n.id, n.user_id, n.type, n.title, n.message, n.is_read, n.created_at
+    )
+    INSERT INTO notifications_archive (id, user_id, type, title, message, is_read, created_at)
+    SELECT id, user_id, type, title, message, is_read, created_at FROM removed;
+    
+    GET DIAGNOSTICS moved = ROW_COUNT;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Удаление из products уменьшает product_facets триггером; статистика продавцов пересчитывается для затронутых
+CREATE FUNCTION archive_products(batch_size INTEGER, older_than INTERVAL) RETURNS INTEGER AS $$
+DECLARE
+    moved INTEGER;
+    sellers INTEGER[];
+BEGIN
+    WITH batch AS (
+        SELECT id FROM products
+        WHERE posted_at < NOW() - older_than
+        ORDER BY posted_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM products p
+        USING batch b
+        WHERE p.id = b.id
+        RETURNING p.id, p.title, p.price, p.category, p.description, p.location, p.image_emoji,
+                  p.seller_id, p.views, p.verified_seller, p.seller_name, p.seller_rating,
+                  p.city, p.lat, p.lon, p.posted_at, p.created_at
+    ), archived AS (
+        INSERT INTO products_archive (id, title, price, category, description, location, image_emoji,
+                                      seller_id, views, verified_seller, seller_name, seller_rating,
+                                      city, lat, lon, posted_at, created_at)
+        SELECT * FROM removed
+        RETURNING seller_id
+    )
+    SELECT COUNT(*), array_agg(DISTINCT seller_id) FILTER (WHERE seller_id IS NOT NULL)
+    INTO moved, sellers
+    FROM archived;
+    
+    IF sellers IS NOT NULL THEN
+        PERFORM refresh_seller_stats(sellers);
+    END IF;
+    IF moved > 0 THEN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'products_feed';
+    END IF;
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Ключи идемпотентности нужны только на время повторов клиента
+CREATE FUNCTION purge_idempotency_keys(batch_size INTEGER, older_than INTERVAL) RETURNS INTEGER AS $$
+DECLARE
+    purged INTEGER;
+BEGIN
+    DELETE FROM idempotency_keys
+    WHERE ctid IN (
+        SELECT ctid FROM idempotency_keys
+        WHERE created_at < NOW() - older_than
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,23 @@
+-- Словарь слов из заголовков для поиска с опечатками: ближайшие по триграммам слова ищутся среди
+-- сотни тысяч слов, а не среди миллиона заголовков, и затем подставляются в полнотекстовый запрос
+CREATE TABLE search_words (
+    word TEXT PRIMARY KEY
+);
+
+CREATE INDEX idx_search_words_trgm ON search_words USING GIN (word gin_trgm_ops);
+
+-- Дополнение словаря словами новых заголовков; вызывается по расписанию (scripts/retention.py).
+-- Слова удалённых объявлений не вычищаются: лишнее слово только не найдёт кандидатов
+CREATE FUNCTION refresh_search_words() RETURNS INTEGER AS $$
+DECLARE
+    added INTEGER;
+BEGIN
+    INSERT INTO search_words (word)
+    SELECT word FROM ts_stat('SELECT to_tsvector(''simple'', title) FROM products')
+    ON CONFLICT (word) DO NOTHING;
+    GET DIAGNOSTICS added = ROW_COUNT;
+    RETURN added;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_search_words();
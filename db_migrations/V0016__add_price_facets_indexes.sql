@@ -0,0 +1,7 @@
+-- Края ценового диапазона фасетов дочитываются из products только по индексу: рядом с ценой хранятся
+-- категория, город и бейдж продавца, поэтому фильтры фасетов проверяются без обращения к таблице
+DROP INDEX idx_products_price;
+CREATE INDEX idx_products_price ON products(price) INCLUDE (category, city, verified_seller);
+
+DROP INDEX idx_products_category_price;
+CREATE INDEX idx_products_category_price ON products(category, price) INCLUDE (city, verified_seller);
@@ -0,0 +1,6 @@
+-- Рассылка с Idempotency-Key помечает свои уведомления ключом: повтор после сбоя на середине
+-- вставляет только недоставленным получателям через INSERT ... ON CONFLICT DO NOTHING
+ALTER TABLE notifications ADD COLUMN fanout_batch VARCHAR(255);
+
+CREATE UNIQUE INDEX uq_notifications_fanout_batch_user ON notifications(fanout_batch, user_id)
+    WHERE fanout_batch IS NOT NULL;
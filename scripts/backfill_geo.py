@@ -0,0 +1,46 @@
+"""
+Заполняет city/lat/lon у существующих объявлений по справочнику backend/products/cities.json.
+
+Запуск: DATABASE_URL=... python scripts/backfill_geo.py
+Город определяется по первой части location до запятой; обновление идёт
+по одному городу за транзакцию, чтобы не держать длинных блокировок.
+"""
+import json
+import os
+import sys
+import time
+import psycopg2
+
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'products', 'cities.json')
+
+
+def main() -> None:
+    with open(CITIES_PATH, encoding='utf-8') as f:
+        cities = json.load(f)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    started = time.monotonic()
+    total = 0
+    try:
+        with conn.cursor() as cur:
+            for city in cities:
+                names = [name.lower().replace('ё', 'е') for name in [city['name']] + city.get('aliases', [])]
+                cur.execute("""
+                    UPDATE products
+                    SET city = %s, lat = %s, lon = %s
+                    WHERE city IS NULL
+                      AND regexp_replace(replace(lower(trim(split_part(location, ',', 1))), 'ё', 'е'),
+                                         '^(г\\.|город)\\s*', '') = ANY(%s)
+                """, (city['name'], city['lat'], city['lon'], names))
+                conn.commit()
+                total += cur.rowcount
+                print(f"{city['name']}: {cur.rowcount}", file=sys.stderr)
+            cur.execute("UPDATE cache_versions SET version = version + 1 WHERE name = 'products_feed'")
+            conn.commit()
+    finally:
+        conn.close()
+    print(f'geo backfill: {total} rows in {time.monotonic() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
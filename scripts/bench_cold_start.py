@@ -0,0 +1,82 @@
+"""
+Замер холодного старта облачных функций: время импорта index.py, первого запроса и тёплого повтора.
+
+Запуск: DATABASE_URL=... python scripts/bench_cold_start.py [--runs 10] [--function products]
+Каждый прогон идёт в новом процессе Python, как новый экземпляр функции. Первый запрос —
+OPTIONS (без базы), затем первый GET-сценарий из tests.json функции и его тёплый повтор.
+Без DATABASE_URL замеряются только импорт и OPTIONS.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(SCRIPTS_DIR, '..', 'backend')
+
+PROBE = r'''
+import importlib.util, json, sys, time
+from urllib.parse import urlsplit, parse_qsl
+sys.path.insert(0, sys.argv[1])
+from dev_server import RequestContext
+
+name, path, with_db = sys.argv[2], sys.argv[3], sys.argv[4] == '1'
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location(f'backend_{name}', sys.argv[5])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+result = {'import_ms': (time.perf_counter() - started) * 1000}
+
+def call(method, target):
+    url = urlsplit(target)
+    event = {'httpMethod': method, 'headers': {}, 'queryStringParameters': dict(parse_qsl(url.query)),
+             'body': '', 'isBase64Encoded': False}
+    t = time.perf_counter()
+    response = module.handler(event, RequestContext(name))
+    return (time.perf_counter() - t) * 1000, response['statusCode']
+
+result['options_ms'], _ = call('OPTIONS', '/')
+if with_db and path:
+    result['first_get_ms'], result['status'] = call('GET', path)
+    result['warm_get_ms'], _ = call('GET', path)
+print(json.dumps(result))
+'''
+
+
+def first_get_path(name: str):
+    with open(os.path.join(BACKEND_DIR, name, 'tests.json')) as f:
+        for test in json.load(f)['tests']:
+            if test.get('method', 'GET') == 'GET':
+                return test.get('path') or '/'
+    return ''
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure import time and first-request latency per function')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--function', action='append', default=[], help='limit to these functions')
+    args = parser.parse_args()
+
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        names = [name for name in json.load(f) if not args.function or name in args.function]
+    with_db = '1' if os.environ.get('DATABASE_URL') else '0'
+
+    columns = ('import_ms', 'options_ms', 'first_get_ms', 'warm_get_ms')
+    print(f"{'function':<14} " + ' '.join(f'{c:>13}' for c in columns) + '  (median of runs)')
+    for name in names:
+        samples = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, '-c', PROBE, SCRIPTS_DIR, name, first_get_path(name), with_db,
+                 os.path.join(BACKEND_DIR, name, 'index.py')],
+                check=True, capture_output=True, text=True
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        medians = [statistics.median(s[c] for s in samples) if c in samples[0] else None for c in columns]
+        print(f'{name:<14} ' + ' '.join(f'{m:>13.1f}' if m is not None else f"{'-':>13}" for m in medians))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Накладные расходы на соединение с Postgres: соединение на каждый запрос против пула соединений.
+
+Запуск: DATABASE_URL=... python scripts/bench_connections.py [--requests 200] [--concurrency 8]
+Для каждой функции из backend/func2url.json первый GET-сценарий из её tests.json вызывается
+напрямую через handler: последовательно и из нескольких потоков. Режим «connect» подменяет
+get_connection/release_connection на psycopg2.connect и close, как до появления пула;
+режим «pool» переиспользует соединения между вызовами, как тёплый экземпляр функции.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(SCRIPTS_DIR, '..', 'backend')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from dev_server import RequestContext  # noqa: E402
+
+
+def load_function(name: str):
+    spec = importlib.util.spec_from_file_location(f'backend_{name}', os.path.join(BACKEND_DIR, name, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def first_get_event(name: str) -> dict:
+    with open(os.path.join(BACKEND_DIR, name, 'tests.json')) as f:
+        for test in json.load(f)['tests']:
+            if test.get('method', 'GET') == 'GET':
+                url = urlsplit(test.get('path') or '/')
+                return {'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': dict(parse_qsl(url.query)),
+                        'body': '', 'isBase64Encoded': False}
+    raise SystemExit(f'{name}: no GET scenario in tests.json')
+
+
+def reset_pool(module) -> None:
+    if module._pool is not None and not module._pool.closed:
+        module._pool.closeall()
+    module._pool = None
+
+
+def connect_per_request(module) -> None:
+    '''Прежнее поведение: psycopg2.connect на каждый запрос и закрытие после ответа'''
+    def get_connection():
+        return module.psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=module.PooledConnection)
+
+    def release_connection(conn):
+        conn.close()
+
+    module.get_connection = get_connection
+    module.release_connection = release_connection
+
+
+def call(module, name: str, event: dict) -> float:
+    started = time.perf_counter()
+    response = module.handler(dict(event), RequestContext(name))
+    if response['statusCode'] != 200:
+        raise SystemExit(f"{name}: unexpected status {response['statusCode']}: {response['body'][:200]}")
+    return (time.perf_counter() - started) * 1000
+
+
+def summarize(timings: list) -> str:
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return f'{p50:>8.2f} {p95:>8.2f}'
+
+
+def run(module, name: str, event: dict, requests: int, concurrency: int) -> tuple:
+    reset_pool(module)
+    call(module, name, event)
+    sequential = [call(module, name, event) for _ in range(requests)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        concurrent = list(pool.map(lambda _: call(module, name, event), range(requests)))
+    reset_pool(module)
+    return sequential, concurrent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare per-request connect with the connection pool')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--function', action='append', default=[], help='limit to these functions')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is not set')
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        names = [name for name in json.load(f) if not args.function or name in args.function]
+
+    print(f"{'function':<14} {'mode':<8} {'seq p50':>8} {'seq p95':>8} {'par p50':>8} {'par p95':>8}  (ms)")
+    for name in names:
+        event = first_get_event(name)
+        for mode in ('connect', 'pool'):
+            module = load_function(name)
+            if mode == 'connect':
+                connect_per_request(module)
+            sequential, concurrent = run(module, name, event, args.requests, args.concurrency)
+            print(f'{name:<14} {mode:<8} {summarize(sequential)} {summarize(concurrent)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Сравнивает время запроса фасетов по product_facets и живой агрегации по products.
+
+Запуск: DATABASE_URL=... python scripts/bench_facets.py --iterations 200
+Перед замером базу стоит наполнить через seed.py (например, --products 1000000).
+SQL собирается тем же build_facets_query, что и в облачной функции products. Сценарии с ценами
+не по границам корзин дочитывают края из products, поиск и префикс адреса всегда считаются живьём.
+"""
+import argparse
+import importlib.util
+import os
+import time
+import psycopg2
+
+PRODUCTS_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'products', 'index.py')
+
+SCENARIOS = [
+    ('all', {}),
+    ('category', {'category': 'Электроника'}),
+    ('category + price', {'category': 'Авто', 'min_price': '10000', 'max_price': '49999'}),
+    ('city', {'city': 'Москва'}),
+    ('radius 100 km', {'lat': '55.7558', 'lon': '37.6173', 'radius_km': '100'}),
+    ('price 1234+', {'min_price': '1234'}),
+    ('price 60000+', {'min_price': '60000'}),
+    ('price 1234..600000', {'min_price': '1234', 'max_price': '600000'}),
+    ('auto 10000..20000', {'category': 'Авто', 'min_price': '10000', 'max_price': '20000'}),
+    ('search', {'q': 'iphone'}),
+    ('location', {'location': 'Москва'}),
+]
+
+
+def load_products_module():
+    spec = importlib.util.spec_from_file_location('backend_products', PRODUCTS_INDEX)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_query(cur, query: str, args, iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        cur.execute(query, args)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark facet queries: aggregate table vs live GROUP BY')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--live-iterations', type=int, default=5, help='live aggregation is slow on large tables')
+    args = parser.parse_args()
+
+    products = load_products_module()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM products')
+            print(f'products: {cur.fetchone()[0]}')
+            print(f"{'scenario':<20} {'source':<10} {'p50 ms':>8} {'p95 ms':>8}")
+            for name, params in SCENARIOS:
+                for source, live, iterations in (('aggregate', False, args.iterations),
+                                                 ('live', True, args.live_iterations)):
+                    query, query_args = products.build_facets_query(params, live=live)
+                    timings = time_query(cur, query, query_args, iterations)
+                    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                    print(f'{name:<20} {source:<10} {timings[len(timings) // 2]:>8.2f} {p95:>8.2f}')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Рассылка уведомления по списку из 100k получателей: INSERT ... SELECT по пачкам против одного.
+
+Запуск: DATABASE_URL=... python scripts/bench_fanout.py [--recipients 100000]
+Базу стоит наполнить через seed.py (--users 100000 и больше). «chunked» вызывает текущую
+fanout_to_users функции notifications: пачки по FANOUT_CHUNK_SIZE и COMMIT после каждой.
+«single» — одна транзакция на весь список. Оба режима включают работу триггеров (счётчики
+непрочитанных, NOTIFY). «lock ms» — самое долгое время, которое строки notification_counters
+остаются заблокированными (длина самой долгой транзакции). Созданные строки удаляются после замера.
+"""
+import argparse
+import importlib.util
+import os
+import time
+import psycopg2
+
+NOTIFICATIONS_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'notifications',
+                                   'index.py')
+
+
+def load_notifications_module():
+    spec = importlib.util.spec_from_file_location('backend_notifications', NOTIFICATIONS_INDEX)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fanout_single(conn, user_ids: list, notification: tuple) -> int:
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO notifications (user_id, type, title, message)
+            SELECT u.id, %s, %s, %s
+            FROM (SELECT DISTINCT unnest(%s::int[]) AS id) r
+            JOIN users u ON u.id = r.id
+        """, notification + (user_ids,))
+        inserted = cur.rowcount
+    conn.commit()
+    return inserted
+
+
+class CommitTimer:
+    '''Обёртка соединения: замеряет самую долгую транзакцию между COMMIT'''
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.started = time.perf_counter()
+        self.longest = 0.0
+
+    def cursor(self, *args, **kwargs):
+        return self.conn.cursor(*args, **kwargs)
+
+    def commit(self) -> None:
+        self.conn.commit()
+        now = time.perf_counter()
+        self.longest = max(self.longest, now - self.started)
+        self.started = now
+
+
+def cleanup(conn, title: str) -> None:
+    with conn.cursor() as cur:
+        cur.execute('DELETE FROM notifications WHERE title = %s', (title,))
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare chunked and single-statement notification fan-out')
+    parser.add_argument('--recipients', type=int, default=100000)
+    args = parser.parse_args()
+
+    notifications = load_notifications_module()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT id FROM users ORDER BY id LIMIT %s', (args.recipients,))
+            user_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        if len(user_ids) < args.recipients:
+            print(f'only {len(user_ids)} users in the database')
+
+        print(f"{'mode':<8} {'recipients':>10} {'seconds':>9} {'rows/s':>9} {'lock ms':>9}")
+        for mode in ('chunked', 'single'):
+            title = f'bench-fanout-{mode}-{time.time_ns()}'
+            notification = ('announcement', title, 'Benchmark broadcast')
+            timer = CommitTimer(conn)
+            started = time.perf_counter()
+            if mode == 'chunked':
+                inserted, _ = notifications.fanout_to_users(timer, user_ids, notification)
+            else:
+                inserted = fanout_single(timer, user_ids, notification)
+            elapsed = time.perf_counter() - started
+            print(f'{mode:<8} {inserted:>10} {elapsed:>9.2f} {inserted / elapsed:>9.0f} {timer.longest * 1000:>9.0f}')
+            cleanup(conn, title)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Задержка ленты товаров: JOIN users против денормализованной копии продавца в products.
+
+Запуск:
+  DATABASE_URL=... python scripts/seed.py --users 100000 --products 1000000 --notifications 0
+  DATABASE_URL=... python scripts/bench_feed.py [--iterations 50] [--explain]
+SQL собирается тем же build_feed_query, что и в облачной функции products: «join» — с
+FEED_DENORMALIZED_SELLER выключенным, «denorm» — со включённым. Для каждого сценария замеряется
+первая страница и страница по курсору после --depth страниц; сценарии «near» — лента «рядом»,
+отсортированная по расстоянию до города.
+"""
+import argparse
+import importlib.util
+import os
+import time
+import psycopg2
+
+PRODUCTS_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'products', 'index.py')
+
+SCENARIOS = [
+    ('all', {}),
+    ('category', {'category': 'Электроника'}),
+    ('city', {'city': 'Казань'}),
+    ('price', {'min_price': '10000', 'max_price': '50000'}),
+    ('location', {'location': 'Москва'}),
+    ('near 100', {'lat': '55.7558', 'lon': '37.6173', 'radius_km': '100'}),
+    ('near 500', {'lat': '55.7558', 'lon': '37.6173', 'radius_km': '500', 'category': 'Авто'}),
+]
+MODES = (('join', False), ('denorm', True))
+
+
+def load_products_module():
+    spec = importlib.util.spec_from_file_location('backend_products', PRODUCTS_INDEX)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_query(cur, query: str, args, iterations: int) -> tuple:
+    timings = []
+    rows = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        cur.execute(query, args)
+        rows = cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings), rows
+
+
+def page_cursor(products, cur, params: dict, depth: int):
+    '''Курсор страницы номер depth + 1, пройденный по next_cursor'''
+    params = dict(params)
+    for _ in range(depth):
+        query, args, limit = products.build_feed_query(params)
+        cur.execute(query, args)
+        rows = cur.fetchall()
+        if len(rows) <= limit:
+            return None
+        last = rows[limit - 1]
+        params['cursor'] = products.feed_cursor(last, 'lat' in params)
+    return params.get('cursor')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the product feed with and without the users JOIN')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--depth', type=int, default=50, help='pages to walk before timing the cursor page')
+    parser.add_argument('--explain', action='store_true', help='print EXPLAIN ANALYZE for each query')
+    args = parser.parse_args()
+
+    products = load_products_module()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT COUNT(*), COUNT(DISTINCT seller_id) FROM products')
+            print('products: {}, sellers: {}'.format(*cur.fetchone()))
+            print(f"{'scenario':<10} {'page':<7} {'mode':<7} {'rows':>5} {'p50 ms':>8} {'p95 ms':>8}")
+            for name, params in SCENARIOS:
+                params = dict(params, limit=str(args.limit))
+                cursor = page_cursor(products, cur, params, args.depth)
+                pages = [('first', params)]
+                if cursor:
+                    pages.append(('cursor', dict(params, cursor=cursor)))
+                for page, page_params in pages:
+                    for mode, denormalized in MODES:
+                        products.FEED_DENORMALIZED_SELLER = denormalized
+                        query, query_args, limit = products.build_feed_query(page_params)
+                        timings, rows = time_query(cur, query, query_args, args.iterations)
+                        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                        print(f'{name:<10} {page:<7} {mode:<7} {min(len(rows), limit):>5} '
+                              f'{timings[len(timings) // 2]:>8.2f} {p95:>8.2f}')
+                        if args.explain:
+                            cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query, query_args)
+                            print('\n'.join(row[0] for row in cur.fetchall()))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
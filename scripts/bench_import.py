@@ -0,0 +1,81 @@
+"""
+Массовый импорт товаров: COPY во временную таблицу против INSERT по одной строке.
+
+Запуск: DATABASE_URL=... python scripts/bench_import.py [--rows 100000] [--seller-id 1]
+Оба режима получают один и тот же CSV и проходят ту же проверку validate_import_row.
+«copy» вызывает import_products функции products; «row» выполняет по INSERT на строку,
+как делал бы клиент, создающий товары через POST в цикле (без сетевых задержек).
+Каждый замер заканчивается ROLLBACK, поэтому база не растёт от повторных запусков.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import time
+import psycopg2
+
+PRODUCTS_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'products', 'index.py')
+
+TITLES = ['iPhone 13 Pro', 'Диван угловой', 'Велосипед горный', 'Куртка зимняя', 'Коляска прогулочная']
+CATEGORIES = ['Электроника', 'Одежда', 'Мебель', 'Спорт', 'Детские товары', 'Авто']
+LOCATIONS = ['Москва, Центр', 'Казань', 'Пермь, Ленинский']
+
+
+def load_products_module():
+    spec = importlib.util.spec_from_file_location('backend_products', PRODUCTS_INDEX)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_csv(count: int) -> str:
+    rng = random.Random(42)
+    lines = ['title,price,category,description,location']
+    for i in range(count):
+        lines.append(f'{TITLES[i % len(TITLES)]} #{i},{rng.randrange(100, 200000)},'
+                     f'{CATEGORIES[i % len(CATEGORIES)]},"Состояние хорошее, самовывоз",'
+                     f'"{LOCATIONS[i % len(LOCATIONS)]}"')
+    return '\n'.join(lines) + '\n'
+
+
+def import_row_by_row(products, conn, payload: str, seller_id: int) -> int:
+    imported = 0
+    with conn.cursor() as cur:
+        for _, row in products.iter_import_rows('csv', payload):
+            title, price, category, description, location, emoji, city, lat, lon = products.validate_import_row(row)
+            cur.execute("""
+                INSERT INTO products (title, price, category, description, location, image_emoji,
+                                      seller_id, verified_seller, seller_name, seller_rating, city, lat, lon)
+                SELECT %s, %s, %s, %s, %s, %s, u.id, COALESCE(u.verified, FALSE), u.name, u.rating, %s, %s, %s
+                FROM users u WHERE u.id = %s
+            """, (title, price, category, description, location, emoji, city, lat, lon, seller_id))
+            imported += cur.rowcount
+    return imported
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare COPY-based bulk import with row-at-a-time INSERTs')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seller-id', type=int, default=1)
+    args = parser.parse_args()
+
+    products = load_products_module()
+    payload = make_csv(args.rows)
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        print(f"{'mode':<6} {'rows':>8} {'seconds':>9} {'rows/s':>9}")
+        for mode in ('copy', 'row'):
+            started = time.perf_counter()
+            if mode == 'copy':
+                imported = products.import_products(conn, 'csv', payload, args.seller_id)['imported']
+            else:
+                imported = import_row_by_row(products, conn, payload, args.seller_id)
+            elapsed = time.perf_counter() - started
+            conn.rollback()
+            print(f'{mode:<6} {imported:>8} {elapsed:>9.2f} {imported / elapsed:>9.0f}')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
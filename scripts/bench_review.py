@@ -0,0 +1,99 @@
+"""
+Одобрение 10k заявок на верификацию: один набор UPDATE против запросов по каждой заявке.
+
+Запуск: DATABASE_URL=... python scripts/bench_review.py [--requests 10000] [--products-per-seller 3]
+Перед каждым замером создаются новые продавцы с товарами и заявками на рассмотрении.
+«bulk» вызывает review_requests функции verification со всеми id сразу. «row» повторяет прежний
+разбор по одной заявке: SELECT заявки, UPDATE заявки, пользователя и его товаров, сброс версии
+кэша ленты и INSERT уведомления. Прежний путь ещё делал COMMIT и HTTP-запрос на каждую заявку;
+здесь их нет, так что «row» показывает нижнюю границу. Каждый замер заканчивается ROLLBACK.
+"""
+import argparse
+import importlib.util
+import os
+import time
+import psycopg2
+
+VERIFICATION_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'verification',
+                                  'index.py')
+MODERATOR_ID = 1
+
+
+def load_verification_module():
+    spec = importlib.util.spec_from_file_location('backend_verification', VERIFICATION_INDEX)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_pending_requests(cur, count: int, products_per_seller: int) -> list:
+    cur.execute("""
+        WITH created_users AS (
+            INSERT INTO users (name) SELECT 'Bench review ' || g FROM generate_series(1, %s) g
+            RETURNING id, name
+        ), created_products AS (
+            INSERT INTO products (title, price, category, description, location, image_emoji,
+                                  seller_id, verified_seller, seller_name)
+            SELECT 'Bench product ' || n, 1000, 'Электроника', 'Bench', 'Москва', '📦', id, FALSE, name
+            FROM created_users CROSS JOIN generate_series(1, %s) n
+        )
+        INSERT INTO verification_requests (user_id, phone, email, document_type, document_number, status)
+        SELECT id, '+7 900 000-00-00', 'bench@test.local', 'passport', '0000 000000', 'pending'
+        FROM created_users
+        RETURNING id
+    """, (count, products_per_seller))
+    return [row[0] for row in cur.fetchall()]
+
+
+def review_row_by_row(verification, cur, request_ids: list) -> int:
+    reviewed = 0
+    for request_id in request_ids:
+        cur.execute('SELECT user_id FROM verification_requests WHERE id = %s', (request_id,))
+        user_id = cur.fetchone()[0]
+        cur.execute("""
+            UPDATE verification_requests
+            SET status = 'approved', reviewed_at = NOW(), reviewed_by = %s
+            WHERE id = %s
+        """, (MODERATOR_ID, request_id))
+        cur.execute("""
+            UPDATE users SET verified = TRUE, verification_level = 'verified' WHERE id = %s
+        """, (user_id,))
+        cur.execute('UPDATE products SET verified_seller = TRUE WHERE seller_id = %s', (user_id,))
+        cur.execute("UPDATE cache_versions SET version = version + 1 WHERE name = 'products_feed'")
+        cur.execute("""
+            INSERT INTO notifications (user_id, type, title, message)
+            VALUES (%s, 'verification_approved', %s, %s)
+        """, (user_id, verification.APPROVED_TITLE, verification.APPROVED_MESSAGE))
+        reviewed += 1
+    return reviewed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare set-based and per-request verification approval')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--products-per-seller', type=int, default=3)
+    args = parser.parse_args()
+
+    verification = load_verification_module()
+    if args.requests > verification.MAX_REVIEW_BATCH:
+        raise SystemExit(f'--requests must not exceed MAX_REVIEW_BATCH ({verification.MAX_REVIEW_BATCH})')
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        print(f"{'mode':<6} {'requests':>8} {'seconds':>9} {'req/s':>9}")
+        for mode in ('bulk', 'row'):
+            with conn.cursor() as cur:
+                request_ids = create_pending_requests(cur, args.requests, args.products_per_seller)
+                started = time.perf_counter()
+                if mode == 'bulk':
+                    reviewed = verification.review_requests(cur, request_ids, 'approve', None, MODERATOR_ID)
+                else:
+                    reviewed = review_row_by_row(verification, cur, request_ids)
+                elapsed = time.perf_counter() - started
+            conn.rollback()
+            print(f'{mode:<6} {reviewed:>8} {elapsed:>9.2f} {reviewed / elapsed:>9.0f}')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
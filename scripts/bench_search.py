@@ -0,0 +1,90 @@
+"""
+Замер поиска товаров (q=...) на синтетическом каталоге.
+
+Запуск:
+  DATABASE_URL=... python scripts/seed.py --users 100000 --products 1000000 --notifications 0
+  DATABASE_URL=... python scripts/retention.py --only search_words
+  DATABASE_URL=... python scripts/bench_search.py [--iterations 50] [--explain]
+Словарь опечаток search_words пополняется по расписанию, поэтому после seed.py его нужно обновить.
+SQL собирается тем же build_search_query, что и в облачной функции products:
+первая страница и страница по курсору, с фильтром по категории и без, с опечатками, для редкого
+слова (номер из заголовка seed.py) и слова без совпадений.
+"""
+import argparse
+import importlib.util
+import os
+import time
+import psycopg2
+
+PRODUCTS_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'products', 'index.py')
+
+SCENARIOS = [
+    ('word', {'q': 'велосипед'}),
+    ('two words', {'q': 'диван угловой'}),
+    ('latin', {'q': 'iphone'}),
+    ('typo', {'q': 'велосипет'}),
+    ('typo latin', {'q': 'lenvo'}),
+    ('rare', {'q': '42049'}),
+    ('no match', {'q': 'дирижабль'}),
+    ('word + category', {'q': 'шины', 'category': 'Авто'}),
+    ('word + price', {'q': 'ноутбук', 'min_price': '10000', 'max_price': '50000'}),
+]
+
+
+def load_products_module():
+    spec = importlib.util.spec_from_file_location('backend_products', PRODUCTS_INDEX)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_query(cur, query: str, args, iterations: int) -> tuple:
+    timings = []
+    rows = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        cur.execute(query, args)
+        rows = cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings), rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark ranked full-text and trigram product search')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--explain', action='store_true', help='print EXPLAIN ANALYZE for each scenario')
+    args = parser.parse_args()
+
+    products = load_products_module()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM products')
+            print(f'products: {cur.fetchone()[0]}')
+            print(f"{'scenario':<18} {'page':<7} {'rows':>5} {'p50 ms':>8} {'p95 ms':>8}")
+            for name, params in SCENARIOS:
+                params = dict(params, limit=str(args.limit))
+                query, query_args, limit = products.build_search_query(params)
+                timings, rows = time_query(cur, query, query_args, args.iterations)
+                pages = [('first', timings, rows)]
+                if len(rows) > limit:
+                    last = rows[limit - 1]
+                    params['cursor'] = products.encode_cursor(last[12], last[0])
+                    query, query_args, limit = products.build_search_query(params)
+                    next_timings, next_rows = time_query(cur, query, query_args, args.iterations)
+                    pages.append(('cursor', next_timings, next_rows))
+                for page, page_timings, page_rows in pages:
+                    p95 = page_timings[min(len(page_timings) - 1, int(len(page_timings) * 0.95))]
+                    print(f'{name:<18} {page:<7} {min(len(page_rows), limit):>5} '
+                          f'{page_timings[len(page_timings) // 2]:>8.2f} {p95:>8.2f}')
+                if args.explain:
+                    cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query, query_args)
+                    print('\n'.join(row[0] for row in cur.fetchall()))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Микробенчмарк сериализации ленты products без базы данных.
+
+Запуск: python scripts/bench_serialize.py [--rows 10000 100000] [--repeat 5]
+Строки генерируются в памяти в том же виде, что отдаёт SELECT ленты, и кодируются
+теми же map_product_row и encode_json_array, что и в облачной функции. Для каждого
+варианта печатается лучшее время из --repeat прогонов и цена одной строки.
+"""
+import argparse
+import gc
+import importlib.util
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+PRODUCTS_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'products', 'index.py')
+
+TITLES = ['iPhone 13 Pro', 'Диван угловой', 'Велосипед горный', 'Куртка зимняя', 'Коляска прогулочная']
+CATEGORIES = ['Электроника', 'Одежда', 'Мебель', 'Спорт', 'Детские товары', 'Авто']
+CITIES = [('Москва', 55.7558, 37.6173), ('Казань', 55.7961, 49.1064), ('Пермь', 58.0105, 56.2502)]
+
+
+def load_products_module():
+    spec = importlib.util.spec_from_file_location('backend_products', PRODUCTS_INDEX)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_rows(count: int, now: datetime) -> list:
+    '''Кортежи в порядке колонок build_feed_query: id … posted_at, seller, rating, sort_key, city, lat, lon'''
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        posted_at = now - timedelta(minutes=rng.randrange(60 * 24 * 90))
+        city, lat, lon = CITIES[i % len(CITIES)]
+        rows.append((
+            count - i, TITLES[i % len(TITLES)], rng.randrange(100, 200000), CATEGORIES[i % len(CATEGORIES)],
+            'Состояние хорошее, самовывоз', city, '📦', rng.randrange(1000), i % 3 == 0,
+            posted_at, f'Пользователь {i % 1000}', 4.5, posted_at, city, lat, lon
+        ))
+    return rows
+
+
+def run(products, rows: list, now: datetime, raw_only: bool, origin) -> float:
+    # Как и timeit, сборщик мусора на время замера выключается: иначе шум на 100k строк больше разницы вариантов
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        products.encode_json_array(
+            (row for row in rows),
+            lambda row: products.map_product_row(row, now, raw_only, origin),
+            len(rows)
+        )
+        return time.perf_counter() - started
+    finally:
+        gc.enable()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark feed row mapping and JSON encoding without a database')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    products = load_products_module()
+    cached_label = products.posted_label
+    now = datetime.now()
+    products.dumps('warm-up')
+    has_orjson = bool(products._orjson)
+
+    variants = [
+        ('labels, cached', {}),
+        ('labels, uncached', {'posted_label': cached_label.__wrapped__}),
+        ('posted_format=raw', {'raw_only': True}),
+        ('with distance_km', {'origin': (55.7558, 37.6173)}),
+    ]
+    if has_orjson:
+        variants.append(('stdlib json', {'_orjson': False}))
+
+    print(f"encoder: {'orjson' if has_orjson else 'json'}")
+    print(f"{'rows':>7} {'variant':<20} {'best ms':>9} {'us/row':>8}")
+    for count in args.rows:
+        rows = make_rows(count, now)
+        for name, overrides in variants:
+            saved = {key: getattr(products, key) for key in ('posted_label', '_orjson') if key in overrides}
+            for key in saved:
+                setattr(products, key, overrides[key])
+            try:
+                best = min(
+                    run(products, rows, now, overrides.get('raw_only', False), overrides.get('origin'))
+                    for _ in range(args.repeat)
+                )
+            finally:
+                for key, value in saved.items():
+                    setattr(products, key, value)
+            print(f'{count:>7} {name:<20} {best * 1000:>9.1f} {best / count * 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Память и время выдачи ленты: обычный курсор против серверного (именованного) курсора.
+
+Запуск: DATABASE_URL=... python scripts/bench_stream.py [--rows 101 --rows 100000]
+Запрос строится build_feed_query функции products, предел строк подставляется вместо limit + 1,
+строки кодируются тем же encode_json_array. «plain» — fetch_rows функции: весь результат одним
+запросом; «named» — серверный курсор порциями по CHUNK_SIZE строк. Функции отдают только страницы
+до MAX_PAGE_SIZE + 1 строк, поэтому серверного курсора в них нет. Каждый замер идёт в отдельном
+процессе, чтобы пик RSS (ru_maxrss) не переходил от предыдущего; время — медиана --repeat прогонов
+для небольших страниц, пик Python-объектов — по tracemalloc, body MB — размер ответа в UTF-8.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import psycopg2
+
+PRODUCTS_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'products', 'index.py')
+MODES = ('plain', 'named')
+CHUNK_SIZE = 500
+
+
+def load_products_module():
+    spec = importlib.util.spec_from_file_location('backend_products', PRODUCTS_INDEX)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def iter_named(conn, query: str, args):
+    with conn.cursor(name='bench_stream') as cur:
+        cur.itersize = CHUNK_SIZE
+        cur.execute(query, args)
+        yield from cur
+
+
+def encode(products, conn, mode: str, rows: int) -> str:
+    query, args, _ = products.build_feed_query({})
+    args[-1] = rows
+    now = datetime.now()
+    body, _ = products.encode_json_array(
+        products.fetch_rows(conn, query, args) if mode == 'plain' else iter_named(conn, query, args),
+        lambda row: products.map_product_row(row, now, False),
+        rows
+    )
+    conn.rollback()
+    return body
+
+
+def measure_once(mode: str, rows: int, repeat: int) -> dict:
+    products = load_products_module()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        # Прогрев: ленивый импорт orjson, планы запросов и кэш страниц Postgres
+        encode(products, conn, mode, products.MAX_PAGE_SIZE + 1)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = encode(products, conn, mode, rows)
+            timings.append(time.perf_counter() - started)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+        # tracemalloc замедляет кодирование, поэтому пик Python-объектов снимается отдельным прогоном
+        del body
+        tracemalloc.start()
+        body = encode(products, conn, mode, rows)
+        python_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        conn.close()
+    return {
+        'seconds': sorted(timings)[len(timings) // 2],
+        'rss_mb': rss / 1024,
+        'python_mb': python_peak / 1024 / 1024,
+        'body_mb': len(body.encode()) / 1024 / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare memory and latency of plain and server-side cursors')
+    parser.add_argument('--rows', type=int, action='append', help='rows per response (repeatable)')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per small page; large ones run once')
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'ROWS', 'REPEAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_once(args.child[0], int(args.child[1]), int(args.child[2]))))
+        return
+
+    print(f"{'mode':<6} {'rows':>7} {'ms':>9} {'rss MB':>8} {'py MB':>8} {'body MB':>8}")
+    for rows in args.rows or [101, 100000]:
+        for mode in MODES:
+            repeat = args.repeat if rows <= 1000 else 1
+            output = subprocess.run([sys.executable, __file__, '--child', mode, str(rows), str(repeat)],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output)
+            print(f"{mode:<6} {rows:>7} {result['seconds'] * 1000:>9.1f} {result['rss_mb']:>8.1f} "
+                  f"{result['python_mb']:>8.1f} {result['body_mb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Нагрузка на одно популярное объявление: буферизованные просмотры против UPDATE на каждый запрос.
+
+Запуск: DATABASE_URL=... python scripts/bench_views.py [--requests 5000] [--concurrency 16] [--product-id 1]
+Режим «naive» на каждый просмотр выполняет UPDATE products SET views = views + 1 и COMMIT,
+как до появления буфера: все запросы встают в очередь за блокировкой одной строки.
+Режим «buffered» вызывает handler функции products с PUT {action: 'view'}.
+В конце буфер сбрасывается и проверяется, что счётчик вырос ровно на число запросов.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from bench_connections import load_function, reset_pool, summarize  # noqa: E402
+from dev_server import RequestContext  # noqa: E402
+
+
+def product_views(module, product_id: int) -> int:
+    conn = module.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT views FROM products WHERE id = %s', (product_id,))
+            return cur.fetchone()[0]
+    finally:
+        module.release_connection(conn)
+
+
+def naive_view(module, product_id: int) -> None:
+    conn = module.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('UPDATE products SET views = views + 1 WHERE id = %s', (product_id,))
+        conn.commit()
+    finally:
+        module.release_connection(conn)
+
+
+def buffered_view(module, event: dict) -> None:
+    response = module.handler(dict(event), RequestContext('products'))
+    if response['statusCode'] != 202:
+        raise SystemExit(f"unexpected status {response['statusCode']}: {response['body'][:200]}")
+
+
+def run(mode: str, requests: int, concurrency: int, product_id: int) -> None:
+    module = load_function('products')
+    event = {'httpMethod': 'PUT', 'headers': {}, 'queryStringParameters': {},
+             'body': json.dumps({'action': 'view', 'product_id': product_id}), 'isBase64Encoded': False}
+    view = (lambda: naive_view(module, product_id)) if mode == 'naive' else (lambda: buffered_view(module, event))
+
+    def timed(_) -> float:
+        started = time.perf_counter()
+        view()
+        return (time.perf_counter() - started) * 1000
+
+    before = product_views(module, product_id)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    conn = module.get_connection()
+    try:
+        module.flush_views(conn)
+    finally:
+        module.release_connection(conn)
+    delta = product_views(module, product_id) - before
+    reset_pool(module)
+
+    status = 'ok' if delta == requests else f'LOST {requests - delta}'
+    print(f'{mode:<9} {requests / elapsed:>9.0f} {summarize(timings)} {delta:>8} {status}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare buffered view counting with a per-request UPDATE')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--product-id', type=int, default=1)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is not set')
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+
+    print(f"{'mode':<9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'views +':>8}")
+    for mode in ('naive', 'buffered'):
+        run(mode, args.requests, args.concurrency, args.product_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Проверка идемпотентности POST под параллельными повторами против локального dev_server.py.
+
+Запуск: python scripts/concurrency_check.py --base-url http://127.0.0.1:8080 --user-id 3
+Сценарии:
+  * N одинаковых POST /products с общим Idempotency-Key создают ровно одно объявление;
+  * N одинаковых POST /verification без ключа дают ровно одну заявку, остальные — 400.
+Для второго сценария у пользователя не должно быть заявки на рассмотрении.
+--parallel по умолчанию равен DB_POOL_MAX_SIZE (5, как пул в функциях): лишние запросы ждали бы
+соединение и при истечении DB_POOL_WAIT_TIMEOUT получали 503, что ломает подсчёт ответов.
+Для большего --parallel запускайте dev_server.py с DB_POOL_MAX_SIZE не меньше этого числа.
+Код выхода 1, если хотя бы один сценарий нарушен.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def post(url: str, payload: dict, headers: dict) -> tuple:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json', **headers})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def fire(parallel: int, send) -> list:
+    '''Отпускает все запросы одновременно, чтобы они встретились в базе'''
+    barrier = threading.Barrier(parallel)
+
+    def task(_):
+        barrier.wait()
+        return send()
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        return list(pool.map(task, range(parallel)))
+
+
+def check_products(base_url: str, parallel: int) -> bool:
+    key = str(uuid.uuid4())
+    payload = {
+        'title': f'Concurrency check {key[:8]}',
+        'price': 1000,
+        'category': 'Электроника',
+        'location': 'Москва',
+        'description': 'Duplicate submission test'
+    }
+    results = fire(parallel, lambda: post(f'{base_url}/products', payload, {'Idempotency-Key': key}))
+    ids = {body.get('id') for status, body in results if status == 201}
+    statuses = sorted(status for status, _ in results)
+    ok = len(ids) == 1 and all(status == 201 for status in statuses)
+    print(f"products: statuses={statuses} distinct ids={sorted(ids)} -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def check_verification(base_url: str, parallel: int, user_id: int) -> bool:
+    payload = {
+        'user_id': user_id,
+        'phone': '+79990000000',
+        'email': 'check@example.com',
+        'document_type': 'passport',
+        'document_number': '0000 000000'
+    }
+    results = fire(parallel, lambda: post(f'{base_url}/verification', payload, {}))
+    created = sum(1 for status, _ in results if status == 201)
+    rejected = sum(1 for status, _ in results if status == 400)
+    ok = created == 1 and rejected == parallel - 1
+    print(f"verification: created={created} rejected={rejected} -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fire parallel duplicate POSTs and check idempotency')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080')
+    parser.add_argument('--parallel', type=int, default=int(os.environ.get('DB_POOL_MAX_SIZE', '5')),
+                        help='duplicate requests per scenario, defaults to DB_POOL_MAX_SIZE')
+    parser.add_argument('--user-id', type=int, required=True, help='user without a pending verification request')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    ok = check_products(base_url, args.parallel)
+    ok = check_verification(base_url, args.parallel, args.user_id) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Локальный HTTP-сервер для облачных функций из backend/: каждая функция монтируется как /<имя>.
+
+Запуск: DATABASE_URL=... python scripts/dev_server.py [--port 8080]
+Запрос GET http://localhost:8080/products?limit=10 превращается в event
+с httpMethod, headers, queryStringParameters и body и передаётся в handler.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def load_functions() -> dict:
+    '''Импортирует index.py каждой функции под уникальным именем модуля'''
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        names = json.load(f).keys()
+    functions = {}
+    for name in names:
+        path = os.path.join(BACKEND_DIR, name, 'index.py')
+        spec = importlib.util.spec_from_file_location(f'backend_{name}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        functions[name] = module.handler
+    return functions
+
+
+class RequestContext:
+    '''Минимальная замена контексту облачной функции'''
+
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.request_id = f'local-{time.monotonic_ns()}'
+
+
+def make_handler(functions: dict):
+    class FunctionRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def handle_any(self) -> None:
+            url = urlsplit(self.path)
+            name = url.path.strip('/').split('/', 1)[0]
+            handler = functions.get(name)
+            if handler is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            length = int(self.headers.get('Content-Length') or 0)
+            event = {
+                'httpMethod': self.command,
+                'headers': dict(self.headers.items()),
+                'queryStringParameters': dict(parse_qsl(url.query)),
+                'body': self.rfile.read(length).decode('utf-8') if length else '',
+                'isBase64Encoded': False
+            }
+            try:
+                response = handler(event, RequestContext(name))
+            except Exception as e:
+                response = {
+                    'statusCode': 500,
+                    'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': repr(e)})
+                }
+
+            body = (response.get('body') or '').encode('utf-8')
+            self.send_response(response.get('statusCode', 200))
+            for key, value in (response.get('headers') or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = handle_any
+
+    return FunctionRequestHandler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Local runner for backend cloud functions')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is not set')
+
+    functions = load_functions()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(functions))
+    print(f'Serving {", ".join(sorted(functions))} on http://{args.host}:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
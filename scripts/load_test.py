@@ -0,0 +1,114 @@
+"""
+Нагрузочный прогон сценариев из backend/*/tests.json против локального dev_server.py.
+
+Запуск: python scripts/load_test.py --base-url http://127.0.0.1:8080 --requests 200 [--include-writes]
+Для каждого сценария печатает p50/p95/p99 задержки, пропускную способность
+и число ответов с неожиданным статусом.
+
+Параллельность по умолчанию равна DB_POOL_MAX_SIZE (5, как размер пула в функциях): при большем
+числе потоков запросы ждут соединение из пула, и замер показывает очередь, а не сами запросы.
+Для --concurrency выше пула запускайте dev_server.py с тем же DB_POOL_MAX_SIZE.
+Сценарии с POST/PUT/DELETE меняют данные (создают товары, отклоняют заявки), поэтому
+по умолчанию пропускаются; --include-writes включает их, только для тестовой базы.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+READ_METHODS = ('GET', 'OPTIONS')
+
+
+def load_scenarios(only: list, include_writes: bool) -> tuple:
+    '''Сценарии (функция, тест) и число пропущенных сценариев записи'''
+    with open(os.path.join(BACKEND_DIR, 'func2url.json')) as f:
+        names = [name for name in json.load(f) if not only or name in only]
+    scenarios = []
+    skipped = 0
+    for name in names:
+        with open(os.path.join(BACKEND_DIR, name, 'tests.json')) as f:
+            for test in json.load(f)['tests']:
+                if not include_writes and test.get('method', 'GET') not in READ_METHODS:
+                    skipped += 1
+                    continue
+                scenarios.append((name, test))
+    return scenarios, skipped
+
+
+def send(base_url: str, function: str, test: dict) -> tuple:
+    '''Выполняет один запрос сценария; возвращает (задержка в секундах, HTTP-статус)'''
+    path = urllib.parse.quote(test.get('path') or '/', safe='/?&=%')
+    url = f"{base_url.rstrip('/')}/{function}{path}"
+    data = json.dumps(test['body']).encode() if 'body' in test else None
+    request = urllib.request.Request(url, data=data, method=test.get('method', 'GET'),
+                                     headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    return time.perf_counter() - started, status
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(base_url: str, function: str, test: dict, concurrency: int, requests: int) -> dict:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: send(base_url, function, test), range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    unexpected = sum(1 for _, status in results if status != test.get('expectedStatus', 200))
+    return {
+        'function': function,
+        'name': test['name'],
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'rps': requests / elapsed,
+        'unexpected_status': unexpected
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replay tests.json scenarios under load')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080')
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('DB_POOL_MAX_SIZE', '5')),
+                        help='parallel requests, defaults to DB_POOL_MAX_SIZE')
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+    parser.add_argument('--function', action='append', default=[], help='limit to these functions')
+    parser.add_argument('--include-writes', action='store_true', help='also replay POST/PUT/DELETE scenarios')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+
+    scenarios, skipped = load_scenarios(args.function, args.include_writes)
+    if skipped:
+        print(f'skipped {skipped} write scenarios, pass --include-writes to run them', file=sys.stderr)
+
+    if not args.json:
+        print(f"{'function':<14} {'scenario':<45} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rps':>8} {'bad':>5}")
+    for function, test in scenarios:
+        result = run_scenario(args.base_url, function, test, args.concurrency, args.requests)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print(f"{result['function']:<14} {result['name'][:45]:<45} {result['p50_ms']:>8.1f} "
+                  f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['rps']:>8.1f} "
+                  f"{result['unexpected_status']:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Фоновая ретенция: переносит старые прочитанные уведомления и истёкшие объявления в архивные таблицы
+и удаляет устаревшие ключи идемпотентности, затем пересчитывает seller_stats.
+
+Запуск: DATABASE_URL=... python scripts/retention.py [--batch-size 5000] [--report]
+Работает порциями через archive_notifications()/archive_products()/purge_idempotency_keys()
+из миграции V0014 с COMMIT после каждой, поэтому не держит длинных блокировок и транзакций.
+POST и импорт товаров только прибавляют listings_count, а просмотры, отзывы, рейтинг и копию
+продавца в products догоняет полный refresh_seller_stats() в конце запуска (--only seller_stats);
+там же refresh_search_words() дополняет словарь поиска с опечатками (--only search_words).
+С --report до и после переноса печатает размеры таблиц, мёртвые строки, время VACUUM
+и время первой страницы уведомлений для самых активных пользователей. Число строк в отчёте — оценка
+pg_stat_user_tables, а не COUNT(*). Обычный VACUUM не уменьшает файл notifications: освобождённое
+место занимают следующие уведомления, вернуть его системе можно только VACUUM FULL или pg_repack.
+"""
+import argparse
+import os
+import sys
+import time
+import psycopg2
+
+JOBS = (
+    ('notifications', 'SELECT archive_notifications(%s, %s::interval)', 'notifications_days', 'days'),
+    ('products', 'SELECT archive_products(%s, %s::interval)', 'products_days', 'days'),
+    ('idempotency_keys', 'SELECT purge_idempotency_keys(%s, %s::interval)', 'idempotency_hours', 'hours'),
+)
+
+REPORT_TABLES = ('notifications', 'notifications_archive', 'products', 'products_archive')
+REPORT_USERS = 20
+
+
+def run_job(conn, name: str, query: str, batch_size: int, older_than: str, pause: float) -> int:
+    started = time.monotonic()
+    total = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(query, (batch_size, older_than))
+            moved = cur.fetchone()[0]
+            conn.commit()
+            total += moved
+            if moved:
+                print(f'{name}: {total}', file=sys.stderr)
+            if moved < batch_size:
+                break
+            time.sleep(pause)
+    print(f'{name}: {total} rows in {time.monotonic() - started:.1f}s')
+    return total
+
+
+def refresh_seller_stats(conn) -> int:
+    '''Полный пересчёт seller_stats одной транзакцией'''
+    started = time.monotonic()
+    with conn.cursor() as cur:
+        cur.execute('SELECT refresh_seller_stats()')
+        refreshed = cur.fetchone()[0]
+    conn.commit()
+    print(f'seller_stats: {refreshed} sellers in {time.monotonic() - started:.1f}s')
+    return refreshed
+
+
+def refresh_search_words(conn) -> int:
+    '''Дополняет словарь поиска с опечатками словами новых заголовков'''
+    started = time.monotonic()
+    with conn.cursor() as cur:
+        cur.execute('SELECT refresh_search_words()')
+        added = cur.fetchone()[0]
+    conn.commit()
+    print(f'search_words: {added} new words in {time.monotonic() - started:.1f}s')
+    return added
+
+
+def report(conn, label: str, vacuum: bool) -> None:
+    '''Размеры и мёртвые строки таблиц, время VACUUM и первой страницы уведомлений'''
+    print(f'--- {label}')
+    with conn.cursor() as cur:
+        if vacuum:
+            conn.autocommit = True
+            for table in ('notifications', 'products'):
+                started = time.monotonic()
+                cur.execute(f'VACUUM (ANALYZE) {table}')
+                print(f'VACUUM {table}: {time.monotonic() - started:.2f}s')
+            conn.autocommit = False
+
+        cur.execute("""
+            SELECT relname, n_live_tup, n_dead_tup, pg_total_relation_size(relid)
+            FROM pg_stat_user_tables
+            WHERE relname = ANY(%s)
+            ORDER BY relname
+        """, (list(REPORT_TABLES),))
+        for name, live, dead, size in cur.fetchall():
+            print(f'{name:<24} est_live={live:<12} dead={dead:<10} size={size / 1024 / 1024:.1f} MB')
+
+        cur.execute("""
+            SELECT user_id FROM notifications
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id
+            ORDER BY COUNT(*) DESC
+            LIMIT %s
+        """, (REPORT_USERS,))
+        user_ids = [row[0] for row in cur.fetchall()]
+        timings = []
+        for user_id in user_ids:
+            started = time.perf_counter()
+            cur.execute("""
+                SELECT id, type, title, message, is_read, created_at
+                FROM notifications
+                WHERE user_id = %s
+                ORDER BY created_at DESC, id DESC
+                LIMIT 50
+            """, (user_id,))
+            cur.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        conn.rollback()
+        if timings:
+            timings.sort()
+            print(f'notifications page: p50={timings[len(timings) // 2]:.2f} ms max={timings[-1]:.2f} ms')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Archive old notifications and listings in bounded batches')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds between batches')
+    parser.add_argument('--notifications-days', type=int, default=90)
+    parser.add_argument('--products-days', type=int, default=180)
+    parser.add_argument('--idempotency-hours', type=int, default=24)
+    parser.add_argument('--only', action='append', default=[], help='run only these jobs')
+    parser.add_argument('--report', action='store_true', help='print table stats before and after')
+    parser.add_argument('--vacuum', action='store_true', help='time VACUUM in the report')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        if args.report:
+            report(conn, 'before', args.vacuum)
+        for name, query, option, unit in JOBS:
+            if args.only and name not in args.only:
+                continue
+            run_job(conn, name, query, args.batch_size, f'{getattr(args, option)} {unit}', args.pause)
+        if not args.only or 'seller_stats' in args.only:
+            refresh_seller_stats(conn)
+        if not args.only or 'search_words' in args.only:
+            refresh_search_words(conn)
+        if args.report:
+            report(conn, 'after', args.vacuum)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
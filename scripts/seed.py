@@ -0,0 +1,117 @@
+"""
+Наполняет локальную базу синтетическими пользователями, объявлениями и уведомлениями.
+
+Запуск: DATABASE_URL=... python scripts/seed.py --users 100000 --products 1000000 --notifications 5000000
+Миграции из db_migrations/ должны быть применены заранее. Данные генерируются
+на стороне Postgres через generate_series, порциями, чтобы не держать длинных транзакций.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import psycopg2
+
+BATCH_SIZE = 100000
+
+CATEGORIES = ['Электроника', 'Одежда', 'Мебель', 'Спорт', 'Детские товары', 'Авто']
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'products', 'cities.json')
+TITLES = ['iPhone 13 Pro', 'Диван угловой', 'Велосипед горный', 'Куртка зимняя', 'Коляска прогулочная',
+          'Ноутбук Lenovo', 'Шкаф-купе', 'Беговая дорожка', 'Зимние шины R16', 'Детское автокресло']
+
+
+def seed_users(cur, count: int) -> None:
+    cur.execute("""
+        INSERT INTO users (name, rating, verified, verification_level, total_sales)
+        SELECT
+            'Пользователь ' || g,
+            round((3 + random() * 2)::numeric, 1),
+            v,
+            CASE WHEN v THEN 'verified' ELSE 'none' END,
+            (random() * 50)::int
+        FROM (SELECT g, random() < 0.3 AS v FROM generate_series(1, %s) g) s
+    """, (count,))
+
+
+def load_cities() -> tuple:
+    with open(CITIES_PATH, encoding='utf-8') as f:
+        cities = json.load(f)
+    return [c['name'] for c in cities], [c['lat'] for c in cities], [c['lon'] for c in cities]
+
+
+def seed_products(cur, count: int) -> None:
+    names, lats, lons = load_cities()
+    cur.execute("""
+        INSERT INTO products (title, price, category, description, location, image_emoji,
+                              seller_id, views, verified_seller, seller_name, seller_rating, posted_at,
+                              city, lat, lon)
+        SELECT
+            (%s::text[])[1 + (random() * 9)::int] || ' #' || s.g,
+            (500 + random() * 200000)::int,
+            (%s::text[])[1 + (random() * 5)::int],
+            'Состояние хорошее, самовывоз.',
+            (%s::text[])[s.c] || ', центр',
+            '📦',
+            u.id, (random() * 500)::int, u.verified, u.name, u.rating,
+            NOW() - random() * INTERVAL '180 days',
+            (%s::text[])[s.c], (%s::float8[])[s.c], (%s::float8[])[s.c]
+        FROM (
+            SELECT g, 1 + (random() * (m.max_id - 1))::int AS seller_id,
+                   1 + floor(random() * %s)::int AS c
+            FROM generate_series(1, %s) g, (SELECT MAX(id) AS max_id FROM users) m
+        ) s
+        JOIN users u ON u.id = s.seller_id
+    """, (TITLES, CATEGORIES, names, names, lats, lons, len(names), count))
+
+
+def seed_notifications(cur, count: int) -> None:
+    cur.execute("""
+        INSERT INTO notifications (user_id, type, title, message, is_read, created_at)
+        SELECT
+            1 + (random() * (SELECT MAX(id) - 1 FROM users))::int,
+            'announcement',
+            'Уведомление ' || g,
+            'Синтетическое уведомление для нагрузочного тестирования',
+            random() < 0.7,
+            NOW() - random() * INTERVAL '365 days'
+        FROM generate_series(1, %s) g
+    """, (count,))
+
+
+def run_batches(conn, label: str, seed, total: int) -> None:
+    started = time.monotonic()
+    done = 0
+    with conn.cursor() as cur:
+        while done < total:
+            batch = min(BATCH_SIZE, total - done)
+            seed(cur, batch)
+            conn.commit()
+            done += batch
+            print(f'{label}: {done}/{total}', file=sys.stderr)
+    print(f'{label}: {total} rows in {time.monotonic() - started:.1f}s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Seed a local database with synthetic data')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--notifications', type=int, default=100000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        run_batches(conn, 'users', seed_users, args.users)
+        run_batches(conn, 'products', seed_products, args.products)
+        run_batches(conn, 'notifications', seed_notifications, args.notifications)
+        with conn.cursor() as cur:
+            cur.execute('SELECT refresh_seller_stats()')
+            cur.execute("UPDATE cache_versions SET version = version + 1 WHERE name = 'products_feed'")
+            conn.commit()
+            conn.autocommit = True
+            cur.execute('ANALYZE')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -34,6 +34,9 @@ interface CatalogSectionProps {
   setOnlyVerified: (verified: boolean) => void;
   categories: Category[];
   handleProductClick: (product: Product) => void;
+  hasMore: boolean;
+  loadingMore: boolean;
+  onLoadMore: () => void;
 }
 
 const CatalogSection = ({
@@ -48,7 +51,10 @@ const CatalogSection = ({
   onlyVerified,
   setOnlyVerified,
   categories,
-  handleProductClick
+  handleProductClick,
+  hasMore,
+  loadingMore,
+  onLoadMore
 }: CatalogSectionProps) => {
   const resetFilters = () => {
     setSearchQuery('');
@@ -166,7 +172,7 @@ const CatalogSection = ({
           <>
             <div className="mb-4 text-center">
               <Badge variant="secondary" className="text-sm">
-                Найдено товаров: {filteredProducts.length}
+                {hasMore ? 'Показано товаров' : 'Найдено товаров'}: {filteredProducts.length}
               </Badge>
             </div>
             <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-6">
@@ -174,7 +180,7 @@ const CatalogSection = ({
                 <Card 
                   key={product.id} 
                   className="overflow-hidden hover:shadow-2xl transition-all duration-300 hover:-translate-y-2 border-2 hover:border-primary animate-scale-in group cursor-pointer"
-                  style={{ animationDelay: `${index * 0.1}s` }}
+                  style={{ animationDelay: `${Math.min(index, 8) * 0.1}s` }}
                   onClick={() => handleProductClick(product)}
                 >
                   <div className="aspect-square bg-gradient-to-br from-purple-100 to-pink-100 flex items-center justify-center text-8xl group-hover:scale-110 transition-transform">
@@ -218,12 +224,20 @@ const CatalogSection = ({
           </>
         )}
 
-        <div className="text-center mt-12">
-          <Button size="lg" variant="outline" className="border-2 border-primary hover:bg-primary/10">
-            Показать все объявления
-            <Icon name="ArrowRight" className="ml-2" size={20} />
-          </Button>
-        </div>
+        {!loading && hasMore && (
+          <div className="text-center mt-12">
+            <Button
+              size="lg"
+              variant="outline"
+              className="border-2 border-primary hover:bg-primary/10"
+              onClick={onLoadMore}
+              disabled={loadingMore}
+            >
+              {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+              <Icon name="ArrowDown" className="ml-2" size={20} />
+            </Button>
+          </div>
+        )}
       </div>
     </section>
   );
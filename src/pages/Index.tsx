@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '@/components/ui/card';
 import { Input } from '@/components/ui/input';
@@ -11,6 +11,8 @@ import ProductDetailModal from '@/components/ProductDetailModal';
 import VerificationDialog from '@/components/VerificationDialog';
 
 const PRODUCTS_API = 'https://functions.poehali.dev/1bf7564c-bb65-47c0-8719-4a63bd95be0e';
+const PAGE_SIZE = 24;
+const FILTER_DEBOUNCE_MS = 300;
 
 const Index = () => {
   const [activeSection, setActiveSection] = useState('home');
@@ -20,6 +22,9 @@ const Index = () => {
   const [isCreateAdOpen, setIsCreateAdOpen] = useState(false);
   const [products, setProducts] = useState<any[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const latestRequest = useRef(0);
   const [newAd, setNewAd] = useState({
     title: '',
     category: 'Электроника',
@@ -33,21 +38,71 @@ const Index = () => {
   const [onlyVerified, setOnlyVerified] = useState(false);
   const [isVerificationOpen, setIsVerificationOpen] = useState(false);
   const [currentUserId] = useState(1);
+  const [categoryCounts, setCategoryCounts] = useState<Record<string, number>>({});
 
   useEffect(() => {
-    fetchProducts();
+    fetchFacets();
   }, []);
 
-  const fetchProducts = async () => {
+  // Фильтры и поиск выполняет API: клиент видит весь каталог, а не только первую страницу
+  useEffect(() => {
+    const timer = setTimeout(() => fetchProducts(), FILTER_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchQuery, selectedCategory, priceRange.min, priceRange.max, onlyVerified]);
+
+  const buildProductsUrl = (cursor?: string) => {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+    if (searchQuery.trim()) params.set('q', searchQuery.trim());
+    if (selectedCategory !== 'Все') params.set('category', selectedCategory);
+    if (priceRange.min) params.set('min_price', priceRange.min);
+    if (priceRange.max) params.set('max_price', priceRange.max);
+    if (onlyVerified) params.set('verified', '1');
+    if (cursor) params.set('cursor', cursor);
+    return `${PRODUCTS_API}?${params}`;
+  };
+
+  const fetchProducts = async (cursor?: string) => {
+    // Ответ на устаревшие фильтры, пришедший позже нового запроса, отбрасывается
+    const requestId = ++latestRequest.current;
     try {
-      setLoading(true);
-      const response = await fetch(PRODUCTS_API);
+      if (cursor) {
+        setLoadingMore(true);
+      } else {
+        setLoading(true);
+      }
+      const response = await fetch(buildProductsUrl(cursor));
       const data = await response.json();
-      setProducts(data.products || []);
+      if (requestId !== latestRequest.current) return;
+      if (!response.ok) {
+        console.error('Error fetching products:', data.error);
+        if (!cursor) setProducts([]);
+        setNextCursor(null);
+        return;
+      }
+      const page = data.products || [];
+      setProducts(current => cursor ? [...current, ...page] : page);
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error('Error fetching products:', error);
     } finally {
-      setLoading(false);
+      if (requestId === latestRequest.current) {
+        setLoading(false);
+        setLoadingMore(false);
+      }
+    }
+  };
+
+  const fetchFacets = async () => {
+    try {
+      const response = await fetch(`${PRODUCTS_API}?facets=1`);
+      const data = await response.json();
+      const counts: Record<string, number> = {};
+      (data.categories || []).forEach((item: { category: string; count: number }) => {
+        counts[item.category] = item.count;
+      });
+      setCategoryCounts(counts);
+    } catch (error) {
+      console.error('Error fetching facets:', error);
     }
   };
 
@@ -60,7 +115,7 @@ const Index = () => {
       });
       
       if (response.ok) {
-        await fetchProducts();
+        await Promise.all([fetchProducts(), fetchFacets()]);
         return true;
       }
       return false;
@@ -71,24 +126,13 @@ const Index = () => {
   };
 
   const categories = [
-    { name: 'Электроника', icon: 'Laptop', count: 1250 },
-    { name: 'Одежда', icon: 'Shirt', count: 3400 },
-    { name: 'Мебель', icon: 'Sofa', count: 890 },
-    { name: 'Спорт', icon: 'Dumbbell', count: 560 },
-    { name: 'Детские товары', icon: 'Baby', count: 720 },
-    { name: 'Авто', icon: 'Car', count: 430 }
-  ];
-
-  const filteredProducts = products.filter(product => {
-    const matchesSearch = product.title.toLowerCase().includes(searchQuery.toLowerCase()) ||
-                         product.description?.toLowerCase().includes(searchQuery.toLowerCase());
-    const matchesCategory = selectedCategory === 'Все' || product.category === selectedCategory;
-    const matchesPrice = (!priceRange.min || product.price >= parseInt(priceRange.min)) &&
-                        (!priceRange.max || product.price <= parseInt(priceRange.max));
-    const matchesVerified = !onlyVerified || product.verified;
-    
-    return matchesSearch && matchesCategory && matchesPrice && matchesVerified;
-  });
+    { name: 'Электроника', icon: 'Laptop' },
+    { name: 'Одежда', icon: 'Shirt' },
+    { name: 'Мебель', icon: 'Sofa' },
+    { name: 'Спорт', icon: 'Dumbbell' },
+    { name: 'Детские товары', icon: 'Baby' },
+    { name: 'Авто', icon: 'Car' }
+  ].map(category => ({ ...category, count: categoryCounts[category.name] ?? 0 }));
 
   const handleProductClick = (product: any) => {
     setSelectedProduct(product);
@@ -223,7 +267,10 @@ const Index = () => {
 
       <CatalogSection 
         loading={loading}
-        filteredProducts={filteredProducts}
+        filteredProducts={products}
+        hasMore={nextCursor !== null}
+        loadingMore={loadingMore}
+        onLoadMore={() => nextCursor && fetchProducts(nextCursor)}
         searchQuery={searchQuery}
         setSearchQuery={setSearchQuery}
         selectedCategory={selectedCategory}
@@ -0,0 +1,69 @@
+"""
+Общие фикстуры тестов облачных функций из backend/.
+
+Функции деплоятся по отдельности и не образуют пакет, поэтому каждый тест
+импортирует index.py нужной функции под уникальным именем модуля, предварительно
+выставив переменные окружения: часть констант модуля читается один раз при импорте.
+Тесты, которым нужна база, пропускаются, если TEST_DATABASE_URL не указывает
+на базу с применёнными миграциями из db_migrations/.
+"""
+import importlib.util
+import json
+import itertools
+import os
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+_module_ids = itertools.count()
+
+
+def import_function(name: str):
+    '''Импортирует backend/<name>/index.py как новый модуль со свежим состоянием'''
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    spec = importlib.util.spec_from_file_location(f'backend_{name}_{next(_module_ids)}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RequestContext:
+    '''Минимальная замена контексту облачной функции'''
+
+    def __init__(self, function_name: str = 'test'):
+        self.function_name = function_name
+        self.request_id = 'test-request'
+
+
+def make_event(method: str = 'GET', params: dict = None, body=None, headers: dict = None) -> dict:
+    '''Событие в формате, который облачная функция получает от API-шлюза'''
+    return {
+        'httpMethod': method,
+        'headers': headers or {},
+        'queryStringParameters': params or {},
+        'body': body if body is None or isinstance(body, str) else json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+
+@pytest.fixture
+def database_url():
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    return url
+
+
+@pytest.fixture
+def context():
+    return RequestContext()
+
+
+@pytest.fixture
+def load_function(monkeypatch):
+    '''Выставляет переменные окружения на время теста и импортирует функцию'''
+    def load(name: str, **env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        return import_function(name)
+    return load
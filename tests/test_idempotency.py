@@ -0,0 +1,145 @@
+"""
+Повторы POST products и verification: Idempotency-Key и одна заявка на рассмотрении на пользователя.
+"""
+import json
+import threading
+import uuid
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+
+@pytest.fixture
+def products(load_function, database_url):
+    return load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='2')
+
+
+@pytest.fixture
+def verification(load_function, database_url):
+    return load_function('verification', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='2')
+
+
+def product_body(title: str, price: int = 5000) -> dict:
+    return {'title': title, 'price': price, 'category': 'Спорт', 'location': 'Москва'}
+
+
+def create_user(database_url: str) -> int:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO users (name) VALUES (%s) RETURNING id", (f'Idempotency test {uuid.uuid4().hex[:8]}',))
+        user_id = cur.fetchone()[0]
+        conn.commit()
+    return user_id
+
+
+def verification_body(user_id: int, document_number: str = '0000 000000') -> dict:
+    return {'user_id': user_id, 'phone': '+7 900 000-00-00', 'email': 'retry@test.local',
+            'document_type': 'passport', 'document_number': document_number}
+
+
+def count_rows(database_url: str, query: str, args: tuple) -> int:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute(query, args)
+        return cur.fetchone()[0]
+
+
+def count_products(database_url: str, title: str) -> int:
+    return count_rows(database_url, 'SELECT COUNT(*) FROM products WHERE title = %s', (title,))
+
+
+def count_pending(database_url: str, user_id: int) -> int:
+    return count_rows(database_url, "SELECT COUNT(*) FROM verification_requests "
+                                    "WHERE user_id = %s AND status = 'pending'", (user_id,))
+
+
+def post(function, context, body: dict, key: str = None) -> dict:
+    headers = {'Idempotency-Key': key} if key else {}
+    return function.handler(make_event('POST', body=body, headers=headers), context)
+
+
+def post_in_parallel(function, context, bodies_and_keys: list) -> list:
+    '''Отправляет запросы одновременно из отдельных потоков; ответы в порядке аргументов'''
+    barrier = threading.Barrier(len(bodies_and_keys))
+    responses = [None] * len(bodies_and_keys)
+
+    def send(index: int, body: dict, key) -> None:
+        barrier.wait()
+        responses[index] = post(function, context, body, key)
+
+    threads = [threading.Thread(target=send, args=(index, body, key))
+               for index, (body, key) in enumerate(bodies_and_keys)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def test_product_replay_returns_stored_response(products, database_url, context):
+    title, key = f'Повтор {uuid.uuid4().hex}', uuid.uuid4().hex
+    first = post(products, context, product_body(title), key)
+    assert first['statusCode'] == 201
+
+    replay = post(products, context, product_body(title), key)
+    assert (replay['statusCode'], replay['body']) == (201, first['body'])
+    assert replay['headers']['Idempotent-Replayed'] == 'true'
+    assert count_products(database_url, title) == 1
+
+
+def test_product_key_with_different_body_is_422(products, database_url, context):
+    title, key = f'Повтор {uuid.uuid4().hex}', uuid.uuid4().hex
+    assert post(products, context, product_body(title), key)['statusCode'] == 201
+    assert post(products, context, product_body(title, price=7000), key)['statusCode'] == 422
+    assert count_products(database_url, title) == 1
+
+
+def test_parallel_product_retries_create_one_row(products, database_url, context):
+    title, key = f'Повтор {uuid.uuid4().hex}', uuid.uuid4().hex
+    responses = post_in_parallel(products, context, [(product_body(title), key)] * 2)
+
+    assert [response['statusCode'] for response in responses] == [201, 201]
+    assert responses[0]['body'] == responses[1]['body']
+    replayed = [response for response in responses if response['headers'].get('Idempotent-Replayed')]
+    assert len(replayed) == 1
+    assert count_products(database_url, title) == 1
+
+
+def test_verification_replay_returns_stored_response(verification, database_url, context):
+    user_id, key = create_user(database_url), uuid.uuid4().hex
+    first = post(verification, context, verification_body(user_id), key)
+    assert first['statusCode'] == 201
+
+    replay = post(verification, context, verification_body(user_id), key)
+    assert (replay['statusCode'], replay['body']) == (201, first['body'])
+    assert replay['headers']['Idempotent-Replayed'] == 'true'
+    assert count_pending(database_url, user_id) == 1
+
+
+def test_verification_key_with_different_body_is_422(verification, database_url, context):
+    user_id, key = create_user(database_url), uuid.uuid4().hex
+    assert post(verification, context, verification_body(user_id), key)['statusCode'] == 201
+    response = post(verification, context, verification_body(user_id, '1111 111111'), key)
+    assert response['statusCode'] == 422
+    assert count_pending(database_url, user_id) == 1
+
+
+def test_parallel_verification_retries_create_one_request(verification, database_url, context):
+    user_id, key = create_user(database_url), uuid.uuid4().hex
+    responses = post_in_parallel(verification, context, [(verification_body(user_id), key)] * 2)
+
+    assert [response['statusCode'] for response in responses] == [201, 201]
+    assert responses[0]['body'] == responses[1]['body']
+    replayed = [response for response in responses if response['headers'].get('Idempotent-Replayed')]
+    assert len(replayed) == 1
+    assert count_pending(database_url, user_id) == 1
+
+
+def test_parallel_verification_without_key_leaves_one_pending(verification, database_url, context):
+    # Без ключа дубль отсекает уникальный индекс заявок на рассмотрении
+    user_id = create_user(database_url)
+    responses = post_in_parallel(verification, context, [(verification_body(user_id), None)] * 2)
+
+    assert sorted(response['statusCode'] for response in responses) == [201, 400]
+    conflict = next(response for response in responses if response['statusCode'] == 400)
+    assert json.loads(conflict['body']) == {'error': 'Pending request already exists'}
+    assert count_pending(database_url, user_id) == 1
@@ -0,0 +1,86 @@
+"""
+Инструментация обработчиков: INSTRUMENTATION=1 отдаёт Server-Timing и пишет лог запроса
+с числом строк ответа, а выборочный EXPLAIN медленных запросов не ломает транзакцию.
+"""
+import json
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+@pytest.mark.parametrize('name, params, items', [
+    ('products', {'limit': '5'}, 'products'),
+    ('notifications', {'user_id': '1', 'limit': '3'}, 'notifications'),
+    ('verification', {'limit': '3'}, 'requests'),
+])
+def test_instrumented_handler_reports_timing_and_rows(load_function, database_url, context, capsys,
+                                                      name, params, items):
+    module = load_function(name, DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1', INSTRUMENTATION='1')
+    response = module.handler(make_event('GET', params), context)
+    assert response['statusCode'] == 200
+
+    phases = dict(part.split(';dur=') for part in response['headers']['Server-Timing'].split(', '))
+    assert {'connect', 'query', 'total'} <= set(phases)
+    assert all(float(value) >= 0 for value in phases.values())
+
+    logs = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    request_log = next(entry for entry in logs if entry['event'] == 'request')
+    assert request_log['function'] == name
+    assert request_log['request_id'] == context.request_id
+    assert request_log['status'] == 200
+    assert request_log['bytes'] == len(response['body'].encode('utf-8'))
+    assert request_log['rows'] == len(json.loads(response['body'])[items])
+    assert set(request_log['phases_ms']) == set(phases) - {'total'}
+
+
+def test_page_query_is_timed_outside_serialize(load_function, database_url, context, monkeypatch):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1', INSTRUMENTATION='1')
+    build_feed_query = products.build_feed_query
+
+    def slow_feed_query(params):
+        query, args, limit = build_feed_query(params)
+        return f'SELECT * FROM ({query}) page, pg_sleep(0.05)', args, limit
+
+    monkeypatch.setattr(products, 'build_feed_query', slow_feed_query)
+    response = products.handler(make_event('GET', {'limit': '5'}), context)
+    assert response['statusCode'] == 200
+    phases = dict(part.split(';dur=') for part in response['headers']['Server-Timing'].split(', '))
+    assert float(phases['query']) >= 50
+    assert float(phases['serialize']) < 50
+
+
+@pytest.mark.parametrize('name, params', [
+    ('products', {'limit': '5'}),
+    ('notifications', {'user_id': '1', 'limit': '3'}),
+    ('verification', {'limit': '3'}),
+])
+def test_sampled_explain_does_not_break_request(load_function, database_url, context, capsys, name, params):
+    # Каждый запрос «медленный» и получает EXPLAIN, включая PREPARE на новом соединении
+    module = load_function(name, DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1', INSTRUMENTATION='1',
+                           SLOW_QUERY_MS='0', EXPLAIN_SAMPLE_RATE='1', PREPARED_STATEMENTS='1')
+    for _ in range(2):
+        assert module.handler(make_event('GET', params), context)['statusCode'] == 200
+
+    logs = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    slow = [entry for entry in logs if entry['event'] == 'slow_query']
+    assert any('plan' in entry for entry in slow)
+    assert not any(entry['query'].startswith('PREPARE') and 'plan' in entry for entry in slow)
+
+
+def test_sampled_explain_skips_import_temp_table(load_function, database_url, context):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1',
+                             SLOW_QUERY_MS='0', EXPLAIN_SAMPLE_RATE='1')
+    payload = 'title,price,category,description,location\nВелосипед детский,5000,Спорт,,Москва\n'
+    response = products.handler(make_event('POST', {'import': 'csv', 'seller_id': '1'}, payload), context)
+    assert response['statusCode'] == 200
+
+
+def test_failed_explain_keeps_transaction_usable(load_function, database_url, capsys):
+    products = load_function('products', DATABASE_URL=database_url, EXPLAIN_SAMPLE_RATE='1')
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute('SELECT 1')
+        # Планировщик сворачивает константы, поэтому EXPLAIN этого запроса падает с делением на ноль
+        products.log_slow_query(cur, 'SELECT 1 / 0', None, 1.0)
+        cur.execute('SELECT 2')
+        assert cur.fetchone() == (2,)
+    assert 'explain_error' in capsys.readouterr().out
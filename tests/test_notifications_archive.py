@@ -0,0 +1,129 @@
+"""
+Архив уведомлений: перенос порциями по возрасту и история archived=1 поверх горячей таблицы и архива.
+"""
+import json
+import uuid
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+# Строки теста старше любых других в тестовой базе, поэтому перенос не задевает чужие данные
+CUTOFF = '36500 days'
+
+
+@pytest.fixture
+def notifications(load_function, database_url):
+    return load_function('notifications', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+
+
+def create_history(database_url: str) -> tuple:
+    '''Пользователь и его уведомления от новых к старым: (user_id, {имя: id})'''
+    rows = [
+        ('fresh_unread', 1, False),
+        ('fresh_read', 5, True),
+        ('old_read_1', 36510, True),
+        ('old_unread', 36520, False),
+        ('old_read_2', 36530, True),
+        ('old_read_3', 36540, True),
+    ]
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO users (name) VALUES (%s) RETURNING id", (f'Archive test {uuid.uuid4().hex[:8]}',))
+        user_id = cur.fetchone()[0]
+        ids = {}
+        for name, age_days, is_read in rows:
+            cur.execute("""
+                INSERT INTO notifications (user_id, type, title, message, is_read, created_at)
+                VALUES (%s, 'system', %s, 'Archive test', %s, NOW() - %s * INTERVAL '1 day')
+                RETURNING id
+            """, (user_id, name, is_read, age_days))
+            ids[name] = cur.fetchone()[0]
+        conn.commit()
+    return user_id, ids
+
+
+def archive(database_url: str, batch_size: int = 2) -> int:
+    '''Гоняет archive_notifications порциями до пустой, как scripts/retention.py; возвращает число перенесённых'''
+    moved = 0
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        while True:
+            cur.execute('SELECT archive_notifications(%s, %s::interval)', (batch_size, CUTOFF))
+            batch = cur.fetchone()[0]
+            conn.commit()
+            moved += batch
+            if batch < batch_size:
+                return moved
+
+
+def table_ids(database_url: str, table: str, user_id: int) -> set:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute(f'SELECT id FROM {table} WHERE user_id = %s', (user_id,))
+        return {row[0] for row in cur.fetchall()}
+
+
+def get_page(notifications, context, **params) -> dict:
+    params = {key: str(value) for key, value in params.items()}
+    response = notifications.handler(make_event('GET', params), context)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])
+
+
+def page_ids(page: dict) -> list:
+    return [notification['id'] for notification in page['notifications']]
+
+
+def test_archive_moves_only_old_read_rows_and_is_idempotent(database_url):
+    user_id, ids = create_history(database_url)
+    assert archive(database_url) >= 3
+
+    archived = {ids['old_read_1'], ids['old_read_2'], ids['old_read_3']}
+    assert table_ids(database_url, 'notifications_archive', user_id) == archived
+    assert table_ids(database_url, 'notifications', user_id) == set(ids.values()) - archived
+
+    assert archive(database_url) == 0
+    assert table_ids(database_url, 'notifications_archive', user_id) == archived
+
+
+def test_archived_history_returns_moved_rows(notifications, database_url, context):
+    user_id, ids = create_history(database_url)
+    archive(database_url)
+
+    assert page_ids(get_page(notifications, context, user_id=user_id)) == [
+        ids['fresh_unread'], ids['fresh_read'], ids['old_unread']
+    ]
+    assert page_ids(get_page(notifications, context, user_id=user_id, archived=1)) == [
+        ids[name] for name in ('fresh_unread', 'fresh_read', 'old_read_1', 'old_unread', 'old_read_2', 'old_read_3')
+    ]
+
+
+def test_history_cursor_continues_after_rows_move_to_archive(notifications, database_url, context):
+    user_id, ids = create_history(database_url)
+    expected = [ids[name] for name in
+                ('fresh_unread', 'fresh_read', 'old_read_1', 'old_unread', 'old_read_2', 'old_read_3')]
+
+    # Первая страница целиком из горячей таблицы, курсор указывает на строку, которую затем перенесут
+    first = get_page(notifications, context, user_id=user_id, archived=1, limit=3)
+    assert page_ids(first) == expected[:3]
+    assert first['next_before'] == ids['old_read_1']
+
+    archive(database_url)
+
+    seen = page_ids(first)
+    before = first['next_before']
+    while before:
+        page = get_page(notifications, context, user_id=user_id, archived=1, limit=2, before=before)
+        seen.extend(page_ids(page))
+        before = page['next_before']
+    assert seen == expected
+
+
+def test_hot_cursor_moved_to_archive_still_pages_hot_table(notifications, database_url, context):
+    user_id, ids = create_history(database_url)
+    first = get_page(notifications, context, user_id=user_id, limit=3)
+    assert first['next_before'] == ids['old_read_1']
+
+    archive(database_url)
+
+    second = get_page(notifications, context, user_id=user_id, limit=3, before=first['next_before'])
+    assert page_ids(second) == [ids['old_unread']]
+    assert second['next_before'] is None
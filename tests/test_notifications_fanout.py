@@ -0,0 +1,126 @@
+"""
+Рассылка notifications по явному списку получателей.
+"""
+import json
+import uuid
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+
+@pytest.fixture
+def notifications(load_function, database_url):
+    return load_function('notifications', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+
+
+def count_titled(database_url: str, title: str) -> dict:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute('SELECT user_id, COUNT(*) FROM notifications WHERE title = %s GROUP BY user_id', (title,))
+        return dict(cur.fetchall())
+
+
+def broadcast(notifications, context, user_ids: list, title: str) -> dict:
+    return notifications.handler(make_event('POST', body={
+        'user_ids': user_ids, 'type': 'announcement', 'title': title, 'message': 'fan-out test'
+    }), context)
+
+
+def test_fanout_dedupes_and_skips_unknown_users(notifications, database_url, context):
+    title = f'Fan-out dedupe {uuid.uuid4().hex[:8]}'
+    response = broadcast(notifications, context, [1, 2, 2, 1, 999999], title)
+    assert response['statusCode'] == 201
+    assert json.loads(response['body'])['inserted'] == 2
+    assert count_titled(database_url, title) == {1: 1, 2: 1}
+
+
+def test_fanout_rejects_non_integer_ids(notifications, database_url, context):
+    for user_ids in (['1'], [1, True], [2147483648]):
+        assert broadcast(notifications, context, user_ids, 'Fan-out invalid')['statusCode'] == 400
+    assert count_titled(database_url, 'Fan-out invalid') == {}
+
+
+def test_fanout_commits_in_sorted_chunks(notifications, database_url, context, monkeypatch):
+    monkeypatch.setattr(notifications, 'FANOUT_CHUNK_SIZE', 2)
+    title = f'Fan-out chunks {uuid.uuid4().hex[:8]}'
+    response = broadcast(notifications, context, [5, 3, 1, 4, 2, 3, 999999], title)
+    assert json.loads(response['body'])['inserted'] == 5
+    assert count_titled(database_url, title) == {1: 1, 2: 1, 3: 1, 4: 1, 5: 1}
+
+
+class FailingCommits:
+    '''Соединение, у которого COMMIT после первых commits пачек обрывается, как при сбое посреди рассылки'''
+
+    def __init__(self, conn, commits: int):
+        self.conn = conn
+        self.commits = commits
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def commit(self):
+        if self.commits == 0:
+            self.conn.rollback()
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.commits -= 1
+        self.conn.commit()
+
+
+def test_retry_with_idempotency_key_resumes_partial_fanout(notifications, database_url, context, monkeypatch):
+    monkeypatch.setattr(notifications, 'FANOUT_CHUNK_SIZE', 2)
+    title, key = f'Fan-out resume {uuid.uuid4().hex[:8]}', uuid.uuid4().hex
+    notification = ('announcement', title, 'fan-out test')
+    batch = notifications.fanout_batch_id(key, notification)
+    with closing(psycopg2.connect(database_url)) as conn:
+        with pytest.raises(psycopg2.OperationalError):
+            notifications.fanout_to_users(FailingCommits(conn, 1), [1, 2, 3, 4, 5], notification, batch)
+    assert count_titled(database_url, title) == {1: 1, 2: 1}
+
+    response = notifications.handler(make_event('POST', body={
+        'user_ids': [1, 2, 3, 4, 5], 'type': 'announcement', 'title': title, 'message': 'fan-out test'
+    }, headers={'Idempotency-Key': key}), context)
+    assert response['statusCode'] == 201
+    body = json.loads(response['body'])
+    assert (body['inserted'], body['already_delivered']) == (3, 2)
+    assert count_titled(database_url, title) == {1: 1, 2: 1, 3: 1, 4: 1, 5: 1}
+
+
+def test_segment_retry_skips_delivered_without_stopping_early(notifications, database_url, context, monkeypatch):
+    category = f'Fan-out segment {uuid.uuid4().hex[:8]}'
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO products (title, price, category, location, seller_id)
+            SELECT 'Fan-out test', 1000, %s, 'Москва', id FROM users WHERE id IN (1, 2, 3)
+        """, (category,))
+        conn.commit()
+    monkeypatch.setattr(notifications, 'FANOUT_CHUNK_SIZE', 1)
+    title, key = f'Fan-out segment {uuid.uuid4().hex[:8]}', uuid.uuid4().hex
+
+    def send() -> dict:
+        response = notifications.handler(make_event('POST', body={
+            'segment': 'category_sellers', 'category': category,
+            'type': 'announcement', 'title': title, 'message': 'fan-out test'
+        }, headers={'Idempotency-Key': key}), context)
+        assert response['statusCode'] == 201
+        return json.loads(response['body'])
+
+    assert (send()['inserted'], send()['already_delivered']) == (3, 3)
+    assert count_titled(database_url, title) == {1: 1, 2: 1, 3: 1}
+
+
+@pytest.mark.parametrize('recipients', [
+    {'segment': 'category_sellers', 'category': ['Спорт']},
+    {'segment': 'category_sellers', 'category': {'name': 'Спорт'}},
+    {'segment': 'category_sellers', 'category': 7},
+    {'segment': 'category_sellers', 'category': '  '},
+    {'segment': 'category_sellers'},
+    {'segment': ['all']},
+    {'segment': 'everyone'},
+])
+def test_fanout_rejects_invalid_segment(notifications, database_url, context, recipients):
+    title = f'Fan-out segment invalid {uuid.uuid4().hex[:8]}'
+    response = notifications.handler(make_event('POST', body={
+        **recipients, 'type': 'announcement', 'title': title, 'message': 'fan-out test'
+    }), context)
+    assert response['statusCode'] == 400
+    assert count_titled(database_url, title) == {}
@@ -0,0 +1,225 @@
+"""
+Long-poll notifications и push-хаб fanout.py против локального Postgres.
+"""
+import asyncio
+import importlib.util
+import json
+import os
+import threading
+import time
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import BACKEND_DIR, make_event
+
+USER_ID = 2
+
+
+def execute(database_url: str, query: str, args=None):
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute(query, args)
+        result = cur.fetchone() if cur.description else None
+        conn.commit()
+        return result
+
+
+def last_notification_id(database_url: str) -> int:
+    return execute(database_url, 'SELECT COALESCE(MAX(id), 0) FROM notifications WHERE user_id = %s', (USER_ID,))[0]
+
+
+def notify_user(database_url: str, title: str) -> int:
+    return execute(database_url, """
+        INSERT INTO notifications (user_id, type, title, message)
+        VALUES (%s, 'test', %s, 'long-poll test') RETURNING id
+    """, (USER_ID, title))[0]
+
+
+def wait_until(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+class LongPoll(threading.Thread):
+    '''GET ?since=…&wait=… в отдельном потоке, как параллельный запрос к экземпляру функции'''
+
+    def __init__(self, notifications, context, since: int, wait: float):
+        super().__init__(daemon=True)
+        self.notifications = notifications
+        self.event = make_event('GET', {'user_id': str(USER_ID), 'since': str(since), 'wait': str(wait)})
+        self.context = context
+        self.response = None
+        self.elapsed = None
+
+    def run(self) -> None:
+        started = time.monotonic()
+        self.response = self.notifications.handler(self.event, self.context)
+        self.elapsed = time.monotonic() - started
+
+
+@pytest.fixture
+def notifications(load_function, database_url):
+    return load_function('notifications', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1',
+                         DB_POOL_WAIT_TIMEOUT='1')
+
+
+def test_long_poll_waits_without_holding_a_pooled_connection(notifications, database_url, context):
+    since = last_notification_id(database_url)
+    poll = LongPoll(notifications, context, since, wait=10)
+    poll.start()
+    time.sleep(0.3)
+
+    # Пул из одного соединения: обычный запрос проходит, пока long-poll ждёт
+    response = notifications.handler(make_event('GET', {'user_id': str(USER_ID), 'limit': '1'}), context)
+    assert response['statusCode'] == 200
+    assert poll.is_alive()
+
+    notification_id = notify_user(database_url, 'Long-poll')
+    poll.join(5)
+    assert poll.response['statusCode'] == 200
+    body = json.loads(poll.response['body'])
+    assert [n['id'] for n in body['notifications']] == [notification_id]
+    assert body['last_id'] == notification_id
+    assert poll.elapsed < 5
+
+
+def test_long_poll_times_out_empty(notifications, database_url, context):
+    poll = LongPoll(notifications, context, last_notification_id(database_url), wait=0.5)
+    poll.run()
+    assert poll.response['statusCode'] == 200
+    assert json.loads(poll.response['body'])['notifications'] == []
+    assert 0.5 <= poll.elapsed < 2
+
+
+def test_listener_reconnects_after_backend_termination(notifications, database_url, context):
+    notifications.LISTEN_RECONNECT_MIN = 0.1
+    poll = LongPoll(notifications, context, last_notification_id(database_url), wait=0.2)
+    poll.run()
+    listener = notifications.get_listener()
+    assert wait_until(lambda: listener._conn is not None)
+    old_pid = listener._conn.info.backend_pid
+
+    execute(database_url, 'SELECT pg_terminate_backend(%s)', (old_pid,))
+    assert wait_until(lambda: listener._conn is not None and listener._conn.info.backend_pid != old_pid)
+
+    poll = LongPoll(notifications, context, last_notification_id(database_url), wait=10)
+    poll.start()
+    time.sleep(0.3)
+    notification_id = notify_user(database_url, 'After reconnect')
+    poll.join(5)
+    assert [n['id'] for n in json.loads(poll.response['body'])['notifications']] == [notification_id]
+
+
+def load_fanout():
+    spec = importlib.util.spec_from_file_location('notifications_fanout',
+                                                  os.path.join(BACKEND_DIR, 'notifications', 'fanout.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_fanout_hub_resubscribes_after_backend_termination(database_url):
+    fanout = load_fanout()
+    fanout.RECONNECT_MIN_DELAY = 0.1
+
+    async def scenario():
+        hub = fanout.NotificationHub(database_url)
+        await hub.start()
+        try:
+            queue = hub.subscribe(str(USER_ID))
+            first_id = await asyncio.to_thread(notify_user, database_url, 'Before drop')
+            assert await asyncio.wait_for(queue.get(), 5) == first_id
+
+            old_pid = hub._conn.info.backend_pid
+            await asyncio.to_thread(execute, database_url, 'SELECT pg_terminate_backend(%s)', (old_pid,))
+            # После переподключения подписчик получает сигнал перечитать уведомления
+            assert await asyncio.wait_for(queue.get(), 5) is None
+            assert hub._conn.info.backend_pid != old_pid
+
+            second_id = await asyncio.to_thread(notify_user, database_url, 'After drop')
+            assert await asyncio.wait_for(queue.get(), 5) == second_id
+        finally:
+            hub.close()
+
+    asyncio.run(scenario())
+
+
+def test_parallel_first_long_polls_share_one_listener(load_function, monkeypatch):
+    notifications = load_function('notifications')
+    created = []
+
+    class SlowListener:
+        def __init__(self, dsn):
+            time.sleep(0.1)
+            created.append(self)
+
+    monkeypatch.setattr(notifications, 'NotificationListener', SlowListener)
+    listeners = []
+    threads = [threading.Thread(target=lambda: listeners.append(notifications.get_listener())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(listener is created[0] for listener in listeners)
+
+
+class FakeHub:
+    def __init__(self):
+        self.subscribed = []
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        self.subscribed.append(user_id)
+        queue = asyncio.Queue()
+        queue.put_nowait(None)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue) -> None:
+        pass
+
+
+class FakeWriter:
+    '''Собирает ответ и обрывает соединение на втором drain, как ушедший клиент'''
+
+    def __init__(self):
+        self.data = b''
+        self.drains = 0
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    async def drain(self) -> None:
+        self.drains += 1
+        if self.drains > 1:
+            raise ConnectionResetError()
+
+    def close(self) -> None:
+        pass
+
+
+def serve_request(fanout, hub, user_id: str) -> bytes:
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(f'GET /?user_id={user_id} HTTP/1.1\r\nHost: test\r\n\r\n'.encode())
+        writer = FakeWriter()
+        await fanout.handle_client(hub, reader, writer)
+        return writer.data
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('user_id', ['%C2%B2', 'abc', '-1', ''])
+def test_fanout_rejects_non_decimal_user_id(user_id):
+    hub = FakeHub()
+    assert serve_request(load_fanout(), hub, user_id).startswith(b'HTTP/1.1 400')
+    assert hub.subscribed == []
+
+
+def test_fanout_subscribes_under_canonical_user_id():
+    hub = FakeHub()
+    response = serve_request(load_fanout(), hub, '007')
+    assert hub.subscribed == ['7']
+    assert b'event: resync\ndata: {"user_id": 7}' in response
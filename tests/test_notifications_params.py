@@ -0,0 +1,67 @@
+"""
+Notifications GET/PUT: нечисловые параметры дают 400, а не 500; отметка прочитанными.
+"""
+import json
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+
+@pytest.fixture
+def notifications(load_function, database_url):
+    return load_function('notifications', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+
+
+@pytest.mark.parametrize('params', [
+    {'user_id': 'abc'},
+    {'user_id': '1', 'limit': 'ten'},
+    {'user_id': '1', 'before': '12x'},
+    {'user_id': '1', 'since': 'latest'},
+    {'user_id': '1', 'since': '0', 'wait': 'long'},
+    {'user_id': '1', 'since': '99999999999'},
+])
+def test_get_rejects_non_numeric_params(notifications, context, params):
+    response = notifications.handler(make_event('GET', params), context)
+    assert response['statusCode'] == 400
+
+
+def test_get_accepts_numeric_params(notifications, context):
+    response = notifications.handler(make_event('GET', {'user_id': '1', 'limit': '5', 'before': '999999'}), context)
+    assert response['statusCode'] == 200
+
+
+@pytest.mark.parametrize('body', [
+    {'notification_ids': ['1']},
+    {'notification_ids': 'all'},
+    {'notification_ids': [1, None]},
+    {'notification_ids': [True]},
+    {'notification_ids': [2147483648]},
+    {'notification_id': 'x'},
+    {'notification_ids': [1], 'user_id': 'me'},
+])
+def test_put_rejects_invalid_ids(notifications, context, body):
+    response = notifications.handler(make_event('PUT', body=body), context)
+    assert response['statusCode'] == 400
+
+
+def test_put_marks_by_ids(notifications, context):
+    response = notifications.handler(make_event('PUT', body={'notification_ids': [1, 2], 'user_id': 1}), context)
+    assert response['statusCode'] == 200
+
+
+def test_put_marks_all_for_user(notifications, database_url, context):
+    # Отдельный пользователь: отметка всех не трогает уведомления других тестов
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO users (name) VALUES ('Mark all test') RETURNING id")
+        user_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO notifications (user_id, type, title, message)
+            SELECT %s, 'system', 'Mark all', 'test' FROM generate_series(1, 2)
+        """, (user_id,))
+        conn.commit()
+
+    response = notifications.handler(make_event('PUT', body={'user_id': user_id, 'all': True}), context)
+    assert json.loads(response['body']) == {'success': True, 'updated': 2}
+    response = notifications.handler(make_event('GET', {'user_id': str(user_id)}), context)
+    assert json.loads(response['body'])['unread_count'] == 0
@@ -0,0 +1,28 @@
+"""
+execute_prepared: подготовленные запросы привязаны к самому соединению пула.
+"""
+from contextlib import closing
+import psycopg2
+import pytest
+
+QUERY = 'SELECT %s::int + 1'
+
+
+@pytest.fixture
+def products(load_function, database_url):
+    return load_function('products', DATABASE_URL=database_url, PREPARED_STATEMENTS='1')
+
+
+def run(products, conn, value: int) -> int:
+    with conn.cursor() as cur:
+        products.execute_prepared(cur, 'plus_one', QUERY, (value,))
+        return cur.fetchone()[0]
+
+
+def test_new_connection_prepares_again(products, database_url):
+    # Новое соединение может получить тот же id() объекта, что и закрытое, но не его PREPARE
+    for value in range(5):
+        with closing(psycopg2.connect(database_url, connection_factory=products.PooledConnection)) as conn:
+            assert run(products, conn, value) == value + 1
+            assert run(products, conn, value) == value + 1
+            assert conn.prepared == {'plus_one'}
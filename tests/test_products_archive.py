@@ -0,0 +1,50 @@
+"""
+Архив объявлений: archive_products переносит порциями только объявления старше порога.
+"""
+from contextlib import closing
+import psycopg2
+
+# Объявления теста старше любых других в тестовой базе, поэтому перенос не задевает чужие данные
+CUTOFF = '36500 days'
+
+
+def create_products(database_url: str, ages_days: list) -> list:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        ids = []
+        for age_days in ages_days:
+            cur.execute("""
+                INSERT INTO products (title, price, category, location, seller_id, posted_at)
+                VALUES ('Archive test', 1000, 'Archive test', 'Москва', 1, NOW() - %s * INTERVAL '1 day')
+                RETURNING id
+            """, (age_days,))
+            ids.append(cur.fetchone()[0])
+        conn.commit()
+    return ids
+
+
+def archive_batch(database_url: str, batch_size: int) -> int:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute('SELECT archive_products(%s, %s::interval)', (batch_size, CUTOFF))
+        moved = cur.fetchone()[0]
+        conn.commit()
+    return moved
+
+
+def ids_in(database_url: str, table: str, ids: list) -> set:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute(f'SELECT id FROM {table} WHERE id = ANY(%s)', (ids,))
+        return {row[0] for row in cur.fetchall()}
+
+
+def test_archive_moves_only_expired_listings_in_batches(database_url):
+    expired = create_products(database_url, [36510, 36520, 36530])
+    live = create_products(database_url, [36490, 0])
+
+    # Порция ограничена batch_size; повторные вызовы добирают остаток и затем ничего не делают
+    assert archive_batch(database_url, 2) == 2
+    while archive_batch(database_url, 2):
+        pass
+    assert archive_batch(database_url, 2) == 0
+
+    assert ids_in(database_url, 'products_archive', expired + live) == set(expired)
+    assert ids_in(database_url, 'products', expired + live) == set(live)
@@ -0,0 +1,126 @@
+"""
+Кэш страниц ленты products: LRU в памяти, Redis-бэкенд и смена версии при записи.
+"""
+import json
+import sys
+import types
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+
+class FakeRedis:
+    '''Локальная замена клиенту redis: хранит байты и TTL, переданный в setex'''
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    @classmethod
+    def from_url(cls, url):
+        client = cls()
+        client.url = url
+        return client
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        assert isinstance(value, bytes)
+        self.data[key] = value
+        self.ttls[key] = ttl
+
+
+@pytest.fixture
+def products(load_function):
+    return load_function('products', INSTRUMENTATION='0')
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'redis', types.SimpleNamespace(Redis=FakeRedis))
+
+
+def test_lru_evicts_least_recently_used(products):
+    cache = products.LRUCache(max_size=2, ttl=60)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    assert cache.get('a') == '1'
+    cache.set('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.get('c') == '3'
+
+
+def test_lru_expires_by_ttl(products, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(products.time, 'monotonic', lambda: now[0])
+    cache = products.LRUCache(max_size=10, ttl=30)
+    cache.set('a', '1')
+    now[0] += 29
+    assert cache.get('a') == '1'
+    now[0] += 2
+    assert cache.get('a') is None
+    assert 'a' not in cache._data
+
+
+def test_redis_cache_round_trip(products, fake_redis):
+    cache = products.RedisCache('redis://localhost:6379/0', ttl=30)
+    assert cache.get('missing') is None
+    cache.set('key', '{"products": ["велосипед"]}')
+    assert cache.get('key') == '{"products": ["велосипед"]}'
+    assert cache._client.ttls['key'] == 30
+
+
+def test_feed_cache_backend_selection(load_function, fake_redis):
+    products = load_function('products', REDIS_URL='redis://localhost:6379/0')
+    assert isinstance(products.get_feed_cache(), products.RedisCache)
+    assert products.get_feed_cache() is products.get_feed_cache()
+
+    products = load_function('products', REDIS_URL='')
+    assert isinstance(products.get_feed_cache(), products.LRUCache)
+
+
+def test_feed_cache_key_is_normalized_and_versioned(products):
+    # Одинаковые запросы делят ключ независимо от порядка, типа и пустых параметров
+    key = products.feed_cache_key({'limit': '10', 'category': 'Авто', 'q': ''}, 3)
+    assert key == products.feed_cache_key({'category': 'Авто', 'limit': 10}, 3)
+    assert key != products.feed_cache_key({'category': 'Авто', 'limit': '10'}, 4)
+    # Значение с пробелами фильтрует иначе, поэтому его пустая выдача не должна попасть под ключ «Авто»
+    assert key != products.feed_cache_key({'category': 'Авто ', 'limit': '10'}, 3)
+
+
+def test_padded_filter_does_not_poison_cached_page(load_function, database_url, context):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+    padded = products.handler(make_event('GET', {'category': 'Спорт ', 'limit': '5'}), context)
+    assert json.loads(padded['body'])['products'] == []
+
+    exact = products.handler(make_event('GET', {'category': 'Спорт', 'limit': '5'}), context)
+    assert json.loads(exact['body'])['products']
+
+
+def test_product_write_bumps_feed_version(load_function, database_url, context):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+
+    def feed_version():
+        with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+            cur.execute("SELECT version FROM cache_versions WHERE name = 'products_feed'")
+            return cur.fetchone()[0]
+
+    page = make_event('GET', {'limit': '5'})
+    before = products.handler(page, context)
+    assert before['statusCode'] == 200
+    assert products.handler(page, context)['headers']['ETag'] == before['headers']['ETag']
+
+    version = feed_version()
+    created = products.handler(make_event('POST', body={
+        'title': 'Тестовый товар кэша', 'price': 100, 'category': 'Спорт', 'location': 'Москва'
+    }), context)
+    assert created['statusCode'] == 201
+    assert feed_version() == version + 1
+
+    after = products.handler(page, context)
+    assert after['statusCode'] == 200
+    assert 'Тестовый товар кэша' in after['body']
+    assert after['headers']['ETag'] != before['headers']['ETag']
@@ -0,0 +1,53 @@
+"""
+Фасеты products: цены не по границам корзин считаются по product_facets с дочитыванием краёв и совпадают с живой агрегацией.
+"""
+import uuid
+from contextlib import closing
+import psycopg2
+import pytest
+
+PRICES = [0, 499, 500, 999, 1234, 1999, 2000, 19999, 20000, 20001, 499999, 500000, 750000]
+
+
+@pytest.fixture
+def products(load_function, database_url):
+    return load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+
+
+@pytest.fixture
+def category(database_url):
+    category = f'Facets {uuid.uuid4().hex[:8]}'
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO products (title, price, category, location, seller_id, verified_seller)
+            SELECT 'Facets test ' || g, price, %s, 'Москва', 1, g %% 3 = 0
+            FROM unnest(%s::int[]) WITH ORDINALITY AS t(price, g)
+        """, (category, PRICES))
+        conn.commit()
+    return category
+
+
+def facets(products, database_url, params: dict, live: bool) -> dict:
+    query, args = products.build_facets_query(params, live=live)
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute(query, args)
+        return products.map_facet_rows(cur.fetchall())
+
+
+@pytest.mark.parametrize('min_price, max_price', [
+    (None, None), ('500', None), ('1234', None), (None, '19999'), (None, '20000'),
+    ('1234', '1500'), ('1000', '20000'), ('1234', '600000'), ('600000', None), ('0', '0'),
+])
+def test_unaligned_prices_match_live_aggregation(products, database_url, category, min_price, max_price):
+    params = {'category': category}
+    if min_price is not None:
+        params['min_price'] = min_price
+    if max_price is not None:
+        params['max_price'] = max_price
+    assert facets(products, database_url, params, live=False) == facets(products, database_url, params, live=True)
+
+
+def test_unaligned_prices_read_edges_from_products(products, category):
+    query, args = products.build_facets_query({'category': category, 'min_price': '1234', 'max_price': '600000'})
+    assert 'FROM product_facets p' in query
+    assert query.count('FROM products p') == 2
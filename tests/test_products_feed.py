@@ -0,0 +1,41 @@
+"""
+Фильтры ленты products, которые каталог передаёт в API вместо фильтрации первой страницы на клиенте.
+"""
+import json
+import uuid
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+
+@pytest.fixture
+def products(load_function, database_url):
+    return load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+
+
+def test_feed_filters_verified_sellers_across_pages(products, database_url, context):
+    category = f'Feed {uuid.uuid4().hex[:8]}'
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO products (title, price, category, location, seller_id, verified_seller)
+            SELECT 'Feed test ' || g, 1000, %s, 'Москва', 1, g %% 2 = 0
+            FROM generate_series(1, 6) g
+            RETURNING id, verified_seller
+        """, (category,))
+        verified_ids = {product_id for product_id, verified in cur.fetchall() if verified}
+        conn.commit()
+
+    params = {'category': category, 'verified': '1', 'limit': '2'}
+    found = []
+    while True:
+        response = products.handler(make_event('GET', params), context)
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        found.extend(body['products'])
+        if not body['next_cursor']:
+            break
+        params = dict(params, cursor=body['next_cursor'])
+
+    assert {product['id'] for product in found} == verified_ids
+    assert all(product['verified'] for product in found)
@@ -0,0 +1,132 @@
+"""
+Массовый импорт products: проверка строк и ответы на неверный запрос.
+"""
+import json
+import subprocess
+import sys
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import BACKEND_DIR, make_event
+
+CSV_HEADER = 'title,price,category,description,location\n'
+
+
+@pytest.fixture
+def products(load_function):
+    return load_function('products')
+
+
+def test_cold_start_does_not_import_csv_or_extras():
+    # Импорт нужен только POST ?import= и записи просмотров, поэтому холодный старт его не платит
+    code = (f"import importlib.util, sys; "
+            f"spec = importlib.util.spec_from_file_location('products', '{BACKEND_DIR}/products/index.py'); "
+            f"spec.loader.exec_module(importlib.util.module_from_spec(spec)); "
+            f"print(sorted(m for m in ('csv', 'psycopg2.extras') if m in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == '[]'
+
+
+@pytest.mark.parametrize('price', ['0', '-5', 'abc', '', '2147483648', '99999999999999999999'])
+def test_validate_rejects_bad_price(products, price):
+    row = {'title': 'Велосипед', 'price': price, 'category': 'Спорт', 'location': 'Москва'}
+    with pytest.raises(ValueError, match='Invalid price'):
+        products.validate_import_row(row)
+
+
+def test_validate_accepts_int4_max(products):
+    row = {'title': 'Велосипед', 'price': '2147483647', 'category': 'Спорт', 'location': 'Москва'}
+    assert products.validate_import_row(row)[1] == 2147483647
+
+
+@pytest.mark.parametrize('price', [True, 5.9, 5000.0, None, [5000], {'value': 5000}])
+def test_validate_rejects_non_integer_json_price(products, price):
+    row = {'title': 'Велосипед', 'price': price, 'category': 'Спорт', 'location': 'Москва'}
+    with pytest.raises(ValueError, match='Invalid price'):
+        products.validate_import_row(row)
+
+
+@pytest.mark.parametrize('field, value', [
+    ('title', {'a': 1}), ('category', ['Спорт']), ('location', 77), ('description', {'a': 1}),
+])
+def test_validate_rejects_non_string_fields(products, field, value):
+    row = {'title': 'Велосипед', 'price': 5000, 'category': 'Спорт', 'location': 'Москва', field: value}
+    with pytest.raises(ValueError, match=f'Invalid {field}'):
+        products.validate_import_row(row)
+
+
+@pytest.mark.parametrize('seller_id', ['²', '-1', '0', '2147483648', 'abc', ''])
+def test_import_rejects_invalid_seller_id(load_function, database_url, context, seller_id):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+    payload = CSV_HEADER + 'Велосипед детский,5000,Спорт,,Москва\n'
+    response = products.handler(make_event('POST', {'import': 'csv', 'seller_id': seller_id}, payload), context)
+    assert response['statusCode'] == 400
+
+
+def test_import_skips_bad_rows(load_function, database_url, context):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+    payload = (CSV_HEADER
+               + 'Велосипед детский,5000,Спорт,,Москва\n'
+               + 'Слишком дорогой товар,3000000000,Спорт,,Москва\n'
+               + 'Без цены,,Спорт,,Москва\n')
+    response = products.handler(make_event('POST', {'import': 'csv', 'seller_id': '1'}, payload), context)
+    assert response['statusCode'] == 200
+    assert response['body'] == ('{"imported": 1, "failed": 2, "errors": ['
+                                '{"row": 3, "error": "Invalid price"}, {"row": 4, "error": "Invalid price"}]}')
+
+
+def test_import_skips_oversized_csv_field(load_function, database_url, context):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+    payload = (CSV_HEADER
+               + 'Велосипед детский,5000,Спорт,' + 'x' * 131073 + ',Москва\n'
+               + 'Велосипед взрослый,7000,Спорт,,Москва\n')
+    response = products.handler(make_event('POST', {'import': 'csv', 'seller_id': '1'}, payload), context)
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert (body['imported'], body['failed']) == (1, 1)
+    assert body['errors'][0]['row'] == 2
+    assert body['errors'][0]['error'].startswith('Invalid CSV')
+
+
+@pytest.mark.parametrize('fmt, payload', [
+    ('csv', CSV_HEADER + 'Велосипед\x00детский,5000,Спорт,,Москва\nВелосипед взрослый,7000,Спорт,,Москва\n'),
+    ('ndjson', json.dumps({'title': 'Велосипед', 'price': 5000, 'category': 'Спорт', 'location': 'Москва',
+                           'description': 'с\x00корзиной'}) + '\n'
+               + json.dumps({'title': 'Велосипед взрослый', 'price': 7000, 'category': 'Спорт',
+                             'location': 'Москва'}) + '\n'),
+])
+def test_import_rejects_nul_characters(load_function, database_url, context, fmt, payload):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+    response = products.handler(make_event('POST', {'import': fmt, 'seller_id': '1'}, payload), context)
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {
+        'imported': 1, 'failed': 1, 'errors': [{'row': 2 if fmt == 'csv' else 1, 'error': 'NUL character in field'}]
+    }
+
+
+def test_import_for_unknown_seller_is_404(load_function, database_url, context):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+    payload = CSV_HEADER + 'Велосипед детский,5000,Спорт,,Москва\n'
+    response = products.handler(make_event('POST', {'import': 'csv', 'seller_id': '999999'}, payload), context)
+    assert response['statusCode'] == 404
+
+
+def listings_count(database_url: str, refresh: bool = False) -> int:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        if refresh:
+            cur.execute('SELECT refresh_seller_stats(ARRAY[1])')
+        cur.execute('SELECT listings_count FROM seller_stats WHERE seller_id = 1')
+        count = cur.fetchone()[0]
+        conn.commit()
+        return count
+
+
+def test_import_adds_listings_without_full_recount(load_function, database_url, context):
+    products = load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+    before = listings_count(database_url, refresh=True)
+    payload = CSV_HEADER + 'Велосипед детский,5000,Спорт,,Москва\n' + 'Самокат,3000,Спорт,,Москва\n'
+    response = products.handler(make_event('POST', {'import': 'csv', 'seller_id': '1'}, payload), context)
+    assert response['statusCode'] == 200
+    assert listings_count(database_url) == before + 2
+    # Плановый пересчёт даёт то же число
+    assert listings_count(database_url, refresh=True) == before + 2
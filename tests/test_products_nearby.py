@@ -0,0 +1,70 @@
+"""
+Лента «рядом»: от ближнего города к дальнему, keyset-пагинация по (расстояние, posted_at, id).
+"""
+import json
+import uuid
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+MOSCOW = {'lat': '55.7558', 'lon': '37.6173'}
+
+
+@pytest.fixture
+def products(load_function, database_url):
+    return load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1')
+
+
+def create_products(products, database_url: str, category: str, cities: list) -> list:
+    '''По объявлению на город; чем дальше в списке, тем новее. Возвращает id в порядке cities'''
+    ids = []
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        for age, city in enumerate(reversed(cities)):
+            _, lat, lon = products.geocode_location(city)
+            cur.execute("""
+                INSERT INTO products (title, price, category, location, seller_id, city, lat, lon, posted_at)
+                VALUES ('Nearby test', 1000, %s, %s, 1, %s, %s, %s, NOW() - %s * INTERVAL '1 hour')
+                RETURNING id
+            """, (category, city, city, lat, lon, age))
+            ids.append(cur.fetchone()[0])
+        conn.commit()
+    return ids[::-1]
+
+
+def feed_pages(products, context, params: dict) -> list:
+    pages = []
+    while True:
+        response = products.handler(make_event('GET', params), context)
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        pages.append(body['products'])
+        if not body['next_cursor']:
+            return pages
+        params = dict(params, cursor=body['next_cursor'])
+
+
+def test_nearby_feed_orders_by_distance_across_pages(products, database_url, context):
+    category = f'Nearby {uuid.uuid4().hex[:8]}'
+    # Тверь дальше Мытищ, Мытищи дальше Москвы; дважды Москва — порядок внутри города по свежести
+    cities = ['Тверь', 'Москва', 'Мытищи', 'Москва']
+    ids = create_products(products, database_url, category, cities)
+
+    pages = feed_pages(products, context, dict(MOSCOW, radius_km='200', category=category, limit='1'))
+    found = [product for page in pages for product in page]
+    assert [p['city'] for p in found] == ['Москва', 'Москва', 'Мытищи', 'Тверь']
+    assert [p['id'] for p in found] == [ids[3], ids[1], ids[2], ids[0]]
+    distances = [p['distance_km'] for p in found]
+    assert distances == sorted(distances)
+
+
+def test_nearby_feed_respects_radius(products, database_url, context):
+    category = f'Nearby {uuid.uuid4().hex[:8]}'
+    create_products(products, database_url, category, ['Тверь', 'Москва'])
+    pages = feed_pages(products, context, dict(MOSCOW, radius_km='50', category=category))
+    assert [p['city'] for page in pages for p in page] == ['Москва']
+
+
+def test_nearby_feed_rejects_foreign_cursor(products, context):
+    response = products.handler(make_event('GET', dict(MOSCOW, cursor='bm90LWEtY3Vyc29y')), context)
+    assert response['statusCode'] == 400
@@ -0,0 +1,48 @@
+"""
+Поиск products (q=...): ограниченный набор кандидатов, старые редкие объявления и опечатки через словарь search_words.
+"""
+import json
+import uuid
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+
+@pytest.fixture
+def products(load_function, database_url):
+    # Окно свежих объявлений в одну строку: остальные совпадения находит только путь по GIN
+    return load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='1', SEARCH_WINDOW='1')
+
+
+def create_product(database_url: str, title: str, age_days: int = 0) -> int:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO products (title, price, category, location, seller_id, posted_at)
+            VALUES (%s, 1000, 'Search test', 'Москва', 1, NOW() - %s * INTERVAL '1 day')
+            RETURNING id
+        """, (title, age_days))
+        product_id = cur.fetchone()[0]
+        cur.execute('SELECT refresh_search_words()')
+        conn.commit()
+    return product_id
+
+
+def search(products, context, q: str) -> list:
+    response = products.handler(make_event('GET', {'q': q}), context)
+    assert response['statusCode'] == 200
+    return [product['id'] for product in json.loads(response['body'])['products']]
+
+
+def test_search_finds_old_listing_outside_recent_window(products, database_url, context):
+    word = f'kayak{uuid.uuid4().hex[:8]}'
+    old_id = create_product(database_url, f'Kayak {word}', age_days=3650)
+    new_id = create_product(database_url, f'Kayak {word}')
+    assert set(search(products, context, word)) == {old_id, new_id}
+
+
+def test_search_corrects_typo_from_dictionary(products, database_url, context):
+    word = f'kayak{uuid.uuid4().hex[:8]}'
+    product_id = create_product(database_url, f'Kayak {word}')
+    typo = word[:4] + word[5:]
+    assert product_id in search(products, context, typo)
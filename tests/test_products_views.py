@@ -0,0 +1,92 @@
+"""
+Буфер просмотров products: запись по таймеру на простаивающем экземпляре и сбои записи.
+"""
+import threading
+import time
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+PRODUCT_ID = 1
+
+
+@pytest.fixture
+def products(load_function, database_url):
+    return load_function('products', DATABASE_URL=database_url, DB_POOL_MAX_SIZE='2',
+                         VIEW_FLUSH_SIZE='1000', VIEW_FLUSH_INTERVAL='0.3')
+
+
+def product_views(database_url) -> int:
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute('SELECT views FROM products WHERE id = %s', (PRODUCT_ID,))
+        return cur.fetchone()[0]
+
+
+def wait_for_views(database_url, expected: int, timeout: float = 3.0) -> int:
+    deadline = time.monotonic() + timeout
+    views = product_views(database_url)
+    while views != expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+        views = product_views(database_url)
+    return views
+
+
+def view_event() -> dict:
+    return make_event('PUT', body={'action': 'view', 'product_id': PRODUCT_ID})
+
+
+def test_idle_instance_flushes_by_timer(products, database_url, context):
+    views = product_views(database_url)
+    for _ in range(3):
+        assert products.handler(view_event(), context)['statusCode'] == 202
+    assert product_views(database_url) == views
+
+    # Новых запросов нет: буфер записывает таймер
+    assert wait_for_views(database_url, views + 3) == views + 3
+    assert products._pending_views == {}
+
+
+def test_flush_failure_is_logged_and_retried(products, database_url, context, monkeypatch, capsys):
+    def failing_write_views(*args, **kwargs):
+        raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    views = product_views(database_url)
+    monkeypatch.setattr(products, 'VIEW_FLUSH_SIZE', 1)
+    monkeypatch.setattr(products, 'write_views', failing_write_views)
+
+    response = products.handler(view_event(), context)
+    assert response['statusCode'] == 202
+    assert 'view_flush_failed' in capsys.readouterr().out
+    assert products._pending_views == {PRODUCT_ID: 1}
+
+    monkeypatch.undo()
+    assert wait_for_views(database_url, views + 1) == views + 1
+
+
+def test_view_during_timer_flush_is_not_stranded(products, database_url, context, monkeypatch):
+    writing = threading.Event()
+    write_views = products.write_views
+
+    def slow_write_views(*args, **kwargs):
+        writing.set()
+        time.sleep(0.5)
+        write_views(*args, **kwargs)
+
+    views = product_views(database_url)
+    monkeypatch.setattr(products, 'write_views', slow_write_views)
+    assert products.handler(view_event(), context)['statusCode'] == 202
+
+    # Просмотр приходит, пока таймер ещё пишет предыдущий буфер в базу
+    assert writing.wait(3.0)
+    assert products.handler(view_event(), context)['statusCode'] == 202
+
+    assert wait_for_views(database_url, views + 2) == views + 2
+    assert products._pending_views == {}
+
+
+@pytest.mark.parametrize('product_id', [True, False, 0, -1, 2147483648, '1', None])
+def test_view_rejects_invalid_product_id(products, context, product_id):
+    response = products.handler(make_event('PUT', body={'action': 'view', 'product_id': product_id}), context)
+    assert response['statusCode'] == 400
+    assert products._pending_views == {}
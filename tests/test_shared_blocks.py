@@ -0,0 +1,63 @@
+"""
+Общие блоки функций: копии в index.py каждой функции совпадают и лежат в размеченной области.
+"""
+import ast
+import os
+from functools import lru_cache
+import pytest
+from conftest import BACKEND_DIR
+
+FUNCTIONS = ('products', 'notifications', 'verification')
+
+REGION_BEGIN = '# ---- Общие блоки функций: начало ----'
+REGION_END = '# ---- Общие блоки функций: конец ----'
+
+# Функции деплоятся по отдельности, поэтому эти блоки скопированы в index.py всех функций, где нужны
+SHARED_BLOCKS = {
+    **dict.fromkeys((
+        'PooledConnection', 'BlockingConnectionPool', 'get_pool', 'get_connection', 'release_connection',
+        'execute_prepared', 'is_id', 'get_idempotency_key', 'RequestMetrics', 'TimedCursor', 'log_event',
+        'log_slow_query', 'measure', 'record_rows', 'internal_error',
+    ), FUNCTIONS),
+    # Idempotency-Key для POST и потоковая сериализация страниц нужны только products и verification
+    **dict.fromkeys((
+        'claim_idempotency_key', 'save_idempotent_response', 'dumps', 'fetch_rows', 'encode_json_array',
+    ), ('products', 'verification')),
+}
+
+
+@lru_cache(maxsize=None)
+def read_function(name: str) -> tuple:
+    '''(строки index.py, {имя: (первая строка с декораторами, последняя строка)}) функций и классов'''
+    with open(os.path.join(BACKEND_DIR, name, 'index.py')) as f:
+        source = f.read()
+    spans = {node.name: (min([node.lineno] + [decorator.lineno for decorator in node.decorator_list]),
+                         node.end_lineno)
+             for node in ast.parse(source).body if isinstance(node, (ast.FunctionDef, ast.ClassDef))}
+    return source.splitlines(), spans
+
+
+def block_source(name: str, block: str):
+    lines, spans = read_function(name)
+    if block not in spans:
+        return None
+    start, end = spans[block]
+    return '\n'.join(lines[start - 1:end])
+
+
+@pytest.mark.parametrize('block', SHARED_BLOCKS)
+def test_shared_blocks_are_identical(block):
+    functions = SHARED_BLOCKS[block]
+    copies = {name: block_source(name, block) for name in functions}
+    assert None not in copies.values(), f'{block} is missing in some functions'
+    assert len(set(copies.values())) == 1, f'{block} differs between {", ".join(functions)}'
+
+
+@pytest.mark.parametrize('name', FUNCTIONS)
+def test_shared_blocks_stay_in_region(name):
+    lines, spans = read_function(name)
+    assert lines.count(REGION_BEGIN) == 1 and lines.count(REGION_END) == 1
+    begin, end = lines.index(REGION_BEGIN) + 1, lines.index(REGION_END) + 1
+    inside = {block for block, (first, last) in spans.items() if begin < first and last < end}
+    expected = {block for block, functions in SHARED_BLOCKS.items() if name in functions}
+    assert inside == expected, 'only shared blocks belong between the region markers'
@@ -0,0 +1,182 @@
+"""
+Захват заявок верификации: модераторы не пересекаются, чужой захват блокирует разбор.
+"""
+import json
+import threading
+import uuid
+from contextlib import closing
+import psycopg2
+import pytest
+from conftest import make_event
+
+MODERATORS = 8
+REQUESTS = 60
+
+
+@pytest.fixture
+def verification(load_function, database_url):
+    return load_function('verification', DATABASE_URL=database_url, DB_POOL_MAX_SIZE=str(MODERATORS))
+
+
+def create_pending_requests(database_url: str, count: int) -> list:
+    '''Новые пользователи с заявками на рассмотрении; возвращает id заявок'''
+    marker = uuid.uuid4().hex[:8]
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute("""
+            WITH created_users AS (
+                INSERT INTO users (name) SELECT 'Claim test ' || %s || ' ' || g FROM generate_series(1, %s) g
+                RETURNING id
+            )
+            INSERT INTO verification_requests (user_id, phone, email, document_type, document_number, status)
+            SELECT id, '+7 900 000-00-00', 'claim@test.local', 'passport', '0000 000000', 'pending'
+            FROM created_users
+            RETURNING id
+        """, (marker, count))
+        request_ids = sorted(row[0] for row in cur.fetchall())
+        conn.commit()
+    return request_ids
+
+
+def put(verification, context, body: dict) -> tuple:
+    response = verification.handler(make_event('PUT', body=body), context)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def queue_ids(verification, context, **params) -> set:
+    '''Все id очереди, обходя страницы по next_cursor'''
+    ids = set()
+    params = {key: str(value) for key, value in params.items()}
+    params['limit'] = '100'
+    while True:
+        response = verification.handler(make_event('GET', params), context)
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        page = [request['id'] for request in body['requests']]
+        assert not ids & set(page)
+        ids.update(page)
+        if not body['next_cursor']:
+            return ids
+        params['cursor'] = body['next_cursor']
+
+
+def test_foreign_claim_blocks_review_and_hides_request(verification, database_url, context):
+    request_id = create_pending_requests(database_url, 1)[0]
+    # Захват напрямую в базе: через API модератор получил бы самые старые заявки, а не эту
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute('UPDATE verification_requests SET claimed_by = 9001, claimed_at = NOW() WHERE id = %s',
+                    (request_id,))
+        conn.commit()
+
+    assert request_id in queue_ids(verification, context, moderator_id=9001)
+    assert request_id not in queue_ids(verification, context, moderator_id=9002)
+    assert request_id not in queue_ids(verification, context, moderator_id=9002, order='priority')
+
+    status, body = put(verification, context, {'request_id': request_id, 'action': 'approve', 'moderator_id': 9002})
+    assert status == 409
+    assert body['error'] == 'Request claimed by another moderator'
+
+    status, body = put(verification, context, {'request_ids': [request_id], 'action': 'reject', 'moderator_id': 9002})
+    assert (status, body['reviewed']) == (200, 0)
+
+    status, _ = put(verification, context, {'request_id': request_id, 'action': 'approve', 'moderator_id': 9001})
+    assert status == 200
+
+
+@pytest.mark.parametrize('body', [
+    {'action': 'claim', 'moderator_id': 1, 'count': 'many'},
+    {'action': 'claim', 'moderator_id': 1, 'count': [5]},
+    {'action': 'claim', 'moderator_id': 'admin'},
+    {'action': 'approve', 'request_ids': [1], 'moderator_id': True},
+    {'action': 'claim', 'moderator_id': 99999999999},
+    {'action': 'claim', 'moderator_id': 0},
+    {'action': 'claim', 'moderator_id': -1},
+    {'action': 'approve', 'request_ids': [1], 'moderator_id': 99999999999},
+    {'action': 'approve', 'request_ids': [1], 'moderator_id': '²'},
+])
+def test_invalid_claim_input_is_400(verification, context, body):
+    assert put(verification, context, body)[0] == 400
+
+
+@pytest.mark.parametrize('moderator_id', ['99999999999', '-1', '0', '²'])
+def test_queue_with_invalid_moderator_id_is_400(verification, context, moderator_id):
+    response = verification.handler(make_event('GET', {'moderator_id': moderator_id}), context)
+    assert response['statusCode'] == 400
+
+
+@pytest.mark.parametrize('value, expected', [(None, None), ('', None), ('7', 7), (7, 7), (2147483647, 2147483647)])
+def test_parse_moderator_id_accepts_int4_ids(load_function, value, expected):
+    assert load_function('verification').parse_moderator_id(value) == expected
+
+
+@pytest.mark.parametrize('value', [99999999999, '2147483648', 0, -1, '-1', ' 1', 1.0, True, '²', 'admin'])
+def test_parse_moderator_id_rejects_out_of_range(load_function, value):
+    with pytest.raises(ValueError):
+        load_function('verification').parse_moderator_id(value)
+
+
+@pytest.mark.parametrize('body', [
+    {'action': 'approve', 'request_ids': [True]},
+    {'action': 'approve', 'request_ids': [1, True]},
+    {'action': 'approve', 'request_ids': [3000000000]},
+    {'action': 'reject', 'request_ids': ['1']},
+    {'action': 'approve', 'request_id': True},
+    {'action': 'approve', 'request_id': 3000000000},
+    {'action': 'approve', 'request_id': '1'},
+    {'action': 'approve', 'request_id': [1]},
+])
+def test_invalid_request_ids_are_400(verification, database_url, context, body):
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute('SELECT status FROM verification_requests WHERE id = 1')
+        before = cur.fetchone()
+    assert put(verification, context, body)[0] == 400
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute('SELECT status FROM verification_requests WHERE id = 1')
+        assert cur.fetchone() == before
+
+
+def test_priority_queue_pages_do_not_overlap(verification, database_url, context):
+    create_pending_requests(database_url, 5)
+    by_age = queue_ids(verification, context, moderator_id=1)
+    assert queue_ids(verification, context, moderator_id=1, order='priority') == by_age
+
+
+def test_concurrent_moderators_never_share_a_request(verification, database_url, context):
+    request_ids = set(create_pending_requests(database_url, REQUESTS))
+    claimed = {moderator_id: [] for moderator_id in range(1, MODERATORS + 1)}
+    errors = []
+
+    def moderate(moderator_id: int) -> None:
+        try:
+            while True:
+                status, body = put(verification, context,
+                                   {'action': 'claim', 'moderator_id': moderator_id, 'count': 3})
+                assert status == 200
+                batch = [request['id'] for request in body['requests']]
+                if not batch:
+                    return
+                claimed[moderator_id].extend(batch)
+                status, body = put(verification, context,
+                                   {'request_ids': batch, 'action': 'approve', 'moderator_id': moderator_id})
+                assert (status, body['reviewed']) == (200, len(batch))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=moderate, args=(moderator_id,)) for moderator_id in claimed]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    assert not errors
+
+    all_claimed = [request_id for batch in claimed.values() for request_id in batch]
+    assert len(all_claimed) == len(set(all_claimed))
+    assert request_ids <= set(all_claimed)
+    assert sum(1 for batch in claimed.values() if batch) > 1
+
+    with closing(psycopg2.connect(database_url)) as conn, conn.cursor() as cur:
+        cur.execute('SELECT id, status, reviewed_by FROM verification_requests WHERE id = ANY(%s)',
+                    (sorted(request_ids),))
+        reviewed_by = {moderator_id: set(batch) for moderator_id, batch in claimed.items()}
+        for request_id, status, moderator_id in cur.fetchall():
+            assert status == 'approved'
+            assert request_id in reviewed_by[moderator_id]